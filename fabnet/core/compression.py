@@ -0,0 +1,143 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.core.compression
+@author Konstantin Andrusenko
+@date July 22, 2013
+
+This module contains the implementation of FRI packets compression.
+Packet body (header and binary data) of FRI_COMPRESSED_IDENTIFIER packet
+is prefixed by codec flag byte: high 4 bits - codec ID, low 4 bits - codec level.
+Codec and level are selected for each packet by PacketCompressor:
+    - small packets are not compressed
+    - small sample of data is compressed by fast codec and packet is
+      not compressed if sample is not compressible (encrypted data blocks)
+    - packets with compressible control payloads (ranges tables, topology)
+      are compressed by strong codec, big binary chunks by fast codec
+"""
+import time
+import zlib
+import bz2
+
+from constants import FRI_COMPRESSION_MIN_SIZE, FRI_COMPRESSION_SAMPLE_SIZE, \
+                FRI_COMPRESSION_MAX_RATIO, FRI_COMPRESSION_STRONG_MAX_SIZE, \
+                FRI_COMPRESSION_STRONG_CODEC, FRI_COMPRESSION_FAST_CODEC, \
+                CC_ZLIB, CC_BZ2, CC_LZMA
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+CODEC_NAMES = {CC_ZLIB: 'zlib', CC_BZ2: 'bz2', CC_LZMA: 'lzma'}
+
+
+class CompressionException(Exception):
+    pass
+
+
+def _lzma_compress(data, level):
+    return lzma.compress(data, preset=level)
+
+def _bz2_compress(data, level):
+    return bz2.compress(data, max(level, 1))
+
+COMPRESSORS = {CC_ZLIB: zlib.compress, CC_BZ2: _bz2_compress}
+DECOMPRESSORS = {CC_ZLIB: zlib.decompress, CC_BZ2: bz2.decompress}
+if lzma:
+    COMPRESSORS[CC_LZMA] = _lzma_compress
+    DECOMPRESSORS[CC_LZMA] = lzma.decompress
+
+
+def codec_flag(codec, level):
+    return chr((codec << 4) | level)
+
+def codec_name(flag):
+    flag = ord(flag)
+    return '%s%s'%(CODEC_NAMES.get(flag >> 4, 'unknown'), flag & 0x0f)
+
+
+class PacketCompressor:
+    """Select codec for packet body, compress/decompress packet bodies
+    and collect per-codec statistic into StatMap object (if set)
+    """
+    def __init__(self, stat_map=None, strong_codec=FRI_COMPRESSION_STRONG_CODEC, \
+                    fast_codec=FRI_COMPRESSION_FAST_CODEC):
+        self.__stat_map = stat_map
+        self.__strong_codec = strong_codec
+        self.__fast_codec = fast_codec
+        for codec, level in (strong_codec, fast_codec):
+            if codec not in COMPRESSORS or not 0 <= level <= 9:
+                raise CompressionException('Unsupported compression codec %s (level %s)'%(codec, level))
+
+    def set_stat_map(self, stat_map):
+        self.__stat_map = stat_map
+
+    def __update_stat(self, key, value):
+        if self.__stat_map is not None:
+            self.__stat_map.update(key, value)
+
+    def __sample_ratio(self, data):
+        """Estimate compression ratio by compressing
+        a few small pieces of data by fastest codec"""
+        data_len = len(data)
+        if data_len <= FRI_COMPRESSION_SAMPLE_SIZE:
+            sample = data
+        else:
+            piece_len = FRI_COMPRESSION_SAMPLE_SIZE / 4
+            step = (data_len - piece_len) / 3
+            sample = ''.join([data[i*step:i*step+piece_len] for i in xrange(4)])
+        return len(zlib.compress(sample, 1)) / float(len(sample))
+
+    def select_codec(self, data):
+        """Return (codec, level) tuple for data or None
+        if data should not be compressed"""
+        if len(data) < FRI_COMPRESSION_MIN_SIZE:
+            return None
+
+        ratio = self.__sample_ratio(data)
+        if ratio > FRI_COMPRESSION_MAX_RATIO:
+            self.__update_stat('skipped_ratio', ratio)
+            return None
+
+        if len(data) <= FRI_COMPRESSION_STRONG_MAX_SIZE:
+            return self.__strong_codec
+        return self.__fast_codec
+
+    def compress(self, data):
+        """Return compressed data prefixed by codec flag
+        or None if data should not be compressed"""
+        codec = self.select_codec(data)
+        if codec is None:
+            return None
+
+        codec, level = codec
+        t0 = time.time()
+        compressed = COMPRESSORS[codec](data, level)
+        dt = time.time() - t0
+        if len(compressed) >= len(data):
+            return None
+
+        flag = codec_flag(codec, level)
+        name = codec_name(flag)
+        self.__update_stat('%s_saved_bytes'%name, len(data) - len(compressed))
+        self.__update_stat('%s_compress_ms'%name, dt*1000)
+        return flag + compressed
+
+    def decompress(self, data):
+        """Decompress data prefixed by codec flag"""
+        if not data:
+            raise CompressionException('No codec flag found')
+
+        flag = data[0]
+        decompressor = DECOMPRESSORS.get(ord(flag) >> 4, None)
+        if decompressor is None:
+            raise CompressionException('Unsupported compression codec flag 0x%02x'%ord(flag))
+
+        t0 = time.time()
+        ret = decompressor(data[1:])
+        self.__update_stat('%s_decompress_ms'%codec_name(flag), (time.time() - t0)*1000)
+        return ret
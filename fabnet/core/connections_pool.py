@@ -0,0 +1,193 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.core.connections_pool
+@author Konstantin Andrusenko
+@date July 2, 2013
+
+This module contains the implementation of ConnectionsPool class.
+"""
+import os
+import time
+import socket
+import threading
+
+from constants import FRI_POOL_MAX_IDLE_PER_NODE, FRI_POOL_MAX_IDLE, FRI_POOL_IDLE_TIMEOUT
+
+
+class ConnectionsPool:
+    """Keyed pool of idle FRI connections (objects of SocketProcessor class)
+    and shared multiplexed connections (objects of MultiplexedConnection class)
+    Connections are keyed by (hostname, port, is_ssl, cert identity, session_id)
+    """
+    def __init__(self, max_idle_per_node=FRI_POOL_MAX_IDLE_PER_NODE, \
+                    max_idle=FRI_POOL_MAX_IDLE, idle_timeout=FRI_POOL_IDLE_TIMEOUT):
+        self.__max_idle_per_node = max_idle_per_node
+        self.__max_idle = max_idle
+        self.__idle_timeout = idle_timeout
+
+        self.__lock = threading.Lock()
+        self.__idle = {}
+        self.__idle_count = 0
+        self.__multiplexed = {}
+        self.__addresses = {}
+        self.__hits = 0
+        self.__misses = 0
+        self.__pid = os.getpid()
+
+    def __acquire(self):
+        """Pool can be inherited by forked process.
+        Inherited sockets are shared with parent, so we should forget them
+        (without shutdown). Inherited lock can be locked by parent's thread
+        at fork moment, so it is recreated too.
+        """
+        pid = os.getpid()
+        if pid != self.__pid:
+            for connections in self.__idle.values():
+                for sock_proc, _ in connections:
+                    sock_proc.drop_socket()
+            for mux_conn in self.__multiplexed.values():
+                mux_conn.drop_socket()
+
+            self.__lock = threading.Lock()
+            self.__idle = {}
+            self.__idle_count = 0
+            self.__multiplexed = {}
+            self.__addresses = {}
+            self.__hits = self.__misses = 0
+            self.__pid = pid
+
+        self.__lock.acquire()
+
+    def __pop_expired(self):
+        expired = []
+        min_time = time.time() - self.__idle_timeout
+        for key, connections in self.__idle.items():
+            while connections and connections[0][1] < min_time:
+                expired.append(connections.pop(0)[0])
+            if not connections:
+                del self.__idle[key]
+        self.__idle_count -= len(expired)
+
+        for key, mux_conn in self.__multiplexed.items():
+            if not mux_conn.is_alive() or \
+                    (mux_conn.in_flight_count() == 0 and mux_conn.last_used < min_time):
+                del self.__multiplexed[key]
+                expired.append(mux_conn)
+        return expired
+
+    def resolve(self, hostname, port):
+        """Resolve node hostname only once.
+        Cached address should be removed by forget_address() call
+        if connection to it is failed
+        """
+        self.__acquire()
+        try:
+            address = self.__addresses.get((hostname, port), None)
+            if address:
+                return address
+        finally:
+            self.__lock.release()
+
+        address = socket.getaddrinfo(hostname, port, socket.AF_INET, socket.SOCK_STREAM)[0][4]
+
+        self.__acquire()
+        try:
+            self.__addresses[(hostname, port)] = address
+        finally:
+            self.__lock.release()
+        return address
+
+    def forget_address(self, hostname, port):
+        self.__acquire()
+        try:
+            if (hostname, port) in self.__addresses:
+                del self.__addresses[(hostname, port)]
+        finally:
+            self.__lock.release()
+
+    def get(self, key):
+        """Return alive connection for key or None if no such connection found"""
+        while True:
+            self.__acquire()
+            try:
+                expired = self.__pop_expired()
+                #multiplexed connection is shared by all callers
+                conn = self.__multiplexed.get(key, None)
+                is_shared = conn is not None
+                connections = self.__idle.get(key, None)
+                if not is_shared and connections:
+                    #most recently used connection is healthier
+                    conn, _ = connections.pop()
+                    self.__idle_count -= 1
+                    if not connections:
+                        del self.__idle[key]
+            finally:
+                self.__lock.release()
+
+            for expired_conn in expired:
+                expired_conn.close_socket(force=True)
+
+            if conn is None:
+                self.__acquire()
+                self.__misses += 1
+                self.__lock.release()
+                return None
+
+            if is_shared or conn.is_alive():
+                self.__acquire()
+                self.__hits += 1
+                self.__lock.release()
+                return conn
+
+            conn.close_socket(force=True)
+
+    def put(self, key, sock_proc):
+        """Return connection to pool. Connection is closed if pool limits are exceeded"""
+        self.__acquire()
+        try:
+            expired = self.__pop_expired()
+            connections = self.__idle.get(key, [])
+            if sock_proc.is_multiplexed():
+                if key in self.__multiplexed:
+                    expired.append(sock_proc)
+                else:
+                    self.__multiplexed[key] = sock_proc
+            elif len(connections) >= self.__max_idle_per_node or self.__idle_count >= self.__max_idle:
+                expired.append(sock_proc)
+            else:
+                connections.append((sock_proc, time.time()))
+                self.__idle[key] = connections
+                self.__idle_count += 1
+        finally:
+            self.__lock.release()
+
+        for conn in expired:
+            conn.close_socket(force=True)
+
+    def clear(self):
+        self.__acquire()
+        try:
+            connections = []
+            for conn_list in self.__idle.values():
+                connections += [sock_proc for sock_proc, _ in conn_list]
+            connections += self.__multiplexed.values()
+            self.__idle = {}
+            self.__idle_count = 0
+            self.__multiplexed = {}
+        finally:
+            self.__lock.release()
+
+        for conn in connections:
+            conn.close_socket(force=True)
+
+    def get_stat(self):
+        self.__acquire()
+        try:
+            return {'idle': self.__idle_count, 'multiplexed': len(self.__multiplexed), \
+                    'hits': self.__hits, 'misses': self.__misses}
+        finally:
+            self.__lock.release()
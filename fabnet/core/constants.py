@@ -16,13 +16,74 @@ BUF_SIZE = 100*1024
 
 #default binary data chunk size
 DEFAULT_CHUNK_SIZE = 1024*1024
+#max count of binary chunks that can be sent ahead without receiver request
+#(1 - lock-step transfer: each chunk is requested by RC_REQ_BINARY_CHUNK packet)
+FRI_CHUNKS_WINDOW = 8
+#binary data of received packet is kept in memory up to this size
+#and spilled to temporary file above it (see SpooledBinaryData)
+FRI_SPOOL_MAX_RAM_SIZE = 4*1024*1024
+#max total size of spooled binary data kept in memory by one process
+FRI_SPOOL_PROCESS_RAM_LIMIT = 64*1024*1024
+#in-memory binary data of async packets is handed off to operator process through
+#file in this directory (tmpfs), files are created in system temp directory if it is not exists
+FRI_SHM_DIR = '/dev/shm'
+#bigger in-memory binary data is handed off through file in system temp directory
+FRI_SHM_MAX_SIZE = 16*1024*1024
+#node-wide budget of received binary chunks (see InFlightBudget)
+#bytes of chunks granted to senders and not received yet
+FRI_INFLIGHT_BYTES_LIMIT = 64*1024*1024
+#bytes of received chunks of packets that are processing (temp files)
+FRI_HELD_BYTES_LIMIT = 1024*1024*1024
+#chunks are granted without budget after this timeout (should be less than FRI_CLIENT_READ_TIMEOUT)
+FRI_BUDGET_WAIT_TIMEOUT = 60
+#adaptive link tuning (see LinkTuner): socket buffers, recv read size and chunk size
+#are selected by bandwidth-delay product of peer link (measured by FriClient calls)
+FRI_LINK_TUNING = True
+#calls with smaller binary data are RTT samples, bigger calls are throughput samples
+FRI_LINK_MIN_TRANSFER_SIZE = 256*1024
+#weight of new throughput sample (EWMA)
+FRI_LINK_THROUGHPUT_WEIGHT = 0.25
+#min RTT grows by this ratio on each greater sample (so route changes are followed)
+FRI_LINK_RTT_AGING = 0.01
+FRI_LINK_MAX_SOCK_BUF = 8*1024*1024
+FRI_LINK_MAX_READ_SIZE = 1024*1024
+FRI_LINK_MAX_CHUNK_SIZE = 8*1024*1024
+#max count of remembered peers (least recently measured peer is forgotten)
+FRI_LINK_MAX_PEERS = 1024
 
 #fri binary packet constants 
 FRI_PROTOCOL_IDENTIFIER = 'FRI0'
 FRI_PACKET_INFO_LEN = 20
+#protocol identifier of packet with compact binary header
+#(header codec is selected by protocol identifier in packet info)
+FRI_BIN_HEADER_IDENTIFIER = 'FRIB'
+#protocol identifier of packet with compact binary header and compressed body
+#(body is prefixed by codec flag byte, see fabnet.core.compression)
+FRI_COMPRESSED_IDENTIFIER = 'FRIZ'
+
+#packet compression codecs
+CC_ZLIB = 1
+CC_BZ2 = 2
+CC_LZMA = 3
+#packets with smaller body are not compressed
+FRI_COMPRESSION_MIN_SIZE = 1024
+#size of data sample that is compressed for compression ratio estimation
+FRI_COMPRESSION_SAMPLE_SIZE = 4096
+#packet is not compressed if sample compression ratio is greater
+FRI_COMPRESSION_MAX_RATIO = 0.9
+#(codec, level) for packets with body up to FRI_COMPRESSION_STRONG_MAX_SIZE (control payloads)
+FRI_COMPRESSION_STRONG_MAX_SIZE = 256*1024
+FRI_COMPRESSION_STRONG_CODEC = (CC_ZLIB, 6)
+#(codec, level) for bigger packets (binary chunks)
+FRI_COMPRESSION_FAST_CODEC = (CC_ZLIB, 1)
 
 #message container size
 MC_SIZE = 10000
+#capacity of node-wide table of recently seen message ids (see DedupTable)
+#it should be greater than MC_SIZE
+FRI_DEDUP_TABLE_SIZE = 32768
+#count of locks of dedup table (each lock guards part of table)
+FRI_DEDUP_LOCK_STRIPES = 64
 
 #fri responses container size
 RQ_SIZE = 100
@@ -63,11 +124,48 @@ CHECK_NEIGHBOURS_TIMEOUT = 15
 FRI_CLIENT_TIMEOUT = 10
 FRI_CLIENT_READ_TIMEOUT = 120
 
+#max count of threads of FRI client I/O pool (concurrent calls of FriClient.call_many)
+FRI_IO_POOL_SIZE = 16
+#idle thread of FRI client I/O pool is stopped after this timeout
+FRI_IO_POOL_IDLE_TIMEOUT = 60
+
+#FRI connections pool constants
+FRI_POOL_MAX_IDLE_PER_NODE = 4
+FRI_POOL_MAX_IDLE = 64
+FRI_POOL_IDLE_TIMEOUT = 20
+#worker waits next packet on keep-alive connection this timeout (should be greater than FRI_POOL_IDLE_TIMEOUT)
+FRI_KEEP_ALIVE_TIMEOUT = 30
+FRI_KEEP_ALIVE_CHECK_PERIOD = 1
+
+#FRI protocol revisions (negotiated over keep-alive connection)
+FRI_PROTOCOL_REV_MULTIPLEXED = 1 #frames are tagged by message_id, many messages in flight
+FRI_PROTOCOL_REV_BIN_HEADER = 2 #packet headers are encoded by compact binary codec
+FRI_PROTOCOL_REV_COMPRESSION = 3 #packets can be compressed (codec is selected per packet)
+FRI_PROTOCOL_REV = FRI_PROTOCOL_REV_COMPRESSION
+#max count of processing messages over one multiplexed connection (per worker)
+FRI_MUX_MAX_IN_FLIGHT = 8
+
+#event loop (epoll) based FRI server front end
+#connection is closed if first packet is not received in this timeout
+FRI_FRAMING_TIMEOUT = 60
+#listen backlog of event loop front end socket (and of workers sockets in SO_REUSEPORT mode)
+FRI_LISTEN_BACKLOG = 1024
+#worker that accepts connections itself (SO_REUSEPORT mode) checks its queue with this period
+FRI_ACCEPT_CHECK_PERIOD = 0.2
+
+#SSL sessions of FRI server (session ID and session tickets resumption)
+FRI_SSL_SESSION_ID_CTX = 'fabnet-fri'
+FRI_SSL_SESSION_TIMEOUT = 3600
+
 WAIT_SYNC_OPERATION_TIMEOUT = 600
 
 MIN_WORKERS_COUNT = 5
 MAX_WORKERS_COUNT = 40
 
+#max count of async packets to one destination that are sent by FriAgent at once
+#(packets of destination are sent in order by one FriAgent thread)
+FRI_AGENT_BATCH_SIZE = 32
+
 
 #certificates constantns
 NODE_CERTIFICATE = 'nodes.idepositbox.com'
@@ -82,11 +180,26 @@ ET_INFO = 'info'
 
 #unix socket for communication with Operator process
 OPERATOR_SOCKET_ADDRESS = '/tmp/%s-fabnet-operator.socket'
+#operator RPC profiling (see RPCProfiler) is enabled by this config parameter
+#(it can be changed at runtime by UpdateNodeConfig operation)
+CFG_OPERATOR_RPC_PROFILING = 'OPERATOR_RPC_PROFILING'
+#upper bounds (in seconds) of operator RPC processing time histogram buckets
+RPC_LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+#unix socket of FRI server (by bound hostname and port) for calls from the same host
+#(it is created in private FRI_UNIX_SOCKET_DIR directory of node home)
+FRI_UNIX_SOCKET_NAME = 'fri-%s-%s.socket'
+FRI_UNIX_SOCKET_DIR = 'fri_sockets'
 
 STAT_COLLECTOR_TIMEOUT = 10
 STAT_OSPROC_TIMEOUT = 20
 
 #statistic objects
 SO_OPERS_TIME = 'OperationsProcTime'
+SO_COMPRESSION = 'CompressionStat'
+SO_SSL_HANDSHAKES = 'SSLHandshakeStat'
 SI_SYS_INFO = 'SystemInfo'
+SI_INFLIGHT_BUDGET = 'InFlightBudget'
+SI_ASYNC_CALLS = 'AsyncCallsQueue'
+SI_DEDUP_TABLE = 'DedupTable'
+SI_OPERATOR_RPC = 'OperatorRPC'
 SI_BASE_INFO = 'BaseInfo'
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.core.dedup_table
+@author Konstantin Andrusenko
+@date August 12, 2013
+
+This module contains the implementation of DedupTable class.
+Table of recently seen message ids is shared by all processes of node
+(it is created before operator process and FRI workers are forked),
+so OperationsProcessor workers check incoming packets for duplicates
+without RPC call to operator process.
+
+Table has fixed capacity and is set-associative: message id is hashed
+to set of DEDUP_SET_WAYS slots, the oldest slot of set is replaced
+by new message id. Sets are guarded by striped locks.
+"""
+import time
+import zlib
+import ctypes
+import hashlib
+import multiprocessing as mp
+
+from constants import FRI_DEDUP_TABLE_SIZE, FRI_DEDUP_LOCK_STRIPES
+
+DEDUP_SET_WAYS = 8
+DEDUP_ID_LEN = 40
+DEDUP_METHOD_LEN = 64
+DEDUP_SENDER_LEN = 64
+
+
+class DedupSlot(ctypes.Structure):
+    _fields_ = [('message_id', ctypes.c_char * DEDUP_ID_LEN),
+                ('method', ctypes.c_char * DEDUP_METHOD_LEN),
+                ('sender', ctypes.c_char * DEDUP_SENDER_LEN),
+                ('timestamp', ctypes.c_double)]
+
+
+class DedupTable:
+    def __init__(self, capacity=FRI_DEDUP_TABLE_SIZE, stripes=FRI_DEDUP_LOCK_STRIPES):
+        self.__sets_count = max(1, capacity / DEDUP_SET_WAYS)
+        self.__capacity = self.__sets_count * DEDUP_SET_WAYS
+        self.__slots = mp.RawArray(DedupSlot, self.__capacity)
+        self.__locks = [mp.Lock() for _ in xrange(stripes)]
+        #per stripe counters: inserted ids, duplicates, evicted ids
+        self.__inserted = mp.RawArray('l', stripes)
+        self.__duplicates = mp.RawArray('l', stripes)
+        self.__evicted = mp.RawArray('l', stripes)
+        #age of last evicted id (in seconds) per stripe
+        self.__evicted_age = mp.RawArray('d', stripes)
+
+    def __locate(self, message_id):
+        if len(message_id) > DEDUP_ID_LEN:
+            message_id = hashlib.md5(message_id).hexdigest()
+        set_idx = (zlib.crc32(message_id) & 0xffffffff) % self.__sets_count
+        return message_id, set_idx * DEDUP_SET_WAYS, set_idx % len(self.__locks)
+
+    @staticmethod
+    def fits(method, sender):
+        """Return True if method and sender are kept in slot without truncation"""
+        return len(method or '') <= DEDUP_METHOD_LEN and len(sender or '') <= DEDUP_SENDER_LEN
+
+    def put_safe(self, message_id, method, sender=None):
+        """Register message id.
+        Return False if message id is already registered, True otherwise"""
+        key, start, stripe = self.__locate(message_id)
+        slots = self.__slots
+        now = time.time()
+        lock = self.__locks[stripe]
+        lock.acquire()
+        try:
+            oldest = start
+            for i in xrange(start, start + DEDUP_SET_WAYS):
+                slot = slots[i]
+                if slot.message_id == key:
+                    self.__duplicates[stripe] += 1
+                    return False
+                if slot.timestamp < slots[oldest].timestamp:
+                    oldest = i
+
+            slot = slots[oldest]
+            if slot.timestamp:
+                self.__evicted[stripe] += 1
+                self.__evicted_age[stripe] = now - slot.timestamp
+            slot.message_id = key
+            slot.method = (method or '')[:DEDUP_METHOD_LEN]
+            slot.sender = (sender or '')[:DEDUP_SENDER_LEN]
+            slot.timestamp = now
+            self.__inserted[stripe] += 1
+            return True
+        finally:
+            lock.release()
+
+    def get(self, message_id):
+        """Return (method, sender, timestamp) of registered message id
+        or None if message id is not found"""
+        key, start, stripe = self.__locate(message_id)
+        lock = self.__locks[stripe]
+        lock.acquire()
+        try:
+            for i in xrange(start, start + DEDUP_SET_WAYS):
+                slot = self.__slots[i]
+                if slot.message_id == key:
+                    return slot.method, slot.sender or None, slot.timestamp
+            return None
+        finally:
+            lock.release()
+
+    def get_stat(self):
+        evicted_ages = [age for age in self.__evicted_age if age]
+        return {'capacity': self.__capacity,
+                'lock_stripes': len(self.__locks),
+                'inserted': sum(self.__inserted),
+                'duplicates': sum(self.__duplicates),
+                'evicted': sum(self.__evicted),
+                'min_evicted_age': round(min(evicted_ages), 3) if evicted_ages else None}
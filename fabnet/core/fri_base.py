@@ -11,18 +11,53 @@ Copyright (C) 2012 Konstantin Andrusenko
 This module contains the implementation of FabnetPacketRequest, FabnetPacketResponse classes.
 """
 import os
-import uuid
 import struct
-import zlib
-import json
 import tempfile
+import threading
+import itertools
+from binascii import hexlify
 
-from constants import RC_OK, FRI_PROTOCOL_IDENTIFIER, FRI_PACKET_INFO_LEN, DEFAULT_CHUNK_SIZE
+from constants import RC_OK, FRI_PROTOCOL_IDENTIFIER, FRI_PACKET_INFO_LEN, DEFAULT_CHUNK_SIZE, \
+                    FRI_COMPRESSED_IDENTIFIER, FRI_BIN_HEADER_IDENTIFIER, \
+                    FRI_SPOOL_MAX_RAM_SIZE, FRI_SPOOL_PROCESS_RAM_LIMIT, FRI_SHM_DIR, FRI_SHM_MAX_SIZE
+from header_codec import get_header_codec, LazyHeaderValue
+from compression import PacketCompressor
+
+
+PACKET_INFO_STRUCT = struct.Struct('<4sqq')
+MESSAGE_ID_STRUCT = struct.Struct('>8sQ')
+
+
+class MessageIdGenerator:
+    """Generator of 16 bytes message ids: random prefix of process
+    (regenerated after fork) and counter of process messages.
+    Id is formatted as UUID string, so it is encoded
+    by 16 raw bytes in binary packet header"""
+    def __init__(self):
+        self.__pid = None
+        self.__prefix = None
+        self.__counter = None
+
+    def __reset(self):
+        self.__prefix = os.urandom(8)
+        self.__counter = itertools.count(1)
+        self.__pid = os.getpid()
+
+    def next_id(self):
+        if self.__pid != os.getpid():
+            self.__reset()
+        h_id = hexlify(MESSAGE_ID_STRUCT.pack(self.__prefix, self.__counter.next()))
+        return '%s-%s-%s-%s-%s'%(h_id[:8], h_id[8:12], h_id[12:16], h_id[16:20], h_id[20:])
+
+new_message_id = MessageIdGenerator().next_id
 
 
 class FriException(Exception):
     pass
 
+class FriConnectionClosed(FriException):
+    pass
+
 
 class FriBinaryData:
     def chunks_count(self):
@@ -32,15 +67,49 @@ class FriBinaryData:
         """Return next data chunk. None should be returned if EOF"""
         raise RuntimeError('Not implemented')
 
+    def get_next_chunk_region(self):
+        """Return (file descriptor, offset, length) tuple of next
+        data chunk (for sending by sendfile) and skip this chunk.
+        None should be returned if data is not file based or EOF"""
+        return None
+
+    def get_next_chunk_view(self):
+        """Return next data chunk as buffer object
+        (chunk data should not be copied if possible).
+        None should be returned if EOF"""
+        return self.get_next_chunk()
+
+    def size(self):
+        """Return size of binary data (None if it is unknown)"""
+        return None
+
+    def set_chunk_size(self, chunk_size):
+        """Set size of chunks that are not read yet
+        (ignored if data can not be rechunked)"""
+        pass
+
+    def data_pointer(self):
+        """Return BinaryDataPointer to file with whole binary data
+        (hardlink that is removed on close) or None if data
+        is not file based (or it is read already)"""
+        return None
+
     def data(self):
         """Return all binary data in one chunk"""
-        data = ''
+        chunks = []
         while True:
             chunk = self.get_next_chunk()
             if not chunk:
                 break
-            data += chunk
-        return data
+            if isinstance(chunk, memoryview):
+                chunk = chunk.tobytes()
+            chunks.append(chunk)
+        return ''.join(chunks)
+
+    def rewind(self):
+        """Restart reading from first chunk (for resending data).
+        Return False if data can not be read again"""
+        return False
 
     def close(self):
         pass
@@ -73,7 +142,28 @@ class RamBasedBinaryData(FriBinaryData):
 
         return self.__data[start:end]
 
+    def get_next_chunk_view(self):
+        if self.__last_idx >= self.__chunks_count:
+            return None
+
+        start = self.__chunk_size * self.__last_idx
+        self.__last_idx += 1
+
+        if isinstance(self.__data, memoryview):
+            return self.__data[start:start+self.__chunk_size]
+        return buffer(self.__data, start, self.__chunk_size)
+
+    def size(self):
+        return len(self.__data)
+
+    def rewind(self):
+        self.__last_idx = 0
+        return True
+
     def data(self):
+        if isinstance(self.__data, memoryview):
+            #received data is converted to string once (if whole data is needed)
+            self.__data = self.__data.tobytes()
         return self.__data
 
 class BinaryDataPointer:
@@ -106,6 +196,20 @@ class FileBasedChunks(FriBinaryData):
             cnt += 1
         return cnt
 
+    def size(self):
+        return os.path.getsize(self.__file_path)
+
+    def set_chunk_size(self, chunk_size):
+        self.__chunk_size = chunk_size
+
+    def data_pointer(self):
+        if self.__read_bytes or self.__no_data_flag:
+            return None
+        link_path = hardlink_to_spool(self.__file_path)
+        if link_path is None:
+            return None
+        return BinaryDataPointer(link_path, remove_on_close=True)
+
     def read(self, block_size):
         if self.__no_data_flag:
             return None
@@ -130,19 +234,270 @@ class FileBasedChunks(FriBinaryData):
     def get_next_chunk(self):
         return self.read(self.__chunk_size)
 
+    def rewind(self):
+        if not os.path.exists(self.__file_path):
+            return False
+        self.close()
+        self.__f_obj = None
+        self.__read_bytes = 0
+        self.__no_data_flag = False
+        return True
+
+    def get_next_chunk_region(self):
+        if self.__no_data_flag:
+            return None
+
+        try:
+            if not self.__f_obj:
+                self.__f_obj = open(self.__file_path, 'rb')
+
+            fd = self.__f_obj.fileno()
+            length = min(self.__chunk_size, os.fstat(fd).st_size - self.__read_bytes)
+            if length <= 0:
+                self.close()
+                return None
+
+            offset = self.__read_bytes
+            self.__read_bytes += length
+            self.__f_obj.seek(self.__read_bytes)
+            return fd, offset, length
+        except (IOError, OSError), err:
+            self.close()
+            raise FriException('Cant read data from file system. Details: %s'%err)
+
     def close(self):
         self.__no_data_flag = True
         if self.__f_obj:
             self.__f_obj.close()
 
+class SpooledBinaryData(FriBinaryData):
+    """Binary data that is written by write() method and read by chunks after that.
+    Data is kept in memory while its size is less than max_ram_size
+    and is spilled to temporary file (in spool_dir) above it.
+    Total size of in-memory data of all SpooledBinaryData objects of process
+    is limited by FRI_SPOOL_PROCESS_RAM_LIMIT, data is spilled to file
+    if this limit is reached.
+    """
+    __ram_lock = threading.Lock()
+    __ram_usage = 0
+    #directory for spool files (system temp directory is used if None)
+    spool_dir = None
+
+    @classmethod
+    def set_spool_dir(cls, spool_dir):
+        SpooledBinaryData.spool_dir = spool_dir
+
+    @classmethod
+    def make_spool_file(cls):
+        """Create temporary file in spool directory.
+        Return (file descriptor, file path) tuple"""
+        spool_dir = cls.spool_dir
+        if spool_dir and not os.path.isdir(spool_dir):
+            spool_dir = None
+        return tempfile.mkstemp('-fri-spool', dir=spool_dir)
+
+    @classmethod
+    def ram_usage(cls):
+        return SpooledBinaryData.__ram_usage
+
+    @classmethod
+    def __reserve_ram(cls, size):
+        cls.__ram_lock.acquire()
+        try:
+            if SpooledBinaryData.__ram_usage + size > FRI_SPOOL_PROCESS_RAM_LIMIT:
+                return False
+            SpooledBinaryData.__ram_usage += size
+            return True
+        finally:
+            cls.__ram_lock.release()
+
+    @classmethod
+    def __release_ram(cls, size):
+        cls.__ram_lock.acquire()
+        try:
+            SpooledBinaryData.__ram_usage -= size
+        finally:
+            cls.__ram_lock.release()
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, max_ram_size=FRI_SPOOL_MAX_RAM_SIZE):
+        self.__chunk_size = chunk_size
+        self.__max_ram_size = max_ram_size
+        self.__chunks = [] #in-memory data (list of written blocks)
+        self.__data = None #in-memory data joined at first read
+        self.__ram_size = 0
+        self.__size = 0
+        self.__fd = None
+        self.__file_path = None
+        self.__file_chunks = None
+        self.__last_idx = 0
+
+    def __del__(self):
+        self.close()
+
+    def is_spilled(self):
+        return self.__file_path is not None
+
+    def size(self):
+        return self.__size
+
+    def write(self, data):
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        elif not isinstance(data, str):
+            data = str(data)
+        if not data:
+            return
+
+        self.__size += len(data)
+        if self.__file_path is None:
+            if self.__ram_size + len(data) <= self.__max_ram_size \
+                    and self.__reserve_ram(len(data)):
+                self.__chunks.append(data)
+                self.__ram_size += len(data)
+                return
+            self.__spill()
+
+        self.__write_file(data)
+
+    def __spill(self):
+        self.__fd, self.__file_path = self.make_spool_file()
+
+        chunks = self.__chunks
+        self.__chunks = []
+        for chunk in chunks:
+            self.__write_file(chunk)
+        self.__release_ram(self.__ram_size)
+        self.__ram_size = 0
+
+    def __write_file(self, data):
+        view = buffer(data)
+        while view:
+            written = os.write(self.__fd, view)
+            view = buffer(view, written)
+
+    def __finish_write(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+            self.__file_chunks = FileBasedChunks(self.__file_path, self.__chunk_size)
+        elif self.__data is None:
+            self.__data = ''.join(self.__chunks)
+            self.__chunks = []
+
+    def chunks_count(self):
+        cnt = self.__size / self.__chunk_size
+        if self.__size % self.__chunk_size != 0:
+            cnt += 1
+        return cnt - self.__last_idx
+
+    def get_next_chunk(self):
+        self.__finish_write()
+        if self.__file_chunks:
+            chunk = self.__file_chunks.get_next_chunk()
+        else:
+            start = self.__chunk_size * self.__last_idx
+            chunk = self.__data[start:start+self.__chunk_size] or None
+        if chunk is not None:
+            self.__last_idx += 1
+        return chunk
+
+    def get_next_chunk_region(self):
+        self.__finish_write()
+        if not self.__file_chunks:
+            return None
+        region = self.__file_chunks.get_next_chunk_region()
+        if region is not None:
+            self.__last_idx += 1
+        return region
+
+    def get_next_chunk_view(self):
+        self.__finish_write()
+        if self.__file_chunks:
+            return self.get_next_chunk()
+
+        start = self.__chunk_size * self.__last_idx
+        if start >= len(self.__data):
+            return None
+        self.__last_idx += 1
+        return buffer(self.__data, start, self.__chunk_size)
+
+    def data(self):
+        self.__finish_write()
+        if self.__file_chunks:
+            return FriBinaryData.data(self)
+        return self.__data
+
+    def data_pointer(self):
+        if self.__file_path is None or self.__last_idx:
+            return None
+        self.__finish_write()
+        return self.__file_chunks.data_pointer()
+
+    def rewind(self):
+        if self.__file_chunks:
+            if not self.__file_chunks.rewind():
+                return False
+        elif self.__file_path is None and self.__data is None \
+                and not self.__chunks and self.__size:
+            #data is closed
+            return False
+        self.__last_idx = 0
+        return True
+
+    def close(self):
+        if self.__ram_size:
+            self.__release_ram(self.__ram_size)
+            self.__ram_size = 0
+        self.__chunks = []
+        self.__data = None
+
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+        if self.__file_chunks:
+            self.__file_chunks.close()
+            self.__file_chunks = None
+        if self.__file_path:
+            if os.path.exists(self.__file_path):
+                os.remove(self.__file_path)
+            self.__file_path = None
+
+
+def hardlink_to_spool(file_path):
+    """Create hardlink to file in spool directory (see SpooledBinaryData.spool_dir).
+    Return path of link or None if link can not be created
+    (file is on other file system, for example)"""
+    spool_dir = SpooledBinaryData.spool_dir
+    if not (spool_dir and os.path.isdir(spool_dir)):
+        spool_dir = tempfile.gettempdir()
+
+    link_path = os.path.join(spool_dir, '%s-serialized_binary'%hexlify(os.urandom(16)))
+    try:
+        os.link(file_path, link_path)
+    except OSError, err:
+        return None
+    return link_path
+
 def serialize_binary_data(binary_data):
+    """Return BinaryDataPointer for handoff of binary data to operator process.
+    File based data is linked (without copying), in-memory data is written
+    to file in FRI_SHM_DIR (if its size is less than FRI_SHM_MAX_SIZE)"""
     if isinstance(binary_data, BinaryDataPointer):
         return binary_data
 
     if not isinstance(binary_data, FriBinaryData): 
         raise FriException('Invalid binary data type: %s'%type(binary_data))
 
-    fd, tmp_path = tempfile.mkstemp('-serialized_binary')    
+    pointer = binary_data.data_pointer()
+    if pointer:
+        binary_data.close()
+        return pointer
+
+    tmp_dir = None
+    size = binary_data.size()
+    if size is not None and size <= FRI_SHM_MAX_SIZE and os.path.isdir(FRI_SHM_DIR):
+        tmp_dir = FRI_SHM_DIR
+    fd, tmp_path = tempfile.mkstemp('-serialized_binary', dir=tmp_dir)
     while True:
         chunk = binary_data.get_next_chunk()
         if chunk is None:
@@ -154,7 +509,8 @@ def serialize_binary_data(binary_data):
 
 
 class FriBinaryProcessor:
-    NEED_COMPRESSION = False
+    #packets compressor (for FRI_COMPRESSED_IDENTIFIER protocol)
+    compressor = PacketCompressor()
 
     @classmethod
     def get_expected_len(cls, data):
@@ -167,7 +523,7 @@ class FriBinaryProcessor:
         except Exception, err:
             raise FriException('Invalid FRI packet! Packet information is corrupted: %s'%err)
 
-        if prot != FRI_PROTOCOL_IDENTIFIER:
+        if get_header_codec(prot) is None:
             raise FriException('Invalid FRI packet! Protocol is mismatch')
 
         return packet_len, header_len
@@ -175,43 +531,99 @@ class FriBinaryProcessor:
 
     @classmethod
     def from_binary(cls, data, packet_len, header_len):
+        """Parse packet data (str, buffer or memoryview object).
+        Binary data is returned as slice of packet data (memoryview
+        for memoryview packet data)"""
         if len(data) != int(packet_len):
             raise FriException('Invalid FRI packet! Packet length %s is differ to expected %s'%(len(data), packet_len))
 
-        header = data[FRI_PACKET_INFO_LEN:FRI_PACKET_INFO_LEN+header_len]
+        prot = data[:4]
+        if isinstance(prot, memoryview):
+            prot = prot.tobytes()
+
+        if prot == FRI_COMPRESSED_IDENTIFIER:
+            body = data[FRI_PACKET_INFO_LEN:]
+            if isinstance(body, memoryview):
+                body = body.tobytes()
+            try:
+                data = cls.compressor.decompress(body)
+            except Exception, err:
+                raise FriException('Invalid FRI packet! Compressed data is corrupted: %s'%err)
+            offset = 0
+        else:
+            offset = FRI_PACKET_INFO_LEN
+
+        header = data[offset:offset+header_len]
         if len(header) != int(header_len):
             raise FriException('Invalid FRI packet! Header length %s is differ to expected %s'%(len(header), header_len))
 
+        json_header = cls.decode_header(prot, header)
+        bin_data = data[header_len+offset:]
+        return json_header, bin_data
+
+    @classmethod
+    def decode_header(cls, protocol_id, header):
+        """Packet parameters of binary header are decoded lazily
+        (see LazyHeaderValue)"""
         try:
-            json_header = json.loads(header)
+            if isinstance(header, memoryview):
+                header = header.tobytes()
+            return get_header_codec(protocol_id).decode(header, lazy=True)
         except Exception, err:
             raise FriException('Invalid FRI packet! Header is corrupted: %s'%err)
 
-        bin_data = data[header_len+FRI_PACKET_INFO_LEN:]
-        if bin_data and cls.NEED_COMPRESSION:
-            bin_data = zlib.decompress(bin_data)
-
-        return json_header, bin_data
-
     @classmethod
-    def to_binary(cls, header_obj, bin_data=''):
+    def encode_header(cls, header_obj, protocol_id):
         try:
-            header = json.dumps(header_obj)
+            return get_header_codec(protocol_id).encode(header_obj)
         except Exception, err:
             raise FriException('Cant form FRI packet! Header "%s" is corrupted: %s'%(header_obj, err))
 
-        if bin_data and cls.NEED_COMPRESSION:
-            bin_data = zlib.compress(bin_data)
+    @classmethod
+    def packet_info(cls, protocol_id, header_len, bin_data_len):
+        p_len = header_len + bin_data_len + FRI_PACKET_INFO_LEN
+        return PACKET_INFO_STRUCT.pack(protocol_id, p_len, header_len)
+
+    @classmethod
+    def to_binary(cls, header_obj, bin_data='', protocol_id=FRI_PROTOCOL_IDENTIFIER):
+        """Form packet. Packet body is compressed for FRI_COMPRESSED_IDENTIFIER
+        protocol (if compression pays off, else FRI_BIN_HEADER_IDENTIFIER
+        packet is formed)"""
+        header = cls.encode_header(header_obj, protocol_id)
+
+        if isinstance(bin_data, memoryview):
+            bin_data = bin_data.tobytes()
+        elif isinstance(bin_data, buffer):
+            bin_data = str(bin_data)
 
         h_len = len(header)
         packet_data = header + bin_data
-        p_len = len(packet_data) + FRI_PACKET_INFO_LEN
-        p_info = struct.pack('<4sqq', FRI_PROTOCOL_IDENTIFIER, p_len, h_len)
+        if protocol_id == FRI_COMPRESSED_IDENTIFIER:
+            compressed = cls.compressor.compress(packet_data)
+            if compressed is None:
+                protocol_id = FRI_BIN_HEADER_IDENTIFIER
+            else:
+                packet_data = compressed
+        p_info = cls.packet_info(protocol_id, h_len, len(packet_data) - h_len)
 
         return p_info + packet_data
 
+    @classmethod
+    def to_binary_header(cls, header_obj, bin_data_len, protocol_id=FRI_PROTOCOL_IDENTIFIER):
+        """Form packet without binary data. Binary data (bin_data_len bytes)
+        should be sent right after returned data (packet is not compressed)"""
+        if protocol_id == FRI_COMPRESSED_IDENTIFIER:
+            protocol_id = FRI_BIN_HEADER_IDENTIFIER
+
+        header = cls.encode_header(header_obj, protocol_id)
+        return cls.packet_info(protocol_id, len(header), bin_data_len) + header
 
-class FabnetPacket:
+
+class FabnetPacket(object):
+    """Base class of FRI packets. Packet does not release binary data
+    on destruction, packet owner calls close() method for it"""
+    __slots__ = ('message_id', 'session_id', 'binary_data', 'binary_chunk_idx', 'binary_chunk_cnt',
+                    'binary_chunk_window', 'keep_alive', 'protocol_rev', 'transfer_time', '__chunk_header')
     is_request = False
     is_response = False
 
@@ -235,35 +647,81 @@ class FabnetPacket:
             self.binary_data = RamBasedBinaryData(self.binary_data)
         self.binary_chunk_idx = packet.get('binary_chunk_idx', 0)
         self.binary_chunk_cnt = packet.get('binary_chunk_cnt', 0)
+        self.binary_chunk_window = packet.get('binary_chunk_window', 0)
+        self.keep_alive = packet.get('keep_alive', False)
+        self.protocol_rev = packet.get('protocol_rev', 0)
+        #duration of binary chunks sending from first granted chunk (set by sender)
+        self.transfer_time = None
+        #(protocol_id, encoded header) of binary chunks packets (without binary_chunk_idx)
+        self.__chunk_header = None
 
-    def __del__(self):
+    def close(self):
         if isinstance(self.binary_data, FriBinaryData):
             self.binary_data.close()
 
+    def __getstate__(self):
+        #packets are pickled for operator process calls
+        state = {}
+        for cls in type(self).__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if slot.startswith('__'):
+                    slot = '_%s%s'%(cls.__name__, slot)
+                if hasattr(self, slot):
+                    state[slot] = getattr(self, slot)
+        return state
+
+    def __setstate__(self, state):
+        for attr, value in state.iteritems():
+            setattr(self, attr, value)
+
     def validate(self):
         """This method may be implemented
            in inherited class for packet validation
         """
         pass
 
-    def dump(self, with_bin=True):
+    def dump(self, with_bin=True, protocol_id=FRI_PROTOCOL_IDENTIFIER):
+        #packet (or init packet of binary chunks) is sent, so chunks header is changed
+        self.__chunk_header = None
         header_json = self.to_dict()
         if self.binary_data and with_bin:
             binary_data = self.binary_data.data()
         else:
             binary_data = ''
-        data = FriBinaryProcessor.to_binary(header_json, binary_data)
+        data = FriBinaryProcessor.to_binary(header_json, binary_data, protocol_id)
         return data
 
-    def dump_next_chunk(self):
-        header_json = self.to_dict()
+    def dump_next_chunk(self, protocol_id=FRI_PROTOCOL_IDENTIFIER):
         binary_data = ''
         if self.binary_data:
             binary_data = self.binary_data.get_next_chunk()
         if not binary_data:
             return None
-        data = FriBinaryProcessor.to_binary(header_json, binary_data)
-        return data
+        return ''.join(self.dump_chunk(binary_data, protocol_id))
+
+    def dump_chunk(self, chunk, protocol_id=FRI_PROTOCOL_IDENTIFIER):
+        """Form binary chunk packet as list of buffers (packet info, header, chunk)
+        for sending without concatenation. Header is encoded once for all chunks
+        of packet, binary_chunk_idx is appended to encoded header.
+        Compressible chunk packet is formed as one buffer"""
+        if protocol_id == FRI_COMPRESSED_IDENTIFIER:
+            if isinstance(chunk, memoryview):
+                chunk = chunk.tobytes()
+            if FriBinaryProcessor.compressor.select_codec(chunk) is not None:
+                return [FriBinaryProcessor.to_binary(self.to_dict(), chunk, protocol_id)]
+            protocol_id = FRI_BIN_HEADER_IDENTIFIER
+
+        if self.__chunk_header is None or self.__chunk_header[0] != protocol_id:
+            header_obj = self.to_dict()
+            header_obj.pop('binary_chunk_idx', None)
+            self.__chunk_header = (protocol_id, FriBinaryProcessor.encode_header(header_obj, protocol_id))
+
+        header = get_header_codec(protocol_id).append_item(self.__chunk_header[1], \
+                                                'binary_chunk_idx', self.binary_chunk_idx)
+        return [FriBinaryProcessor.packet_info(protocol_id, len(header), len(chunk)), header, chunk]
+
+    def dump_header(self, bin_data_len, protocol_id=FRI_PROTOCOL_IDENTIFIER):
+        return FriBinaryProcessor.to_binary_header(self.to_dict(), bin_data_len, protocol_id)
 
     def to_dict(self):
         """This method may be extended in inherited class"""
@@ -275,6 +733,12 @@ class FabnetPacket:
             ret_dict['binary_chunk_idx'] = self.binary_chunk_idx
         if self.binary_chunk_cnt:
             ret_dict['binary_chunk_cnt'] = self.binary_chunk_cnt
+        if self.binary_chunk_window:
+            ret_dict['binary_chunk_window'] = self.binary_chunk_window
+        if self.keep_alive:
+            ret_dict['keep_alive'] = self.keep_alive
+        if self.protocol_rev:
+            ret_dict['protocol_rev'] = self.protocol_rev
 
         return ret_dict
 
@@ -283,6 +747,7 @@ class FabnetPacket:
 
 
 class FabnetPacketRequest(FabnetPacket):
+    __slots__ = ('is_multicast', 'sync', 'method', 'sender', '__parameters', 'role')
     is_request = True
     is_response = False
     def __init__(self, **packet):
@@ -291,14 +756,29 @@ class FabnetPacketRequest(FabnetPacket):
         self.is_multicast = packet.get('is_multicast', None)
         self.sync = packet.get('sync', False)
         if not self.message_id:
-            self.message_id = str(uuid.uuid1())
+            self.message_id = new_message_id()
         self.method = packet.get('method', None)
         self.sender = packet.get('sender', None)
-        self.parameters = packet.get('parameters', {})
+        self.__parameters = packet.get('parameters', {})
         self.role = None
 
         self.validate()
 
+    def __get_parameters(self):
+        parameters = self.__parameters
+        if type(parameters) is LazyHeaderValue:
+            parameters = self.__parameters = parameters.value()
+        return parameters
+
+    def __set_parameters(self, parameters):
+        self.__parameters = parameters
+
+    parameters = property(__get_parameters, __set_parameters)
+
+    def encoded_parameters(self):
+        """Return parameters as is (LazyHeaderValue if they are not decoded yet)"""
+        return self.__parameters
+
     def copy(self):
         return FabnetPacketRequest(**self.to_dict())
 
@@ -316,8 +796,8 @@ class FabnetPacketRequest(FabnetPacket):
                 'sender': self.sender, \
                 'sync': self.sync})
 
-        if self.parameters:
-            ret_dict['parameters'] = self.parameters
+        if self.__parameters:
+            ret_dict['parameters'] = self.__parameters
         if self.is_multicast:
             ret_dict['is_multicast'] = self.is_multicast
 
@@ -332,6 +812,7 @@ class FabnetPacketRequest(FabnetPacket):
 
 
 class FabnetPacketResponse(FabnetPacket):
+    __slots__ = ('ret_code', 'ret_message', '__ret_parameters', 'from_node')
     is_request = False
     is_response = True
     def __init__(self, **packet):
@@ -339,16 +820,31 @@ class FabnetPacketResponse(FabnetPacket):
 
         self.ret_code = packet.get('ret_code', RC_OK)
         self.ret_message = str(packet.get('ret_message', ''))
-        self.ret_parameters = packet.get('ret_parameters', {})
+        self.__ret_parameters = packet.get('ret_parameters', {})
         self.from_node = packet.get('from_node', None)
 
+    def __get_ret_parameters(self):
+        ret_parameters = self.__ret_parameters
+        if type(ret_parameters) is LazyHeaderValue:
+            ret_parameters = self.__ret_parameters = ret_parameters.value()
+        return ret_parameters
+
+    def __set_ret_parameters(self, ret_parameters):
+        self.__ret_parameters = ret_parameters
+
+    ret_parameters = property(__get_ret_parameters, __set_ret_parameters)
+
+    def encoded_ret_parameters(self):
+        """Return ret_parameters as is (LazyHeaderValue if they are not decoded yet)"""
+        return self.__ret_parameters
+
     def to_dict(self):
         ret_dict = FabnetPacket.to_dict(self)
         ret_dict.update({'ret_code': self.ret_code,
                 'ret_message': self.ret_message})
 
-        if self.ret_parameters:
-            ret_dict['ret_parameters'] = self.ret_parameters
+        if self.__ret_parameters:
+            ret_dict['ret_parameters'] = self.__ret_parameters
         if self.from_node:
             ret_dict['from_node'] = self.from_node
 
@@ -10,61 +10,404 @@ Copyright (C) 2012 Konstantin Andrusenko
 
 This module contains the implementation of FriClient class.
 """
+import os
+import time
 import socket
 import ssl
+import hashlib
+import threading
+import Queue
 
-from constants import RC_ERROR, RC_UNEXPECTED, FRI_CLIENT_TIMEOUT, FRI_CLIENT_READ_TIMEOUT
+from constants import RC_ERROR, RC_UNEXPECTED, FRI_CLIENT_TIMEOUT, FRI_CLIENT_READ_TIMEOUT, \
+                        FRI_PROTOCOL_REV, FRI_PROTOCOL_REV_MULTIPLEXED, FRI_IO_POOL_SIZE, \
+                        FRI_IO_POOL_IDLE_TIMEOUT, FRI_LINK_TUNING, FRI_LINK_MIN_TRANSFER_SIZE
 
-from fri_base import FabnetPacket, FabnetPacketResponse, FriException
+from fri_base import FabnetPacket, FabnetPacketResponse, FriException, FriConnectionClosed
 from socket_processor import SocketProcessor
+from connections_pool import ConnectionsPool
+from fri_server import get_unix_socket_path, check_peer_credentials, UNIX_SOCKET_SUPPORTED
+from multiplexed_socket import MultiplexedConnection, MessageInFlight
+from link_tuner import LinkTuner, tune_socket
+
+#connections pool shared by all FriClient objects in process
+DEFAULT_CONNECTIONS_POOL = ConnectionsPool()
+
+#peer links measurements shared by all FriClient objects in process
+DEFAULT_LINK_TUNER = LinkTuner()
+
+#SSL context shared by all FriClient objects in process
+CLIENT_SSL_CONTEXT = None
+
+#IP addresses of current host (resolved at first call of is_local_address)
+LOCAL_ADDRESSES = None
+
+def is_local_address(ip_address):
+    global LOCAL_ADDRESSES
+    if ip_address.startswith('127.'):
+        return True
+
+    if LOCAL_ADDRESSES is None:
+        try:
+            LOCAL_ADDRESSES = set(socket.gethostbyname_ex(socket.gethostname())[2])
+        except socket.error:
+            LOCAL_ADDRESSES = set()
+    return ip_address in LOCAL_ADDRESSES
+
+def get_local_socket_path(ip_address, port):
+    """Return path to unix socket of FRI server
+    that listens ip_address:port on current host (or None)"""
+    if not UNIX_SOCKET_SUPPORTED or not is_local_address(ip_address):
+        return None
+
+    for hostname in (ip_address, '0.0.0.0'):
+        path = get_unix_socket_path(hostname, port)
+        if path and os.path.exists(path):
+            return path
+    return None
+
+def wrap_client_socket(sock):
+    """Wrap socket by SSL using client context that is built once per process
+    (ssl.wrap_socket builds new context for each socket)"""
+    global CLIENT_SSL_CONTEXT
+    if not hasattr(ssl, 'SSLContext'):
+        return ssl.wrap_socket(sock)
+
+    if CLIENT_SSL_CONTEXT is None:
+        CLIENT_SSL_CONTEXT = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    return CLIENT_SSL_CONTEXT.wrap_socket(sock)
+
+
+class FriFuture:
+    """Pending result of FRI call that is processed by FriIOPool"""
+    def __init__(self, node_address, packet, call_routine, on_done=None):
+        self.node_address = node_address
+        self.packet = packet
+        self.__call_routine = call_routine
+        self.__on_done = on_done
+        self.__lock = threading.Lock()
+        self.__done = threading.Event()
+        self.__started = False
+        self.__cancelled = False
+        self.__response = None
+
+    def run(self):
+        self.__lock.acquire()
+        try:
+            if self.__cancelled:
+                return
+            self.__started = True
+        finally:
+            self.__lock.release()
+
+        try:
+            response = self.__call_routine(self.node_address, self.packet)
+        except Exception, err:
+            response = FabnetPacketResponse(ret_code=RC_ERROR, \
+                            ret_message='[FriClient][%s] %s' % (err.__class__.__name__, err))
+        self.__set_response(response)
+
+    def __set_response(self, response):
+        self.__response = response
+        self.__done.set()
+        if self.__on_done:
+            self.__on_done(self)
+
+    def cancel(self):
+        """Cancel call if it is not started yet.
+        Return True if call is cancelled"""
+        self.__lock.acquire()
+        try:
+            if self.__started or self.__cancelled:
+                return False
+            self.__cancelled = True
+        finally:
+            self.__lock.release()
+
+        self.__set_response(FabnetPacketResponse(ret_code=RC_ERROR, \
+                                    ret_message='[FriClient] call is cancelled'))
+        return True
+
+    def cancelled(self):
+        return self.__cancelled
+
+    def done(self):
+        return self.__done.is_set()
+
+    def result(self, timeout=None):
+        """Wait and return response packet of call
+        (None is returned if call is not finished in timeout)"""
+        self.__done.wait(timeout)
+        return self.__response
+
+
+class FriCallsGroup:
+    """Calls that are sent concurrently by FriClient.call_many"""
+    def __init__(self):
+        self.futures = []
+        self.__completed = Queue.Queue()
+        self.__returned = 0 #count of completed futures that are returned already
+
+    def _add(self, node_address, packet, call_routine):
+        future = FriFuture(node_address, packet, call_routine, self.__completed.put)
+        self.futures.append(future)
+        return future
+
+    def iter_completed(self, wait_count=None, timeout=None):
+        """Yield futures in order of calls completion (each future is yielded once).
+        Iteration is stopped after wait_count futures (all remaining futures if None)
+        or when timeout (in seconds) is expired"""
+        remaining = len(self.futures) - self.__returned
+        if wait_count is None or wait_count > remaining:
+            wait_count = remaining
+        deadline = None if timeout is None else time.time() + timeout
+
+        completed = 0
+        while completed < wait_count:
+            if deadline is None:
+                #Queue.get() without timeout can not be interrupted
+                wait_time = FRI_CLIENT_READ_TIMEOUT
+            else:
+                wait_time = deadline - time.time()
+                if wait_time <= 0:
+                    return
+            try:
+                future = self.__completed.get(timeout=wait_time)
+            except Queue.Empty:
+                continue
+            completed += 1
+            self.__returned += 1
+            yield future
+
+    def wait(self, wait_count=None, timeout=None):
+        """Wait wait_count calls (all remaining calls if None) and return completed futures"""
+        return list(self.iter_completed(wait_count, timeout))
+
+    def cancel(self):
+        """Cancel calls that are not started yet.
+        Return count of cancelled calls"""
+        return len([f for f in self.futures if f.cancel()])
+
+
+class FriIOPool:
+    """Bounded pool of threads that process FRI calls concurrently.
+    Threads are started on demand and stopped after FRI_IO_POOL_IDLE_TIMEOUT
+    """
+    def __init__(self, size=FRI_IO_POOL_SIZE):
+        self.__size = size
+        self.__lock = threading.Lock()
+        self.__pid = None
+        self.__queue = None
+        self.__threads_count = 0
+        self.__idle_count = 0
+
+    def submit(self, future):
+        self.__lock.acquire()
+        try:
+            if self.__pid != os.getpid():
+                #threads of parent process are not exists in forked process
+                self.__pid = os.getpid()
+                self.__queue = Queue.Queue()
+                self.__threads_count = self.__idle_count = 0
+
+            self.__queue.put(future)
+            if self.__idle_count < self.__queue.qsize() and self.__threads_count < self.__size:
+                self.__threads_count += 1
+                self.__idle_count += 1
+                thread = threading.Thread(target=self.__thread_routine, args=(self.__queue,))
+                thread.setName('FriIOPool-%s'%self.__threads_count)
+                thread.setDaemon(True)
+                thread.start()
+        finally:
+            self.__lock.release()
+
+    def __thread_routine(self, queue):
+        while True:
+            try:
+                future = queue.get(timeout=FRI_IO_POOL_IDLE_TIMEOUT)
+            except Queue.Empty:
+                self.__lock.acquire()
+                try:
+                    if queue.empty():
+                        self.__threads_count -= 1
+                        self.__idle_count -= 1
+                        return
+                finally:
+                    self.__lock.release()
+                continue
+
+            self.__set_idle(-1)
+            try:
+                future.run()
+            finally:
+                self.__set_idle(1)
+
+    def __set_idle(self, delta):
+        self.__lock.acquire()
+        try:
+            self.__idle_count += delta
+        finally:
+            self.__lock.release()
+
+#I/O pool shared by all FriClient objects in process
+DEFAULT_IO_POOL = FriIOPool()
+
 
 class FriClient:
     """class for calling asynchronous operation over FRI protocol"""
-    def __init__(self, is_ssl=None, cert=None, session_id=None):
+    def __init__(self, is_ssl=None, cert=None, session_id=None, conn_pool=None, io_pool=None, \
+                    use_unix_socket=True, link_tuner=None):
+        """If use_unix_socket is True, nodes on the same host
+        are called over unix socket (without SSL)
+        Calls are measured by link_tuner (LinkTuner object), socket buffers
+        and chunk size of binary data are tuned for each peer link
+        (DEFAULT_LINK_TUNER is used if FRI_LINK_TUNING is enabled)"""
         self.is_ssl = is_ssl
         self.certificate = cert
         self.session_id = session_id
+        self.use_unix_socket = use_unix_socket
+        self.__conn_pool = conn_pool or DEFAULT_CONNECTIONS_POOL
+        self.__io_pool = io_pool or DEFAULT_IO_POOL
+        self.__link_tuner = link_tuner or (DEFAULT_LINK_TUNER if FRI_LINK_TUNING else None)
+        if cert:
+            self.__identity = hashlib.sha1(cert).hexdigest()
+        else:
+            self.__identity = None
 
-    def __int_call(self, node_address, packet, conn_timeout, read_timeout=None):
-        proc = None
+    def __parse_address(self, node_address):
+        address = node_address.split(':')
+        if len(address) != 2:
+            raise FriException('Node address %s is invalid! ' \
+                        'Address should be in format <hostname>:<port>'%node_address)
+        hostname = address[0]
+        try:
+            port = int(address[1])
+            if 0 > port > 65535:
+                raise ValueError()
+        except ValueError:
+            raise FriException('Node address %s is invalid! ' \
+                        'Port should be integer in range 0...65535'%node_address)
+        return hostname, port
 
+    def __connect_local(self, unix_path, conn_timeout):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(conn_timeout)
         try:
-            address = node_address.split(':')
-            if len(address) != 2:
-                raise FriException('Node address %s is invalid! ' \
-                            'Address should be in format <hostname>:<port>'%node_address)
-            hostname = address[0]
-            try:
-                port = int(address[1])
-                if 0 > port > 65535:
-                    raise ValueError()
-            except ValueError:
-                raise FriException('Node address %s is invalid! ' \
-                            'Port should be integer in range 0...65535'%node_address)
+            sock.connect(unix_path)
+            #server process should be of the same user (data is not encrypted)
+            check_peer_credentials(sock)
+        except (socket.error, FriException), err:
+            sock.close()
+            return None
+        return SocketProcessor(sock, self.certificate)
 
-            if not isinstance(packet, FabnetPacket):
-                raise Exception('FRI request packet should be an object of FabnetPacket')
+    def __connect(self, hostname, port, conn_timeout, link_params=None):
+        address = self.__conn_pool.resolve(hostname, port)
 
-            packet.session_id = self.session_id
+        if self.use_unix_socket:
+            unix_path = get_local_socket_path(address[0], port)
+            if unix_path:
+                #TCP connection is used if server does not accept unix socket connection
+                proc = self.__connect_local(unix_path, conn_timeout)
+                if proc:
+                    return proc
 
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(conn_timeout)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(conn_timeout)
+        if link_params:
+            #TCP window scale is negotiated while connect
+            tune_socket(sock, link_params.sock_buf_size)
 
+        try:
+            t0 = time.time()
+            sock.connect(address)
+            if self.__link_tuner:
+                #TCP handshake time is RTT sample of link (without server work)
+                self.__link_tuner.add_sample(hostname, 0, time.time() - t0)
             if self.is_ssl:
-                sock = ssl.wrap_socket(sock)
+                sock = wrap_client_socket(sock)
+        except socket.error, err:
+            self.__conn_pool.forget_address(hostname, port)
+            sock.close()
+            raise err
+
+        proc = SocketProcessor(sock, self.certificate)
+        proc.set_link_params(link_params)
+        return proc
+
+    def __int_call(self, node_address, packet, conn_timeout, read_timeout=None):
+        hostname, port = self.__parse_address(node_address)
+
+        if not isinstance(packet, FabnetPacket):
+            raise Exception('FRI request packet should be an object of FabnetPacket')
+
+        if not self.__link_tuner:
+            return self.__send_request(hostname, port, packet, conn_timeout, read_timeout)
 
-            sock.connect((hostname, port))
+        link_params = self.__link_tuner.get_params(hostname)
+        size = None
+        if packet.binary_data:
+            if link_params:
+                packet.binary_data.set_chunk_size(link_params.chunk_size)
+            size = packet.binary_data.size()
 
-            proc = SocketProcessor(sock, self.certificate)
+        packet.transfer_time = None
+        resp = self.__send_request(hostname, port, packet, conn_timeout, read_timeout, link_params)
+        #throughput sample is binary chunks sending time only
+        #(without connect, server processing and response waiting)
+        if size is not None and size >= FRI_LINK_MIN_TRANSFER_SIZE and packet.transfer_time:
+            self.__link_tuner.add_sample(hostname, size, packet.transfer_time)
+        return resp
 
-            sock.settimeout(read_timeout)
+    def __send_request(self, hostname, port, packet, conn_timeout, read_timeout, link_params=None):
+        packet.session_id = self.session_id
+        packet.keep_alive = True
+        if not self.is_ssl:
+            #SSL socket can not be read and written from different threads at once,
+            #so multiplexed protocol is used for plain connections only
+            packet.protocol_rev = FRI_PROTOCOL_REV
 
+        conn_key = (hostname, port, bool(self.is_ssl), self.__identity, self.session_id)
+        proc = self.__conn_pool.get(conn_key)
+        if proc:
+            try:
+                proc.set_link_params(link_params)
+                if proc.is_multiplexed():
+                    return proc.call(packet, read_timeout)
+                return self.__exchange(proc, conn_key, packet, read_timeout)
+            except MessageInFlight, err:
+                #same message is sent in parallel, so using dedicated connection
+                pass
+            except (FriConnectionClosed, socket.error), err:
+                #pooled connection can be closed by node while we are sending a packet
+                #(node does not read requests after close), so trying once again
+                #over new connection. Binary data is resent from first chunk
+                if isinstance(err, socket.timeout) or \
+                        (packet.binary_data and not packet.binary_data.rewind()):
+                    raise err
+
+        proc = self.__connect(hostname, port, conn_timeout, link_params)
+        return self.__exchange(proc, conn_key, packet, read_timeout)
+
+    def __exchange(self, proc, conn_key, packet, read_timeout):
+        try:
+            proc.settimeout(read_timeout)
             resp = proc.send_packet(packet, wait_response=True)
+        except Exception, err:
+            proc.close_socket(force=True)
+            raise err
 
-            return resp
-        finally:
-            if proc:
-                proc.close_socket()
+        if resp.keep_alive:
+            protocol_rev = resp.protocol_rev
+            proc.release_socket(lambda sock_proc: self.__release(conn_key, sock_proc, protocol_rev))
+        else:
+            proc.close_socket()
+        return resp
+
+    def __release(self, conn_key, sock_proc, protocol_rev):
+        sock_proc.protocol_rev = protocol_rev
+        if protocol_rev >= FRI_PROTOCOL_REV_MULTIPLEXED:
+            sock_proc = MultiplexedConnection(sock_proc)
+        self.__conn_pool.put(conn_key, sock_proc)
 
 
     def call(self, node_address, packet, timeout=FRI_CLIENT_TIMEOUT):
@@ -85,3 +428,26 @@ class FriClient:
         except Exception, err:
             return FabnetPacketResponse(ret_code=RC_ERROR, ret_message='[FriClient][%s] %s' % (err.__class__.__name__, err))
 
+    def call_many(self, node_addresses, packet, timeout=FRI_CLIENT_TIMEOUT):
+        """Send packets to many nodes concurrently (through I/O pool)
+        and return FriCallsGroup object with futures of calls.
+        packet - request packet for all nodes (copied for each node,
+        so it can not contain binary data) or list of packets (one for each node)
+        """
+        node_addresses = list(node_addresses)
+        if isinstance(packet, FabnetPacket):
+            if packet.binary_data and len(node_addresses) > 1:
+                raise FriException('Packet with binary data can not be sent to many nodes. '\
+                                    'Packet for each node should be specified')
+            packets = [packet.copy() for _ in node_addresses]
+        else:
+            packets = list(packet)
+            if len(packets) != len(node_addresses):
+                raise FriException('Packets count %s is differ to nodes count %s'%\
+                                    (len(packets), len(node_addresses)))
+
+        group = FriCallsGroup()
+        call_routine = lambda node_address, packet: self.call_sync(node_address, packet, timeout)
+        for node_address, packet in zip(node_addresses, packets):
+            self.__io_pool.submit(group._add(node_address, packet, call_routine))
+        return group
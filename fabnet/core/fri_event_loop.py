@@ -0,0 +1,410 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.core.fri_event_loop
+@author Konstantin Andrusenko
+@date July 25, 2013
+
+This module contains the implementation of FriEventLoopHandler class
+(epoll based front end of FRI server).
+Front end accepts connections and receives first packet of each
+connection in non-blocking mode, so slow clients do not hold FRI workers
+and workers count does not limit count of connections that are sending
+first packet.
+Binary chunks of first packet are received into spool file (in spool
+directory of SpooledBinaryData) by front end. Chunks are granted within
+node-wide budget (SocketProcessor.inflight_budget), but front end does not
+wait for budget: connection waits for it in loop and grant is retried.
+Connection with fully received packet (and sent pending output) is
+handed off to FRI workers as FramedConnection object.
+Front end does not get connection back from worker, so keep-alive and
+multiplexed connections are held by worker after first packet (idle
+connection is released by worker if there is no free worker for
+pending work, see wait_keep_alive).
+"""
+import os
+import time
+import errno
+import socket
+import select
+import threading
+import traceback
+from multiprocessing.queues import Queue
+from multiprocessing.reduction import reduce_handle
+
+from fabnet.utils.logger import core_logger as logger
+from fabnet.core.constants import S_ERROR, S_PENDING, S_INWORK, BUF_SIZE, \
+                    FRI_PACKET_INFO_LEN, RC_REQ_BINARY_CHUNK, FRI_FRAMING_TIMEOUT, \
+                    FRI_LISTEN_BACKLOG
+from fabnet.core.fri_base import FriBinaryProcessor, FabnetPacketResponse, \
+                    FriException, FriConnectionClosed, SpooledBinaryData
+from fabnet.core.socket_processor import SocketProcessor
+from fabnet.core.inflight_budget import StreamBudget
+
+EPOLL_SUPPORTED = hasattr(select, 'epoll')
+
+NONBLOCK_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+class FramedConnection:
+    """Connection handed off to FRI worker by event loop front end.
+    data - received data of connection (first packet),
+    spooled_path - path to file with binary chunks of first packet (or None)
+    held_bytes - bytes of spooled chunks held in node-wide budget
+                (they are released when binary data of packet is closed)
+    """
+    def __init__(self, sock, data, spooled_path=None, held_bytes=0):
+        self.sock = sock
+        self.data = data
+        self.spooled_path = spooled_path
+        self.held_bytes = held_bytes
+
+
+class FramingConnection:
+    """Connection which first packet is receiving by front end"""
+    def __init__(self, sock):
+        self.sock = sock
+        self.data = bytearray()
+        self.packet = None #raw first packet (if it is received)
+        self.chunks_cnt = 0
+        self.chunks_received = 0
+        self.chunks_granted = 0
+        self.window = 1 #chunks window (1 - lock-step transfer)
+        self.budget = None #StreamBudget object of binary chunks
+        self.budget_wait_start = None #time of first failed budget reservation
+        self.spool_fd = None
+        self.spooled_path = None
+        self.out_data = ''
+        self.is_framed = False #first packet is received (connection waits output flush)
+        self.events = select.EPOLLIN
+        self.last_activity = time.time()
+
+    def release_budget(self):
+        if self.budget:
+            self.budget.release()
+
+    def close_spool(self, remove=False):
+        if self.spool_fd is not None:
+            os.close(self.spool_fd)
+            self.spool_fd = None
+
+        if remove and self.spooled_path:
+            if os.path.exists(self.spooled_path):
+                os.remove(self.spooled_path)
+            self.spooled_path = None
+
+
+class FriEventLoopHandler(threading.Thread):
+    def __init__(self, host, port, queue):
+        threading.Thread.__init__(self)
+        self.queue = queue
+        if type(queue) == Queue:
+            self.need_reduce = True
+        else:
+            self.need_reduce = False
+        self.hostname = host
+        self.port = port
+        self.stopped = threading.Event()
+        self.status = S_PENDING
+        self.sock = None
+        self.__epoll = None
+        self.__connections = {}
+        self.__waiting_budget = {} #connections waiting for chunks grant budget
+
+    def __bind_socket(self):
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sock.bind((self.hostname, self.port))
+            self.sock.listen(FRI_LISTEN_BACKLOG)
+            self.sock.setblocking(0)
+
+            self.__epoll = select.epoll()
+            self.__epoll.register(self.sock.fileno(), select.EPOLLIN)
+        except Exception, err:
+            self.status = S_ERROR
+            logger.error('[__bind_socket] %s'%err)
+        else:
+            self.status = S_INWORK
+
+    def run(self):
+        logger.info('Starting event loop handler thread...')
+        self.__bind_socket()
+        if self.status == S_ERROR:
+            return
+        logger.info('Event loop handler thread started!')
+
+        listen_fd = self.sock.fileno()
+        last_check = time.time()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    events = self.__epoll.poll(.1 if self.__waiting_budget else 1)
+                except IOError, err:
+                    if err.errno == errno.EINTR:
+                        continue
+                    raise err
+
+                for fd, event in events:
+                    if fd == listen_fd:
+                        self.__accept()
+                    else:
+                        self.__handle_event(fd, event)
+
+                for fd in self.__waiting_budget.keys():
+                    self.__retry_grant(fd)
+
+                if time.time() - last_check >= 1:
+                    self.__check_timeouts()
+                    last_check = time.time()
+        except Exception, err:
+            logger.write = logger.debug
+            traceback.print_exc(file=logger)
+            logger.error('[FriEventLoopHandler.run] %s'%err)
+
+        for fd in self.__connections.keys():
+            self.__close(fd)
+        self.__epoll.close()
+        #listening socket is inherited by forked processes,
+        #so it should be shut down (not only closed)
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+        del self.sock
+
+        logger.info('Event loop handler thread stopped!')
+
+    def stop(self):
+        self.stopped.set()
+
+    def __accept(self):
+        while True:
+            try:
+                sock, addr = self.sock.accept()
+            except socket.error, err:
+                if err.errno in NONBLOCK_ERRORS:
+                    return
+                if err.errno in (errno.EMFILE, errno.ENFILE, errno.ECONNABORTED):
+                    logger.error('[FriEventLoopHandler.accept] %s'%err)
+                    return
+                raise err
+
+            sock.setblocking(0)
+            self.__connections[sock.fileno()] = FramingConnection(sock)
+            self.__epoll.register(sock.fileno(), select.EPOLLIN)
+
+    def __handle_event(self, fd, event):
+        conn = self.__connections.get(fd, None)
+        if conn is None:
+            return
+
+        try:
+            if event & select.EPOLLOUT:
+                self.__flush(conn)
+            if conn.is_framed or fd not in self.__connections:
+                #connection is handed off or waits output flush
+                return
+            if event & (select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR):
+                self.__recv(conn)
+        except FriConnectionClosed, err:
+            logger.debug('[FriEventLoopHandler] %s'%err)
+            self.__close(fd)
+        except Exception, err:
+            logger.error('[FriEventLoopHandler] %s'%err)
+            self.__close(fd)
+
+    def __recv(self, conn):
+        try:
+            data = conn.sock.recv(BUF_SIZE)
+        except socket.error, err:
+            if err.errno in NONBLOCK_ERRORS:
+                return
+            raise err
+
+        if not data:
+            if conn.data or conn.packet:
+                raise FriException('Invalid FRI packet! Connection is closed while packet receiving')
+            raise FriConnectionClosed('connection is closed by peer')
+
+        conn.last_activity = time.time()
+        conn.data += data
+        self.__process_data(conn)
+
+    def __process_data(self, conn):
+        """Parse received packets. First packet is kept as is,
+        binary chunks packets are written to spool file"""
+        while len(conn.data) >= FRI_PACKET_INFO_LEN:
+            exp_len, header_len = FriBinaryProcessor.get_expected_len(str(conn.data[:FRI_PACKET_INFO_LEN]))
+            if len(conn.data) < exp_len:
+                return
+
+            if conn.packet is None:
+                conn.packet = str(conn.data[:exp_len])
+                del conn.data[:exp_len]
+                header, bin_data = FriBinaryProcessor.from_binary(conn.packet, exp_len, header_len)
+                conn.chunks_cnt = header.get('binary_chunk_cnt', 0)
+                if not conn.chunks_cnt or bin_data:
+                    #worker validates packet with binary data in init chunk packet
+                    break
+                self.__start_spooling(conn, header)
+                continue
+
+            header, bin_data = FriBinaryProcessor.from_binary(buffer(conn.data, 0, exp_len), \
+                                                                exp_len, header_len)
+            del conn.data[:exp_len]
+            if header.get('binary_chunk_idx', 0) != conn.chunks_received + 1:
+                raise FriException('Unexpected binary chunk index %s (expected %s)'%\
+                                (header.get('binary_chunk_idx', 0), conn.chunks_received + 1))
+            os.write(conn.spool_fd, bin_data)
+            conn.chunks_received += 1
+            conn.budget.received(len(bin_data))
+            if conn.chunks_received == conn.chunks_cnt:
+                break
+
+            self.__grant_chunks(conn)
+        else:
+            return
+
+        #connection is handed off when pending output is sent
+        conn.is_framed = True
+        self.__flush(conn)
+
+    def __start_spooling(self, conn, header):
+        conn.spool_fd, conn.spooled_path = SpooledBinaryData.make_spool_file()
+        conn.window = max(min(header.get('binary_chunk_window', 0), SocketProcessor.chunks_window), 1)
+        conn.budget = StreamBudget(SocketProcessor.inflight_budget, conn.chunks_cnt)
+        if 'method' in header:
+            #sender of request waits allow packet before chunks sending
+            self.__send(conn, FabnetPacketResponse().dump())
+        self.__grant_chunks(conn)
+
+    def __grant_chunks(self, conn):
+        """Grant chunks of window within budget (see SocketBasedChunks),
+        sender without chunks window support requests each chunk.
+        Connection without granted chunks for receiving waits for budget
+        in __waiting_budget (chunks are granted without budget after
+        budget wait timeout)"""
+        if conn.chunks_granted >= conn.chunks_cnt:
+            return
+
+        outstanding = conn.chunks_granted - conn.chunks_received
+        credits = min(conn.window - outstanding, conn.chunks_cnt - conn.chunks_granted)
+        if credits <= 0:
+            return
+
+        fd = conn.sock.fileno()
+        if not conn.budget.reserve(credits, wait=False, wait_start=conn.budget_wait_start):
+            if outstanding == 0:
+                if conn.budget_wait_start is None:
+                    conn.budget_wait_start = time.time()
+                self.__waiting_budget[fd] = conn
+            return
+
+        conn.budget_wait_start = None
+        self.__waiting_budget.pop(fd, None)
+        if conn.window == 1:
+            packet = FabnetPacketResponse(ret_code=RC_REQ_BINARY_CHUNK)
+        else:
+            packet = FabnetPacketResponse(ret_code=RC_REQ_BINARY_CHUNK, \
+                                ret_parameters={'credits': credits})
+        conn.chunks_granted += credits
+        self.__send(conn, packet.dump())
+
+    def __retry_grant(self, fd):
+        conn = self.__waiting_budget.pop(fd, None)
+        if conn is None:
+            return
+
+        try:
+            self.__grant_chunks(conn)
+        except Exception, err:
+            logger.error('[FriEventLoopHandler] %s'%err)
+            self.__close(fd)
+
+    def __send(self, conn, data):
+        conn.out_data += data
+        self.__flush(conn)
+
+    def __flush(self, conn):
+        while conn.out_data:
+            try:
+                sent = conn.sock.send(conn.out_data)
+            except socket.error, err:
+                if err.errno in NONBLOCK_ERRORS:
+                    break
+                raise err
+            conn.out_data = conn.out_data[sent:]
+            conn.last_activity = time.time()
+
+        if conn.is_framed:
+            if not conn.out_data:
+                self.__handoff(conn)
+                return
+            events = select.EPOLLOUT
+        else:
+            events = select.EPOLLIN
+            if conn.out_data:
+                events |= select.EPOLLOUT
+        if events != conn.events:
+            self.__epoll.modify(conn.sock.fileno(), events)
+            conn.events = events
+
+    def __handoff(self, conn):
+        sock = conn.sock
+        fd = sock.fileno()
+        self.__epoll.unregister(fd)
+        del self.__connections[fd]
+
+        held = 0
+        try:
+            sock.setblocking(1)
+            conn.close_spool()
+            if conn.budget:
+                held = conn.budget.handoff()
+
+            if self.need_reduce:
+                handle = reduce_handle(fd)
+                sock.close()
+            else:
+                handle = sock
+
+            self.queue.put(FramedConnection(handle, conn.packet + str(conn.data), \
+                                conn.spooled_path, held))
+        except Exception, err:
+            logger.error('[FriEventLoopHandler.handoff] %s'%err)
+            if held:
+                SocketProcessor.inflight_budget.release(0, held)
+            conn.close_spool(remove=True)
+            sock.close()
+
+    def __close(self, fd):
+        conn = self.__connections.pop(fd, None)
+        if conn is None:
+            return
+
+        self.__waiting_budget.pop(fd, None)
+        try:
+            self.__epoll.unregister(fd)
+        except IOError:
+            pass
+        conn.release_budget()
+        conn.close_spool(remove=True)
+        try:
+            conn.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        conn.sock.close()
+
+    def __check_timeouts(self):
+        min_time = time.time() - FRI_FRAMING_TIMEOUT
+        for fd, conn in self.__connections.items():
+            if fd in self.__waiting_budget:
+                #connection waits for budget (not for peer)
+                continue
+            if conn.last_activity < min_time:
+                logger.debug('[FriEventLoopHandler] first packet is not framed in %s seconds'%\
+                                FRI_FRAMING_TIMEOUT)
+                self.__close(fd)
@@ -10,6 +10,10 @@ Copyright (C) 2013 Konstantin Andrusenko
 
 This module contains the implementation of FriServer class.
 """
+import os
+import sys
+import stat
+import struct
 import socket
 import threading
 import traceback
@@ -18,24 +22,134 @@ from multiprocessing.queues import Queue
 from multiprocessing.reduction import reduce_handle
 
 from fabnet.utils.logger import core_logger as logger
-from fabnet.core.constants import S_ERROR, S_PENDING, S_INWORK
+from fabnet.core.constants import S_ERROR, S_PENDING, S_INWORK, FRI_LISTEN_BACKLOG, \
+                                    FRI_UNIX_SOCKET_NAME
+from fabnet.core.fri_event_loop import FriEventLoopHandler, EPOLL_SUPPORTED
+from fabnet.core.fri_base import FriException
 
+#socket module of python 2.x does not define SO_REUSEPORT (linux >= 3.9)
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15 if sys.platform.startswith('linux') else None)
+REUSEPORT_SUPPORTED = SO_REUSEPORT is not None
+
+#peer credentials of unix socket connections are checked by SO_PEERCRED (linux only)
+UNIX_SOCKET_SUPPORTED = hasattr(socket, 'AF_UNIX') and sys.platform.startswith('linux')
+
+#socket module of python 2.x does not define SO_PEERCRED (linux only option)
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+PEERCRED_STRUCT = struct.Struct('3i')
+
+#private directory of unix sockets (see set_unix_socket_dir)
+UNIX_SOCKET_DIR = None
+
+
+def set_unix_socket_dir(socket_dir):
+    """Set directory of FRI servers unix sockets (it is created with 0700 mode).
+    Unix sockets are not used if directory is not set or it is not
+    private directory of current user"""
+    global UNIX_SOCKET_DIR
+    UNIX_SOCKET_DIR = None
+    if not socket_dir:
+        return
+
+    try:
+        if not os.path.exists(socket_dir):
+            os.makedirs(socket_dir, 0700)
+        st = os.lstat(socket_dir)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+            raise FriException('%s is not directory of current user'%socket_dir)
+        if stat.S_IMODE(st.st_mode) != 0700:
+            os.chmod(socket_dir, 0700)
+    except Exception, err:
+        logger.error('Unix sockets directory is not set: %s'%err)
+        return
+    UNIX_SOCKET_DIR = socket_dir
+
+def get_unix_socket_path(hostname, port):
+    """Return path to unix socket of FRI server that
+    listens hostname:port (None if sockets directory is not set)"""
+    if not UNIX_SOCKET_DIR:
+        return None
+    return os.path.join(UNIX_SOCKET_DIR, FRI_UNIX_SOCKET_NAME%(hostname, port))
+
+def check_peer_credentials(sock):
+    """Peer of unix socket connection should be process
+    of the same user (or root)"""
+    pid, uid, gid = PEERCRED_STRUCT.unpack(sock.getsockopt(socket.SOL_SOCKET, \
+                                            SO_PEERCRED, PEERCRED_STRUCT.size))
+    if uid not in (0, os.getuid()):
+        raise FriException('Unix socket connection with process %s (uid=%s) is not allowed'%(pid, uid))
+
+
+class LocalConnection:
+    """Connection accepted on unix socket of FRI server
+    (is handed off to FRI workers instead of socket)"""
+    def __init__(self, sock):
+        self.sock = sock
+
+
+def bind_reuseport_socket(hostname, port, listen=True):
+    """Bind socket with SO_REUSEPORT option.
+    Many processes can listen the same port in this case,
+    incoming connections are balanced between them by kernel"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.bind((hostname, port))
+        if listen:
+            sock.listen(FRI_LISTEN_BACKLOG)
+    except Exception, err:
+        sock.close()
+        raise err
+    return sock
 
 
 class FriServer:
-    def __init__(self, hostname, port, workers_manager, server_name='fri-node'):
+    def __init__(self, hostname, port, workers_manager, server_name='fri-node', \
+                    event_loop=False, reuse_port=False, unix_socket=False):
+        """If event_loop is True, first packet of each connection is received by
+        epoll based front end (FriEventLoopHandler) before handoff to workers.
+        Front end does not support SSL connections.
+        If reuse_port is True, each process based worker binds own
+        SO_REUSEPORT socket and accepts connections itself (without
+        connection handler thread and sockets passing through the queue)
+        If unix_socket is True, server listens unix socket in private directory
+        (see set_unix_socket_dir) in addition to TCP socket. FriClient uses it for calls from the same host,
+        these connections are not wrapped by SSL"""
         self.hostname = hostname
         self.port = port
         self.workers_manager = workers_manager
 
         self.stopped = True
 
-        self.__conn_handler_thread = FriConnectionHandler(hostname, port, self.workers_manager.get_queue())
-        self.__conn_handler_thread.setName('%s-FriConnectionHandler'%(server_name,))
+        self.__unix_handler_thread = None
+        unix_path = get_unix_socket_path(hostname, port)
+        if unix_socket and unix_path and UNIX_SOCKET_SUPPORTED:
+            self.__unix_handler_thread = FriConnectionHandler(hostname, port, \
+                            self.workers_manager.get_queue(), unix_path)
+            self.__unix_handler_thread.setName('%s-FriUnixConnectionHandler'%server_name)
+
+        self.__reuse_port = reuse_port and REUSEPORT_SUPPORTED \
+                                and not workers_manager.worker_class.is_threaded
+        if self.__reuse_port:
+            self.__conn_handler_thread = None
+            self.workers_manager.set_listen_address((hostname, port))
+            return
+
+        if event_loop and EPOLL_SUPPORTED:
+            handler_class = FriEventLoopHandler
+        else:
+            handler_class = FriConnectionHandler
+        self.__conn_handler_thread = handler_class(hostname, port, self.workers_manager.get_queue())
+        self.__conn_handler_thread.setName('%s-%s'%(server_name, handler_class.__name__))
 
     def start(self):
         self.stopped = False
 
+        if self.__reuse_port:
+            return self.__start_reuse_port()
+
         self.workers_manager.start_carefully()
         self.__conn_handler_thread.start()
 
@@ -47,26 +161,78 @@ class FriServer:
             logger.error('FriServer does not started!')
             return False
         else:
+            self.__start_unix_handler()
             logger.info('FriServer is started!')
             return True
 
+    def __start_unix_handler(self):
+        """Unix socket is optional, so server works
+        over TCP socket only if unix socket is not bound"""
+        if not self.__unix_handler_thread:
+            return
+
+        self.__unix_handler_thread.start()
+        while self.__unix_handler_thread.status == S_PENDING:
+            time.sleep(.1)
+
+        if self.__unix_handler_thread.status == S_ERROR:
+            logger.warning('FriServer does not listen unix socket')
+            self.__unix_handler_thread = None
+
+    def __start_reuse_port(self):
+        try:
+            #check that address can be bound before workers start
+            bind_reuseport_socket(self.hostname, self.port, listen=False).close()
+        except Exception, err:
+            logger.error('[FriServer] %s'%err)
+            self.stopped = True
+            logger.error('FriServer does not started!')
+            return False
+
+        self.workers_manager.start_carefully()
+        self.__start_unix_handler()
+        logger.info('FriServer is started (SO_REUSEPORT mode)!')
+        return True
+
     def stop(self):
         if self.stopped:
             return
 
         logger.info('stopping FriServer...')
-        self.__conn_handler_thread.stop()
+        if self.__unix_handler_thread and self.__unix_handler_thread.is_alive():
+            self.__stop_handler(self.__unix_handler_thread)
+
+        if self.__reuse_port:
+            self.stopped = True
+            self.workers_manager.stop()
+            logger.info('FriServer is stopped!')
+            return
+
+        self.__stop_handler(self.__conn_handler_thread)
+        self.stopped = True
+        self.workers_manager.stop()
+        logger.info('FriServer is stopped!')
+
+    def __stop_handler(self, handler_thread):
+        """Stop connection handler thread
+        (connection is opened for handler wake up from accept())"""
+        handler_thread.stop()
         sock = None
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(1.0)
-
-            if self.hostname == '0.0.0.0':
-                hostname = '127.0.0.1'
+            if getattr(handler_thread, 'unix_path', None):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(1.0)
+                sock.connect(handler_thread.unix_path)
             else:
-                hostname = self.hostname
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.settimeout(1.0)
 
-            sock.connect((hostname, self.port))
+                if self.hostname == '0.0.0.0':
+                    hostname = '127.0.0.1'
+                else:
+                    hostname = self.hostname
+
+                sock.connect((hostname, self.port))
         except socket.error:
             pass
         finally:
@@ -74,14 +240,13 @@ class FriServer:
                 sock.close()
                 del sock
 
-        self.__conn_handler_thread.join()
-        self.stopped = True
-        self.workers_manager.stop()
-        logger.info('FriServer is stopped!')
+        handler_thread.join()
 
 
 class FriConnectionHandler(threading.Thread):
-    def __init__(self, host, port, queue):
+    def __init__(self, host, port, queue, unix_path=None):
+        """If unix_path is specified, connections are accepted on unix socket
+        and are handed off to workers as LocalConnection objects"""
         threading.Thread.__init__(self)
         self.queue = queue
         if type(queue) == Queue:
@@ -90,17 +255,35 @@ class FriConnectionHandler(threading.Thread):
             self.need_reduce = False
         self.hostname = host
         self.port = port
+        self.unix_path = unix_path
         self.stopped = threading.Event()
         self.status = S_PENDING
         self.sock = None
 
     def __bind_socket(self):
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-            self.sock.bind((self.hostname, self.port))
-            self.sock.listen(5)
+            if self.unix_path:
+                if os.path.lexists(self.unix_path):
+                    try:
+                        os.remove(self.unix_path)
+                    except OSError, err:
+                        #clients would connect to file that is not our socket
+                        raise FriException('Stale unix socket %s can not be removed (%s), ' \
+                                    'unix socket is not listened!'%(self.unix_path, err))
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                #only processes of the same user can connect to server over unix socket
+                old_umask = os.umask(0077)
+                try:
+                    self.sock.bind(self.unix_path)
+                finally:
+                    os.umask(old_umask)
+                self.sock.listen(FRI_LISTEN_BACKLOG)
+            else:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.sock.bind((self.hostname, self.port))
+                self.sock.listen(5)
         except Exception, err:
             self.status = S_ERROR
             logger.error('[__bind_socket] %s'%err)
@@ -130,6 +313,8 @@ class FriConnectionHandler(threading.Thread):
                 if self.need_reduce:
                     sock = reduce_handle(sock.fileno())
 
+                if self.unix_path:
+                    sock = LocalConnection(sock)
                 self.queue.put(sock)
             except Exception, err:
                 logger.write = logger.debug
@@ -140,6 +325,8 @@ class FriConnectionHandler(threading.Thread):
             self.sock.shutdown(socket.SHUT_RDWR)
             self.sock.close()
             del self.sock
+        if self.unix_path and os.path.exists(self.unix_path):
+            os.remove(self.unix_path)
 
         logger.info('Connection handler thread stopped!')
 
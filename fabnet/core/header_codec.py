@@ -0,0 +1,431 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.core.header_codec
+@author Konstantin Andrusenko
+@date July 12, 2013
+
+This module contains the implementation of FRI packet header codecs.
+Header codec is selected by protocol identifier in packet info:
+    FRI_PROTOCOL_IDENTIFIER - JSON header (default, understood by all nodes)
+    FRI_BIN_HEADER_IDENTIFIER - compact binary header (BinaryHeaderCodec)
+    FRI_COMPRESSED_IDENTIFIER - compact binary header, packet body is compressed
+
+Binary header is a tagged values stream:
+    - well known field names (and other frequent strings) are interned
+      and encoded by one byte index
+    - integers are encoded natively (160-bit keys as 20 raw bytes)
+    - lowercase hex strings (keys, checksums) and UUID strings
+      (message ids) are encoded as raw bytes
+Decoded header is equal to JSON decoded header except strings
+that are returned as str objects (instead of unicode)
+
+Packet parameters (LAZY_HEADER_KEYS items) of binary header can be decoded
+lazily: they are skipped while header decoding and kept as LazyHeaderValue
+objects (encoded value). Not decoded value is written back as is
+when header is encoded by BinaryHeaderCodec (transit packets forwarding)
+"""
+import json
+import struct
+import re
+from binascii import hexlify, unhexlify
+
+from constants import FRI_PROTOCOL_IDENTIFIER, FRI_BIN_HEADER_IDENTIFIER, FRI_COMPRESSED_IDENTIFIER
+
+#interned strings. NEVER remove or reorder items in this list - append only!
+#(index of string is a part of binary header format)
+INTERNED_STRINGS = ('message_id', 'session_id', 'method', 'sender', 'sync', 'parameters',
+        'is_multicast', 'ret_code', 'ret_message', 'ret_parameters', 'from_node',
+        'binary_chunk_idx', 'binary_chunk_cnt', 'keep_alive', 'protocol_rev', 'ok',
+        'key', 'primary_key', 'replica_count', 'checksum', 'is_replica', 'user_id',
+        'carefully_save', 'wait_writes_count', 'node_address', 'node_name', 'node_type',
+        'home_dir', 'upper_neighbours', 'superior_neighbours', 'neighbour_type',
+        'operation', 'need_rebalance', 'start_key', 'end_key', 'ranges_table', 'mod_index',
+        'keys', 'data', 'event_type', 'event_topic', 'event_message', 'event_provider',
+        'reset_op_stat', 'base_info', 'ret_status', 'status', 'workers', 'busy',
+        'threads', 'memory', 'PutDataBlock', 'GetDataBlock', 'ClientPutData', 'ClientGetData',
+        'GetKeysInfo', 'CheckHashRangeTable', 'GetRangesTable', 'UpdateHashRangeTable',
+        'TopologyCognition', 'NodeStatistic', 'ManageNeighbour', 'DiscoveryOperation',
+        'NotifyOperation', 'KeepAlive', 'Base', 'DHT', 'binary_chunk_window', 'credits')
+
+
+T_NONE = 'N'
+T_TRUE = 'T'
+T_FALSE = 'F'
+T_INT8 = 'b'
+T_INT32 = 'i'
+T_INT64 = 'q'
+T_BIGINT = 'L'
+T_NEG_BIGINT = 'M'
+T_FLOAT = 'd'
+T_STR = 's'
+T_LONG_STR = 'S'
+T_UNICODE = 'u'
+T_LONG_UNICODE = 'U'
+T_INTERNED = 'f'
+T_HEX = 'x'
+T_UUID = 'g'
+T_LIST = 'l'
+T_LONG_LIST = 'A'
+T_DICT = 'm'
+T_LONG_DICT = 'D'
+
+#values of these top level header items are decoded on demand (see LazyHeaderValue)
+LAZY_HEADER_KEYS = frozenset(('parameters', 'ret_parameters'))
+
+INTERNED_ENCODED = dict((s, T_INTERNED + chr(i)) for i, s in enumerate(INTERNED_STRINGS))
+
+MIN_HEX_LEN = 16
+MAX_HEX_LEN = 510
+
+RE_HEX = re.compile('^[0-9a-f]+$')
+RE_UUID = re.compile('^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+ST_UINT = struct.Struct('<I')
+ST_INT8 = struct.Struct('<b')
+ST_INT32 = struct.Struct('<i')
+ST_INT64 = struct.Struct('<q')
+ST_FLOAT = struct.Struct('<d')
+
+
+#sizes of values that are skipped without decoding (see _skip)
+FIXED_SIZES = {T_NONE: 0, T_TRUE: 0, T_FALSE: 0, T_INT8: 1, T_INT32: 4, T_INT64: 8,
+                T_FLOAT: 8, T_INTERNED: 1, T_UUID: 16}
+SHORT_SIZED = frozenset((T_STR, T_HEX, T_UNICODE, T_BIGINT, T_NEG_BIGINT))
+LONG_SIZED = frozenset((T_LONG_STR, T_LONG_UNICODE))
+
+
+class HeaderCodecException(Exception):
+    pass
+
+
+class LazyHeaderValue(object):
+    """Binary encoded header value that is not decoded yet"""
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def value(self):
+        try:
+            val, pos = _decode(self.raw, 0)
+        except (IndexError, struct.error):
+            raise HeaderCodecException('header value is truncated')
+        if pos != len(self.raw):
+            raise HeaderCodecException('%s unexpected bytes at the end of header value'%(len(self.raw)-pos))
+        return val
+
+    def __reduce__(self):
+        return (LazyHeaderValue, (self.raw,))
+
+    def __nonzero__(self):
+        return self.raw not in (T_DICT + '\x00', T_LIST + '\x00')
+
+    def __eq__(self, other):
+        if isinstance(other, LazyHeaderValue):
+            return self.raw == other.raw
+        return self.value() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.value())
+
+
+def _encode_str(val, write):
+    encoded = INTERNED_ENCODED.get(val, None)
+    if encoded is not None:
+        write(encoded)
+        return
+
+    v_len = len(val)
+    if v_len == 36 and val[8] == '-' and RE_UUID.match(val):
+        write(T_UUID + unhexlify(val.replace('-', '')))
+    elif MIN_HEX_LEN <= v_len <= MAX_HEX_LEN and not v_len & 1 and RE_HEX.match(val):
+        write(T_HEX + chr(v_len / 2) + unhexlify(val))
+    elif type(val) is unicode:
+        val = val.encode('utf8')
+        if len(val) < 256:
+            write(T_UNICODE + chr(len(val)) + val)
+        else:
+            write(T_LONG_UNICODE + ST_UINT.pack(len(val)) + val)
+    elif v_len < 256:
+        write(T_STR + chr(v_len) + val)
+    else:
+        write(T_LONG_STR + ST_UINT.pack(v_len) + val)
+
+def _encode_int(val, write):
+    if -128 <= val < 128:
+        write(T_INT8 + ST_INT8.pack(val))
+    elif -2147483648 <= val < 2147483648:
+        write(T_INT32 + ST_INT32.pack(val))
+    elif -9223372036854775808 <= val < 9223372036854775808:
+        write(T_INT64 + ST_INT64.pack(val))
+    else:
+        tag = T_BIGINT
+        if val < 0:
+            tag = T_NEG_BIGINT
+            val = -val
+        h_val = '%x'%val
+        if len(h_val) & 1:
+            h_val = '0' + h_val
+        raw = unhexlify(h_val)
+        write(tag + chr(len(raw)) + raw)
+
+def _encode(val, write):
+    v_type = type(val)
+    if v_type is str or v_type is unicode:
+        _encode_str(val, write)
+    elif v_type is dict:
+        if len(val) < 256:
+            write(T_DICT + chr(len(val)))
+        else:
+            write(T_LONG_DICT + ST_UINT.pack(len(val)))
+        for key, item in val.iteritems():
+            encoded = INTERNED_ENCODED.get(key, None)
+            if encoded is not None:
+                write(encoded)
+            else:
+                if type(key) not in (str, unicode):
+                    #the same key conversion as in JSON
+                    if key is not None and type(key) not in (int, long, float, bool):
+                        raise HeaderCodecException('key %r is not a string'%(key,))
+                    key = json.dumps(key)
+                _encode_str(key, write)
+            _encode(item, write)
+    elif v_type is bool:
+        write(T_TRUE if val else T_FALSE)
+    elif v_type is int or v_type is long:
+        _encode_int(val, write)
+    elif v_type is list or v_type is tuple:
+        if len(val) < 256:
+            write(T_LIST + chr(len(val)))
+        else:
+            write(T_LONG_LIST + ST_UINT.pack(len(val)))
+        for item in val:
+            _encode(item, write)
+    elif val is None:
+        write(T_NONE)
+    elif v_type is float:
+        write(T_FLOAT + ST_FLOAT.pack(val))
+    elif v_type is LazyHeaderValue:
+        write(val.raw)
+    elif isinstance(val, dict):
+        _encode(dict(val), write)
+    elif isinstance(val, (list, tuple)):
+        _encode(list(val), write)
+    elif isinstance(val, basestring):
+        _encode_str(val, write)
+    else:
+        raise HeaderCodecException('%r is not serializable'%(val,))
+
+
+def _decode(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == T_INTERNED:
+        return INTERNED_STRINGS[ord(data[pos])], pos+1
+    if tag == T_STR:
+        end = pos + 1 + ord(data[pos])
+        return data[pos+1:end], end
+    if tag == T_DICT or tag == T_LONG_DICT:
+        if tag == T_DICT:
+            cnt = ord(data[pos])
+            pos += 1
+        else:
+            cnt, = ST_UINT.unpack_from(data, pos)
+            pos += 4
+        ret = {}
+        for i in xrange(cnt):
+            key, pos = _decode(data, pos)
+            ret[key], pos = _decode(data, pos)
+        return ret, pos
+    if tag == T_INT8:
+        return ST_INT8.unpack_from(data, pos)[0], pos+1
+    if tag == T_INT32:
+        return ST_INT32.unpack_from(data, pos)[0], pos+4
+    if tag == T_HEX:
+        end = pos + 1 + ord(data[pos])
+        return hexlify(data[pos+1:end]), end
+    if tag == T_UUID:
+        h_val = hexlify(data[pos:pos+16])
+        return '%s-%s-%s-%s-%s'%(h_val[:8], h_val[8:12], h_val[12:16], h_val[16:20], h_val[20:]), pos+16
+    if tag == T_TRUE:
+        return True, pos
+    if tag == T_FALSE:
+        return False, pos
+    if tag == T_NONE:
+        return None, pos
+    if tag == T_LIST or tag == T_LONG_LIST:
+        if tag == T_LIST:
+            cnt = ord(data[pos])
+            pos += 1
+        else:
+            cnt, = ST_UINT.unpack_from(data, pos)
+            pos += 4
+        ret = []
+        for i in xrange(cnt):
+            item, pos = _decode(data, pos)
+            ret.append(item)
+        return ret, pos
+    if tag == T_LONG_STR:
+        s_len, = ST_UINT.unpack_from(data, pos)
+        end = pos + 4 + s_len
+        return data[pos+4:end], end
+    if tag == T_UNICODE:
+        end = pos + 1 + ord(data[pos])
+        return data[pos+1:end].decode('utf8'), end
+    if tag == T_LONG_UNICODE:
+        s_len, = ST_UINT.unpack_from(data, pos)
+        end = pos + 4 + s_len
+        return data[pos+4:end].decode('utf8'), end
+    if tag == T_INT64:
+        return ST_INT64.unpack_from(data, pos)[0], pos+8
+    if tag == T_BIGINT or tag == T_NEG_BIGINT:
+        end = pos + 1 + ord(data[pos])
+        val = long(hexlify(data[pos+1:end]), 16)
+        if tag == T_NEG_BIGINT:
+            val = -val
+        return val, end
+    if tag == T_FLOAT:
+        return ST_FLOAT.unpack_from(data, pos)[0], pos+8
+
+    raise HeaderCodecException('unknown tag "%s" at position %s'%(tag, pos-1))
+
+def _skip(data, pos):
+    """Return position of data after encoded value (value is not decoded)"""
+    pending = 1
+    while pending:
+        tag = data[pos]
+        pos += 1
+        pending -= 1
+        size = FIXED_SIZES.get(tag, None)
+        if size is not None:
+            pos += size
+        elif tag in SHORT_SIZED:
+            pos += 1 + ord(data[pos])
+        elif tag in LONG_SIZED:
+            pos += 4 + ST_UINT.unpack_from(data, pos)[0]
+        elif tag == T_DICT:
+            pending += 2 * ord(data[pos])
+            pos += 1
+        elif tag == T_LIST:
+            pending += ord(data[pos])
+            pos += 1
+        elif tag == T_LONG_DICT:
+            pending += 2 * ST_UINT.unpack_from(data, pos)[0]
+            pos += 4
+        elif tag == T_LONG_LIST:
+            pending += ST_UINT.unpack_from(data, pos)[0]
+            pos += 4
+        else:
+            raise HeaderCodecException('unknown tag "%s" at position %s'%(tag, pos-1))
+    return pos
+
+def _decode_lazy(data):
+    """Decode header. Dict values of LAZY_HEADER_KEYS items
+    are returned as LazyHeaderValue objects"""
+    tag = data[0]
+    if tag == T_DICT:
+        cnt = ord(data[1])
+        pos = 2
+    elif tag == T_LONG_DICT:
+        cnt, = ST_UINT.unpack_from(data, 1)
+        pos = 5
+    else:
+        return _decode(data, 0)
+
+    ret = {}
+    for i in xrange(cnt):
+        key, pos = _decode(data, pos)
+        if key in LAZY_HEADER_KEYS and data[pos] in (T_DICT, T_LONG_DICT):
+            end = _skip(data, pos)
+            ret[key] = LazyHeaderValue(data[pos:end])
+            pos = end
+        else:
+            ret[key], pos = _decode(data, pos)
+    return ret, pos
+
+def _json_default(val):
+    if type(val) is LazyHeaderValue:
+        return val.value()
+    raise TypeError('%r is not JSON serializable'%(val,))
+
+
+class JsonHeaderCodec:
+    PROTOCOL_IDENTIFIER = FRI_PROTOCOL_IDENTIFIER
+
+    @classmethod
+    def encode(cls, header_obj):
+        return json.dumps(header_obj, default=_json_default)
+
+    @classmethod
+    def decode(cls, header, lazy=False):
+        """JSON header is decoded entirely (lazy flag is ignored)"""
+        return json.loads(header)
+
+    @classmethod
+    def append_item(cls, header, key, value):
+        """Append item to encoded header (without header re-encoding)"""
+        if header == '{}':
+            return json.dumps({key: value})
+        return '%s, %s: %s}'%(header[:-1], json.dumps(key), json.dumps(value, default=_json_default))
+
+
+class BinaryHeaderCodec:
+    PROTOCOL_IDENTIFIER = FRI_BIN_HEADER_IDENTIFIER
+
+    @classmethod
+    def encode(cls, header_obj):
+        ret = []
+        _encode(header_obj, ret.append)
+        return ''.join(ret)
+
+    @classmethod
+    def decode(cls, header, lazy=False):
+        try:
+            if lazy:
+                header_obj, pos = _decode_lazy(header)
+            else:
+                header_obj, pos = _decode(header, 0)
+        except (IndexError, struct.error):
+            raise HeaderCodecException('header is truncated')
+        if pos != len(header):
+            raise HeaderCodecException('%s unexpected bytes at the end of header'%(len(header)-pos))
+        return header_obj
+
+    @classmethod
+    def append_item(cls, header, key, value):
+        """Append item to encoded header (without header re-encoding)"""
+        if header[0] == T_DICT:
+            cnt = ord(header[1])
+            items = header[2:]
+        elif header[0] == T_LONG_DICT:
+            cnt, = ST_UINT.unpack_from(header, 1)
+            items = header[5:]
+        else:
+            raise HeaderCodecException('encoded header is not a dict')
+
+        ret = []
+        if cnt < 255:
+            ret.append(T_DICT + chr(cnt+1))
+        else:
+            ret.append(T_LONG_DICT + ST_UINT.pack(cnt+1))
+        ret.append(items)
+        _encode_str(key, ret.append)
+        _encode(value, ret.append)
+        return ''.join(ret)
+
+
+HEADER_CODECS = {FRI_PROTOCOL_IDENTIFIER: JsonHeaderCodec,
+                 FRI_BIN_HEADER_IDENTIFIER: BinaryHeaderCodec,
+                 FRI_COMPRESSED_IDENTIFIER: BinaryHeaderCodec}
+
+def get_header_codec(protocol_identifier):
+    return HEADER_CODECS.get(protocol_identifier, None)
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.core.inflight_budget
+@author Konstantin Andrusenko
+@date August 2, 2013
+
+This module contains the implementation of InFlightBudget class.
+Budget is shared by all processes of node (it is created before
+operator process and FRI workers are forked) and limits:
+    in-flight bytes - binary chunks granted to senders and not received yet
+    held bytes - received binary chunks of packets that are processing
+                 (they are written to temporary files by operations)
+Binary chunks are granted by SocketBasedChunks, MultiplexedChunks and
+event loop front end within the budget (see StreamBudget), so chunks
+grant is delayed when budget is exhausted.
+"""
+import time
+import multiprocessing as mp
+from collections import deque
+
+from constants import FRI_INFLIGHT_BYTES_LIMIT, FRI_HELD_BYTES_LIMIT, FRI_BUDGET_WAIT_TIMEOUT, \
+                        DEFAULT_CHUNK_SIZE
+
+
+class InFlightBudget:
+    def __init__(self, inflight_limit=FRI_INFLIGHT_BYTES_LIMIT, held_limit=FRI_HELD_BYTES_LIMIT, \
+                    wait_timeout=FRI_BUDGET_WAIT_TIMEOUT):
+        self.__inflight_limit = inflight_limit
+        self.__held_limit = held_limit
+        self.__wait_timeout = wait_timeout
+
+        self.__cond = mp.Condition(mp.Lock())
+        self.__inflight = mp.RawValue('l', 0)
+        self.__held = mp.RawValue('l', 0)
+        self.__delayed = mp.RawValue('l', 0)
+        self.__delay_time = mp.RawValue('d', 0)
+        self.__timeouts = mp.RawValue('l', 0)
+
+    def __fits(self, size, expected_size):
+        """Budget is exceeded by one grant if nothing is in flight,
+        so large chunks are received anyway"""
+        inflight = self.__inflight.value
+        if inflight and inflight + size > self.__inflight_limit:
+            return False
+
+        if expected_size:
+            #new binary stream is started when it fits into held bytes budget
+            reserved = self.__held.value + inflight
+            if reserved and reserved + expected_size > self.__held_limit:
+                return False
+        return True
+
+    def grant(self, size, expected_size=0, wait=True, wait_start=None):
+        """Reserve size in-flight bytes for chunks grant.
+        expected_size - total size of binary stream (for first grant of stream)
+        Method waits while budget is exhausted, but not longer
+        than wait_timeout (chunks are granted without budget after it).
+        If wait is False, method returns False instead of waiting.
+        wait_start - time of first failed grant attempt of non-blocking caller
+        (wait timeout and delay are counted from it)
+        """
+        t0 = wait_start
+        self.__cond.acquire()
+        try:
+            while not self.__fits(size, expected_size):
+                if t0 is None:
+                    t0 = time.time()
+                rest = self.__wait_timeout - (time.time() - t0)
+                if rest <= 0:
+                    self.__timeouts.value += 1
+                    break
+                if not wait:
+                    return False
+                self.__cond.wait(rest)
+
+            self.__inflight.value += size
+            if t0 is not None:
+                self.__delayed.value += 1
+                self.__delay_time.value += time.time() - t0
+            return True
+        finally:
+            self.__cond.release()
+
+    def received(self, reserved, size):
+        """Granted chunk is received. Its reserved in-flight bytes are released
+        and size bytes are held till release() call"""
+        self.__cond.acquire()
+        try:
+            self.__inflight.value -= reserved
+            self.__held.value += size
+            self.__cond.notify_all()
+        finally:
+            self.__cond.release()
+
+    def release(self, reserved, held):
+        """Release reserved in-flight bytes (not received chunks) and held bytes"""
+        if not (reserved or held):
+            return
+
+        self.__cond.acquire()
+        try:
+            self.__inflight.value -= reserved
+            self.__held.value -= held
+            self.__cond.notify_all()
+        finally:
+            self.__cond.release()
+
+    def get_stat(self):
+        self.__cond.acquire()
+        try:
+            return {'inflight_bytes': self.__inflight.value,
+                    'inflight_limit': self.__inflight_limit,
+                    'held_bytes': self.__held.value,
+                    'held_limit': self.__held_limit,
+                    'delayed_grants': self.__delayed.value,
+                    'delay_time': round(self.__delay_time.value, 3),
+                    'timed_out_grants': self.__timeouts.value}
+        finally:
+            self.__cond.release()
+
+
+class StreamBudget:
+    """Budget reservations of one binary chunks stream.
+    Granted chunks reserve in-flight bytes, received chunks are held
+    in budget until release() call. budget can be None (no limits)
+    """
+    def __init__(self, budget, chunks_count):
+        self.__budget = budget
+        self.__chunks_count = chunks_count
+        self.__chunk_size = DEFAULT_CHUNK_SIZE #estimated size of chunk (for budget reservation)
+        self.__reserved = deque() #reserved in-flight bytes of each granted chunk
+        self.__granted = 0
+        self.__received = 0
+        self.__held = 0
+
+    def reserve(self, credits, wait, wait_start=None):
+        """Reserve budget for credits chunks.
+        Return False if budget is exhausted and wait is False"""
+        if not self.__budget:
+            return True
+
+        expected_size = 0
+        if self.__granted == 0:
+            expected_size = self.__chunks_count * self.__chunk_size
+        if not self.__budget.grant(credits * self.__chunk_size, expected_size, wait, wait_start):
+            return False
+        self.__reserved.extend([self.__chunk_size] * credits)
+        self.__granted += credits
+        return True
+
+    def received(self, chunk_len):
+        if not self.__budget:
+            return
+
+        reserved = self.__reserved.popleft() if self.__reserved else 0
+        self.__budget.received(reserved, chunk_len)
+        self.__held += chunk_len
+        self.__received += 1
+        if self.__received == 1 and chunk_len:
+            #next chunks of stream have the same size (except last one)
+            self.__chunk_size = chunk_len
+
+    def handoff(self):
+        """Release reserved in-flight bytes and return held bytes
+        (they are released by new owner of received chunks)"""
+        held = self.__held
+        self.__held = 0
+        self.release()
+        return held
+
+    def release(self):
+        if not self.__budget:
+            return
+
+        reserved = sum(self.__reserved)
+        self.__reserved.clear()
+        held = self.__held
+        self.__held = 0
+        self.__budget.release(reserved, held)
@@ -20,7 +20,8 @@ from M2Crypto import X509
 from M2Crypto.SSL import Context
 
 from constants import NODE_CERTIFICATE, CLIENT_CERTIFICATE, \
-                        NODE_ROLE, CLIENT_ROLE
+                        NODE_ROLE, CLIENT_ROLE, FRI_SSL_SESSION_ID_CTX, \
+                        FRI_SSL_SESSION_TIMEOUT
 
 NB_CERT_FILENAME = 'nodes.idepositbox.com.pem'
 CB_CERT_FILENAME = 'clients.idepositbox.com.pem'
@@ -42,6 +43,7 @@ class AbstractKeyStorage:
         self._client_base_pubkey = None
         self._node_cert = None
         self._node_prikey = None
+        self._node_context = None
 
         self._load_key_storage(ks_path, passwd)
 
@@ -103,13 +105,25 @@ class AbstractKeyStorage:
         return role
 
     def get_node_context(self):
-        _, certfile = tempfile.mkstemp()
-        _, keyfile = tempfile.mkstemp()
+        """Return SSL context of node (context is built once).
+        Workers processes are forked with the same context, so
+        session tickets issued by any worker are accepted by all workers"""
+        if self._node_context is None:
+            self._node_context = self._make_node_context()
+        return self._node_context
+
+    def _make_node_context(self):
+        certfd, certfile = tempfile.mkstemp()
+        keyfd, keyfile = tempfile.mkstemp()
+        os.close(certfd)
+        os.close(keyfd)
         try:
             open(certfile, 'w').write(self._node_cert)
             open(keyfile, 'w').write(self._node_prikey)
             context = Context()
             context.load_cert(certfile, keyfile)
+            context.set_session_id_ctx(FRI_SSL_SESSION_ID_CTX)
+            context.set_session_timeout(FRI_SSL_SESSION_TIMEOUT)
 
             return context
         finally:
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.core.link_tuner
+@author Konstantin Andrusenko
+@date August 5, 2013
+
+This module contains the implementation of LinkTuner class.
+LinkTuner remembers RTT and throughput of each peer (measured by FriClient
+calls) and selects socket buffers size, recv read size and binary chunk size
+for bandwidth-delay product (BDP) of peer link.
+Links with BDP less than BUF_SIZE (LAN) are not tuned.
+"""
+import os
+import time
+import socket
+import threading
+
+from constants import BUF_SIZE, DEFAULT_CHUNK_SIZE, FRI_LINK_MIN_TRANSFER_SIZE, \
+                        FRI_LINK_THROUGHPUT_WEIGHT, FRI_LINK_RTT_AGING, FRI_LINK_MAX_SOCK_BUF, \
+                        FRI_LINK_MAX_READ_SIZE, FRI_LINK_MAX_CHUNK_SIZE, FRI_LINK_MAX_PEERS
+
+
+def round_size(size, min_size, max_size):
+    """Round size up to power of two within [min_size, max_size] range"""
+    ret = 1
+    while ret < size:
+        ret *= 2
+    return max(min_size, min(ret, max_size))
+
+
+class LinkParams:
+    def __init__(self, sock_buf_size, read_size, chunk_size):
+        self.sock_buf_size = sock_buf_size
+        self.read_size = read_size
+        self.chunk_size = chunk_size
+
+    def __eq__(self, other):
+        return isinstance(other, LinkParams) and self.sock_buf_size == other.sock_buf_size \
+                and self.read_size == other.read_size and self.chunk_size == other.chunk_size
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'LinkParams(sock_buf_size=%s, read_size=%s, chunk_size=%s)'%\
+                    (self.sock_buf_size, self.read_size, self.chunk_size)
+
+
+class PeerLink:
+    def __init__(self):
+        self.rtt = None #min RTT (seconds)
+        self.throughput = None #bytes per second
+        self.params = None
+        self.updated = 0
+
+    def add_sample(self, size, duration):
+        if size < FRI_LINK_MIN_TRANSFER_SIZE:
+            if self.rtt is None or duration < self.rtt:
+                self.rtt = duration
+            else:
+                self.rtt = min(duration, self.rtt * (1 + FRI_LINK_RTT_AGING))
+        else:
+            throughput = size / duration
+            if self.throughput is None:
+                self.throughput = throughput
+            else:
+                self.throughput += (throughput - self.throughput) * FRI_LINK_THROUGHPUT_WEIGHT
+        self.updated = time.time()
+
+        params = self.get_params()
+        if params != self.params:
+            #params object is replaced when it is changed only
+            #(sockets are retuned on params object change)
+            self.params = params
+
+    def get_params(self):
+        if self.rtt is None or self.throughput is None:
+            return None
+
+        bdp = int(self.throughput * self.rtt)
+        if bdp < BUF_SIZE:
+            return None
+
+        #socket buffers are twice bigger than BDP, so measured throughput
+        #is not limited by buffers and can grow up to link capacity.
+        #Sizes are rounded to power of two, so params are not changed by RTT jitter
+        return LinkParams(round_size(bdp * 2, BUF_SIZE, FRI_LINK_MAX_SOCK_BUF), \
+                            round_size(bdp, BUF_SIZE, FRI_LINK_MAX_READ_SIZE), \
+                            round_size(bdp, DEFAULT_CHUNK_SIZE, FRI_LINK_MAX_CHUNK_SIZE))
+
+
+class LinkTuner:
+    """Per peer link parameters (peer is identified by host address).
+    Object is shared by all threads of process"""
+    def __init__(self, max_peers=FRI_LINK_MAX_PEERS):
+        self.__max_peers = max_peers
+        self.__peers = {}
+        self.__lock = threading.Lock()
+        self.__pid = os.getpid()
+
+    def __get_lock(self):
+        if self.__pid != os.getpid():
+            #lock can be acquired by thread of parent process while fork
+            #(measured peers are inherited by child process)
+            self.__pid = os.getpid()
+            self.__lock = threading.Lock()
+        return self.__lock
+
+    def add_sample(self, host, size, duration):
+        """Add completed transfer of size bytes to host (duration in seconds).
+        Small transfers are used for RTT estimation,
+        transfers of FRI_LINK_MIN_TRANSFER_SIZE bytes and bigger - for throughput"""
+        if duration <= 0:
+            return
+
+        lock = self.__get_lock()
+        lock.acquire()
+        try:
+            peer = self.__peers.get(host, None)
+            if peer is None:
+                if len(self.__peers) >= self.__max_peers:
+                    oldest = min(self.__peers.items(), key=lambda item: item[1].updated)[0]
+                    del self.__peers[oldest]
+                peer = self.__peers[host] = PeerLink()
+            peer.add_sample(size, duration)
+        finally:
+            lock.release()
+
+    def get_params(self, host):
+        """Return LinkParams object for peer link or None (if link should not be tuned)"""
+        peer = self.__peers.get(host, None)
+        if peer is None:
+            return None
+        return peer.params
+
+    def clear(self):
+        lock = self.__get_lock()
+        lock.acquire()
+        try:
+            self.__peers.clear()
+        finally:
+            lock.release()
+
+
+def tune_socket(sock, sock_buf_size):
+    """Increase SO_SNDBUF and SO_RCVBUF of socket up to sock_buf_size.
+    Smaller buffers are never set (kernel autotuning is kept for LAN links)"""
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        try:
+            if sock.getsockopt(socket.SOL_SOCKET, option) < sock_buf_size:
+                sock.setsockopt(socket.SOL_SOCKET, option, sock_buf_size)
+        except (socket.error, AttributeError):
+            #M2Crypto SSL connection or closed socket
+            return False
+    return True
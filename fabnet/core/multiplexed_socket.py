@@ -0,0 +1,585 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.core.multiplexed_socket
+@author Konstantin Andrusenko
+@date July 9, 2013
+
+This module contains the implementation of multiplexed FRI connection
+(client side MultiplexedConnection and server side MultiplexedConnectionHandler)
+
+Multiplexed FRI protocol revision is negotiated over keep-alive connection
+(see SocketProcessor.accept_protocol_rev). After negotiation every frame
+is tagged by message_id, so many requests, responses and binary chunks streams
+are interleaved over one connection:
+    - request/response frame has binary_chunk_idx == 0
+    - binary chunk frame has binary_chunk_idx > 0 and belongs to stream
+      with same message_id
+    - chunks are sent while receiver grants credits for them (RC_REQ_BINARY_CHUNK
+      frame with same message_id and 'credits' parameter). Receiver grants
+      credits for chunks window (within node-wide budget of binary chunks)
+      when chunks are consumed, so not consumed chunks buffered by receiver
+      are limited by window
+"""
+import time
+import socket
+import threading
+import traceback
+import Queue
+
+from fabnet.utils.logger import core_logger as logger
+from fabnet.core.constants import RC_ERROR, RC_REQ_BINARY_CHUNK, FRI_MUX_MAX_IN_FLIGHT, \
+                    FRI_KEEP_ALIVE_CHECK_PERIOD, FRI_KEEP_ALIVE_TIMEOUT, \
+                    FRI_CLIENT_READ_TIMEOUT
+from fabnet.core.fri_base import FriException, FriConnectionClosed, FriBinaryData, \
+                    RamBasedBinaryData, FabnetPacketResponse
+from fabnet.core.inflight_budget import StreamBudget
+
+
+class MessageInFlight(FriException):
+    pass
+
+
+class MultiplexedChunks(FriBinaryData):
+    """Binary chunks stream received over multiplexed connection.
+    Chunks are pushed by connection reader and consumed by packet owner.
+    Consumer grants credits for chunks window to sender
+    """
+    def __init__(self, mux_socket, message_id, chunks_count, window=1, budget=None, \
+                    read_timeout=FRI_CLIENT_READ_TIMEOUT):
+        self.__mux_socket = mux_socket
+        self.__message_id = message_id
+        self.__chunks_count = chunks_count
+        self.__window = max(window, 1)
+        self.__read_timeout = read_timeout
+        self.__chunks = Queue.Queue()
+        self.__received = 0
+        self.__granted = 0
+        self.__last_idx = 0
+        self.__closed = threading.Event()
+        self.__lock = threading.Lock()
+        self.__budget = StreamBudget(budget, chunks_count)
+
+    def __del__(self):
+        self.__budget.release()
+
+    def chunks_count(self):
+        return self.__chunks_count
+
+    def put_chunk(self, chunk):
+        """Put received chunk to stream.
+        Return True if all chunks are received"""
+        self.__received += 1
+        self.__lock.acquire()
+        try:
+            if not self.__closed.is_set():
+                self.__chunks.put(chunk)
+                self.__budget.received(len(chunk))
+        finally:
+            self.__lock.release()
+        return self.__received >= self.__chunks_count
+
+    def set_error(self, err):
+        self.__chunks.put(err)
+
+    def __grant_chunks(self):
+        #stream does not wait budget while it has granted chunks for receiving
+        outstanding = self.__granted - self.__last_idx
+        credits = min(self.__window - outstanding, self.__chunks_count - self.__granted)
+        if credits <= 0 or not self.__budget.reserve(credits, wait=(outstanding == 0)):
+            return
+        self.__granted += credits
+        self.__mux_socket.send_credits(self.__message_id, credits)
+
+    def get_next_chunk(self):
+        if self.__last_idx >= self.__chunks_count or self.__closed.is_set():
+            return None
+
+        self.__grant_chunks()
+        try:
+            chunk = self.__chunks.get(timeout=self.__read_timeout)
+        except Queue.Empty:
+            raise socket.timeout('chunk read timed out')
+
+        if isinstance(chunk, Exception):
+            raise chunk
+
+        self.__last_idx += 1
+        return chunk
+
+    def close(self):
+        self.__lock.acquire()
+        try:
+            if self.__closed.is_set():
+                return
+            self.__closed.set()
+            while True:
+                try:
+                    self.__chunks.get_nowait()
+                except Queue.Empty:
+                    break
+            self.__budget.release()
+        finally:
+            self.__lock.release()
+
+        #sender waits credits for not granted chunks, they are dropped by reader
+        rest = self.__chunks_count - self.__granted
+        self.__granted = self.__chunks_count
+        if rest > 0 and self.__mux_socket.is_alive():
+            try:
+                self.__mux_socket.send_credits(self.__message_id, rest)
+            except Exception, err:
+                logger.debug('[MultiplexedChunks.close] %s'%err)
+
+
+class StreamCredits:
+    """Credits for binary chunks sending granted by stream receiver"""
+    def __init__(self):
+        self.__cond = threading.Condition(threading.Lock())
+        self.__credits = 0
+        self.__error = None
+
+    def add(self, credits):
+        self.__cond.acquire()
+        try:
+            self.__credits += credits
+            self.__cond.notify()
+        finally:
+            self.__cond.release()
+
+    def set_error(self, err):
+        self.__cond.acquire()
+        try:
+            self.__error = err
+            self.__cond.notify()
+        finally:
+            self.__cond.release()
+
+    def acquire(self, timeout):
+        """Wait credit for one chunk"""
+        self.__cond.acquire()
+        try:
+            t0 = time.time()
+            while self.__credits == 0 and self.__error is None:
+                rest = timeout - (time.time() - t0)
+                if rest <= 0:
+                    raise socket.timeout('binary chunk credits wait timed out')
+                self.__cond.wait(rest)
+
+            if self.__error is not None:
+                raise self.__error
+            self.__credits -= 1
+        finally:
+            self.__cond.release()
+
+
+class MultiplexedSocket:
+    """Base class for both sides of multiplexed connection.
+    Implements tagged frames sending and binary streams routing
+    """
+    def __init__(self, socket_processor):
+        self._sock_proc = socket_processor
+        self._lock = threading.Lock()
+        self.__send_lock = threading.Lock()
+        self.__streams = {}
+        self.__out_streams = {}
+        self.__error = None
+
+    def is_multiplexed(self):
+        return True
+
+    def is_alive(self):
+        return self.__error is None and not self._sock_proc.is_closed()
+
+    def set_link_params(self, link_params):
+        self._sock_proc.set_link_params(link_params)
+
+    def __send_frame(self, packet, with_bin=True, next_chunk=False):
+        self.__send_lock.acquire()
+        try:
+            if with_bin:
+                self._sock_proc.send_packet_data(packet, next_chunk)
+            else:
+                protocol_id = self._sock_proc.get_protocol_id()
+                self._sock_proc.sendall(packet.dump(with_bin=False, protocol_id=protocol_id))
+        finally:
+            self.__send_lock.release()
+
+    def send_packet(self, packet):
+        """Send packet frames. Chunks frames of other packets
+        can be sent between chunks frames of this packet"""
+        try:
+            if not (packet.binary_data and packet.binary_data.chunks_count() > 1):
+                self.__send_frame(packet)
+                return
+
+            credits = StreamCredits()
+            self._lock.acquire()
+            try:
+                if packet.message_id in self.__out_streams:
+                    raise MessageInFlight('Binary stream for message %s is already sending'%packet.message_id)
+                self.__out_streams[packet.message_id] = credits
+            finally:
+                self._lock.release()
+
+            try:
+                packet.binary_chunk_cnt = packet.binary_data.chunks_count()
+                packet.binary_chunk_idx = 0
+                self.__send_frame(packet, with_bin=False)
+                t0 = None
+                for i in xrange(packet.binary_chunk_cnt):
+                    credits.acquire(FRI_CLIENT_READ_TIMEOUT)
+                    if t0 is None:
+                        t0 = time.time()
+                    packet.binary_chunk_idx = i+1
+                    self.__send_frame(packet, next_chunk=True)
+                if t0 is not None:
+                    packet.transfer_time = time.time() - t0
+            finally:
+                self._lock.acquire()
+                try:
+                    del self.__out_streams[packet.message_id]
+                finally:
+                    self._lock.release()
+        except MessageInFlight, err:
+            raise err
+        except Exception, err:
+            #frame can be sent partially or peer waits not sent chunks,
+            #so connection can not be used anymore
+            self.close_socket(force=True)
+            raise err
+        finally:
+            if packet.binary_chunk_cnt:
+                packet.binary_chunk_cnt = None
+                packet.binary_chunk_idx = None
+
+    def send_credits(self, message_id, credits):
+        """Grant credits for binary chunks of message to peer"""
+        packet = FabnetPacketResponse(ret_code=RC_REQ_BINARY_CHUNK, message_id=message_id, \
+                                        ret_parameters={'credits': credits})
+        try:
+            self.__send_frame(packet, with_bin=False)
+        except Exception, err:
+            self.close_socket(force=True)
+            raise err
+
+    def read_frame(self):
+        """Read next frame from socket and route binary chunk to its stream.
+        Return (packet, is_new_message) tuple"""
+        packet, bin_data = self._sock_proc.read_next_packet()
+
+        if packet.is_response and packet.ret_code == RC_REQ_BINARY_CHUNK:
+            self._lock.acquire()
+            try:
+                credits = self.__out_streams.get(packet.message_id, None)
+            finally:
+                self._lock.release()
+
+            #credits for dropped chunks can be received after stream sending
+            if credits is not None:
+                credits.add(int(packet.ret_parameters.get('credits', 1)))
+            return packet, False
+
+        if packet.binary_chunk_idx > 0:
+            self._lock.acquire()
+            try:
+                chunks = self.__streams.get(packet.message_id, None)
+            finally:
+                self._lock.release()
+
+            if chunks is None:
+                raise FriException('Unexpected binary chunk for message %s'%packet.message_id)
+
+            if chunks.put_chunk(bin_data):
+                self._lock.acquire()
+                try:
+                    del self.__streams[packet.message_id]
+                finally:
+                    self._lock.release()
+            return packet, False
+
+        cnt = packet.binary_chunk_cnt
+        if cnt > 0:
+            if bin_data:
+                raise FriException('Binary data found in init chunk packet (%s chunks expected)'%cnt)
+
+            self._lock.acquire()
+            try:
+                if packet.message_id in self.__streams:
+                    raise FriException('Binary stream for message %s is already opened'%packet.message_id)
+                packet.binary_data = MultiplexedChunks(self, packet.message_id, cnt, \
+                            self._sock_proc.chunks_window, self._sock_proc.inflight_budget)
+                self.__streams[packet.message_id] = packet.binary_data
+            finally:
+                self._lock.release()
+        elif isinstance(bin_data, FriBinaryData):
+            packet.binary_data = bin_data
+        elif bin_data:
+            packet.binary_data = RamBasedBinaryData(bin_data)
+
+        return packet, True
+
+    def _fail(self, err):
+        """Mark connection as broken and break all opened streams"""
+        self._lock.acquire()
+        try:
+            if self.__error is None:
+                self.__error = err
+            streams = self.__streams.values()
+            self.__streams = {}
+            out_streams = self.__out_streams.values()
+        finally:
+            self._lock.release()
+
+        for chunks in streams:
+            chunks.set_error(err)
+        for credits in out_streams:
+            credits.set_error(err)
+
+    def close_socket(self, force=False):
+        self._fail(FriConnectionClosed('multiplexed connection is closed'))
+        self._sock_proc.close_socket(force=True)
+
+    def drop_socket(self):
+        """Forget socket without shutdown
+        (for sockets shared with other process)"""
+        self._fail(FriConnectionClosed('multiplexed connection is dropped'))
+        self._sock_proc.drop_socket()
+
+
+class MultiplexedConnection(MultiplexedSocket):
+    """Client side of multiplexed connection.
+    Responses are read by reader thread and routed to callers by message_id
+    """
+    def __init__(self, socket_processor):
+        MultiplexedSocket.__init__(self, socket_processor)
+        self.__waiters = {}
+        self.last_used = time.time()
+
+        socket_processor.settimeout(None)
+        self.__reader = threading.Thread(target=self.__read_routine)
+        self.__reader.setName('%s-mux-reader'%threading.current_thread().getName())
+        self.__reader.setDaemon(True)
+        self.__reader.start()
+
+    def in_flight_count(self):
+        return len(self.__waiters)
+
+    def call(self, packet, read_timeout=None):
+        """Send request packet and wait response with same message_id"""
+        waiter = Queue.Queue()
+        self._lock.acquire()
+        try:
+            if not self.is_alive():
+                raise FriConnectionClosed('multiplexed connection is closed')
+            if packet.message_id in self.__waiters:
+                raise MessageInFlight('Message %s is already in flight'%packet.message_id)
+            self.__waiters[packet.message_id] = waiter
+            self.last_used = time.time()
+        finally:
+            self._lock.release()
+
+        try:
+            self.send_packet(packet)
+            try:
+                resp = waiter.get(timeout=read_timeout)
+            except Queue.Empty:
+                raise socket.timeout('timed out')
+        finally:
+            self._lock.acquire()
+            try:
+                if self.__waiters.get(packet.message_id, None) is waiter:
+                    del self.__waiters[packet.message_id]
+                self.last_used = time.time()
+            finally:
+                self._lock.release()
+
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+    def __read_routine(self):
+        while True:
+            try:
+                packet, is_new = self.read_frame()
+            except Exception, err:
+                if not isinstance(err, FriConnectionClosed):
+                    err = FriConnectionClosed('multiplexed connection is broken: %s'%err)
+                self.__fail_waiters(err)
+                break
+
+            if not is_new:
+                continue
+
+            self._lock.acquire()
+            try:
+                waiter = self.__waiters.pop(packet.message_id, None)
+            finally:
+                self._lock.release()
+
+            if waiter is None:
+                #caller does not wait response anymore (timeout)
+                if packet.binary_data:
+                    packet.binary_data.close()
+                continue
+
+            waiter.put(packet)
+
+    def __fail_waiters(self, err):
+        self._fail(err)
+        self._lock.acquire()
+        try:
+            waiters = self.__waiters.values()
+            self.__waiters = {}
+        finally:
+            self._lock.release()
+
+        for waiter in waiters:
+            waiter.put(err)
+
+
+class MultiplexedMessageProcessor:
+    """Socket processor interface for one message received over
+    multiplexed connection (passed to FRI worker process() method)
+    """
+    def __init__(self, mux_socket, packet):
+        self.__mux_socket = mux_socket
+        self.__packet = packet
+        self.__message_id = packet.message_id
+        self.__is_closed = False
+
+    def is_multiplexed(self):
+        return True
+
+    def accept_protocol_rev(self, request, response):
+        pass
+
+    def recv_packet(self, allow_socket_close=True):
+        packet = self.__packet
+        self.__packet = None
+        if packet is None:
+            raise FriConnectionClosed('message %s is already received'%self.__message_id)
+        return packet
+
+    def send_packet(self, packet, wait_response=False):
+        if self.__is_closed:
+            raise FriException('Response for message %s is already sent'%self.__message_id)
+        self.__is_closed = True
+        packet.message_id = self.__message_id
+        self.__mux_socket.send_packet(packet)
+
+    def close_socket(self, force=False, send_on_close=None):
+        if self.__is_closed:
+            return
+        self.__is_closed = True
+        if send_on_close:
+            packet = FabnetPacketResponse(**send_on_close.to_dict())
+        else:
+            #peer waits response for this message
+            packet = FabnetPacketResponse(ret_code=RC_ERROR, ret_message='Message is closed without response')
+        packet.message_id = self.__message_id
+        self.__mux_socket.send_packet(packet)
+
+    def is_closed(self):
+        return self.__is_closed
+
+
+class MultiplexedConnectionHandler(MultiplexedSocket):
+    """Server side of multiplexed connection.
+    Received messages are processed in parallel by FRI worker process() method
+    (max FRI_MUX_MAX_IN_FLIGHT messages at once). Responses are sent in
+    completion order
+    """
+    def __init__(self, socket_processor, worker):
+        MultiplexedSocket.__init__(self, socket_processor)
+        self.__worker = worker
+        self.__pending = []
+        self.__active = 0
+        self.__threads = []
+
+    def serve(self):
+        """Read and dispatch messages until connection is closed by peer.
+        Connection without messages in processing is released if worker
+        has pending work in queue (new connection or stop event) that
+        no free worker can get or no frame received in FRI_KEEP_ALIVE_TIMEOUT.
+        Unread messages are resent by peer over new connection
+        """
+        idle_time = 0
+        self.__worker.set_busy(False)
+        try:
+            while True:
+                is_ready = self._sock_proc.wait_next_packet(FRI_KEEP_ALIVE_CHECK_PERIOD)
+                is_idle = self.__active_count() == 0
+                self.__worker.set_busy(not is_idle)
+                if is_idle and self.__worker.has_pending_work() \
+                        and not self.__worker.has_free_workers():
+                    break
+
+                if not is_ready:
+                    if is_idle:
+                        idle_time += FRI_KEEP_ALIVE_CHECK_PERIOD
+                    else:
+                        idle_time = 0
+                    if idle_time >= FRI_KEEP_ALIVE_TIMEOUT:
+                        break
+                    continue
+
+                idle_time = 0
+                packet, is_new = self.read_frame()
+                if is_new:
+                    self.__worker.set_busy(True)
+                    self.__dispatch(packet)
+        except FriConnectionClosed, err:
+            pass
+        except Exception, err:
+            logger.error('[MultiplexedConnectionHandler.serve] %s'%err)
+            logger.write = logger.debug
+            traceback.print_exc(file=logger)
+        finally:
+            self._fail(FriConnectionClosed('multiplexed connection is released'))
+            for thread in self.__threads:
+                thread.join()
+
+    def __active_count(self):
+        self._lock.acquire()
+        try:
+            return self.__active
+        finally:
+            self._lock.release()
+
+    def __dispatch(self, packet):
+        self._lock.acquire()
+        try:
+            self.__pending.append(packet)
+            if self.__active >= FRI_MUX_MAX_IN_FLIGHT:
+                return
+            self.__active += 1
+            self.__threads = [t for t in self.__threads if t.is_alive()]
+        finally:
+            self._lock.release()
+
+        thread = threading.Thread(target=self.__process_routine)
+        thread.setName('%s-mux'%self.__worker.getName())
+        self.__threads.append(thread)
+        thread.start()
+
+    def __process_routine(self):
+        while True:
+            self._lock.acquire()
+            try:
+                if not self.__pending:
+                    self.__active -= 1
+                    break
+                packet = self.__pending.pop(0)
+            finally:
+                self._lock.release()
+
+            try:
+                self.__worker.process(MultiplexedMessageProcessor(self, packet))
+            except Exception, err:
+                logger.error('[MultiplexedConnectionHandler.process] %s'%err)
+                logger.write = logger.debug
+                traceback.print_exc(file=logger)
@@ -14,16 +14,19 @@ import os
 import time
 import threading
 
-from fabnet.core.fri_server import FriServer
+from fabnet.core.fri_server import FriServer, set_unix_socket_dir
 from fabnet.core.fri_client import FriClient
 from fabnet.settings import OPERATORS_MAP, DEFAULT_OPERATOR
-from fabnet.core.fri_base import FabnetPacketRequest
+from fabnet.core.fri_base import FabnetPacketRequest, SpooledBinaryData
+from fabnet.core.socket_processor import SocketProcessor
+from fabnet.core.inflight_budget import InFlightBudget
+from fabnet.core.dedup_table import DedupTable
 from fabnet.core.key_storage import init_keystore
 from fabnet.core.operator import OperatorProcess, OperatorClient
 from fabnet.core.operations_processor import OperationsProcessor
 from fabnet.core.operations_manager import OperationsManager
 from fabnet.core.workers_manager import WorkersManager
-from fabnet.core.constants import ET_INFO, STAT_OSPROC_TIMEOUT
+from fabnet.core.constants import ET_INFO, STAT_OSPROC_TIMEOUT, FRI_UNIX_SOCKET_DIR
 from fabnet.core.statistic import OSProcessesStatisticCollector
 from fabnet.utils.logger import core_logger as logger
 
@@ -63,15 +66,26 @@ class Node:
             logger.error('Node type "%s" does not found!'%self.node_type)
             return False
 
+        #budget is shared by all processes of node, so it is created before they are forked
+        SocketProcessor.inflight_budget = InFlightBudget()
+        #table of seen message ids is shared by operator process and workers of node
+        dedup_table = DedupTable()
+        #unix sockets of FRI servers on this host (private directory of node home)
+        set_unix_socket_dir(os.path.join(self.home_dir, FRI_UNIX_SOCKET_DIR))
+
         op_proc = OperatorProcess(operator_class, address, self.home_dir, self.keystore, \
-                                    is_init_node, self.node_name, config=self.config)
+                                    is_init_node, self.node_name, config=self.config, \
+                                    dedup_table=dedup_table)
         op_proc.start_carefully()
+        SpooledBinaryData.set_spool_dir(operator_class.get_spool_dir(self.home_dir))
 
         try:
-            oper_manager = OperationsManager(operator_class.OPERATIONS_LIST, self.node_name, self.keystore)
+            oper_manager = OperationsManager(operator_class.OPERATIONS_LIST, self.node_name, \
+                                    self.keystore, dedup_table)
             workers_mgr = WorkersManager(OperationsProcessor, server_name=self.node_name, \
                                             init_params=(oper_manager, self.keystore))
-            fri_server = FriServer(self.bind_host, self.port, workers_mgr, self.node_name)
+            fri_server = FriServer(self.bind_host, self.port, workers_mgr, self.node_name, \
+                                    event_loop=not self.keystore, unix_socket=True)
             started = fri_server.start()
             if not started:
                 raise Exception('FriServer does not started!')
@@ -107,6 +107,16 @@ class OperationBase:
                         False, binary_data_pointer)
         return message_id
 
+    def _init_sync_operations(self, node_addresses, operation, parameters, binary_data=None):
+        """Initiate operation on many nodes concurrently.
+        parameters (and binary_data if specified) are lists with item for each node
+        Return FriCallsGroup object (see FriClient.call_many)"""
+        packets = []
+        for i, params in enumerate(parameters):
+            packets.append(FabnetPacketRequest(method=operation, sender=self.self_address, \
+                    parameters=params, binary_data=binary_data[i] if binary_data else '', sync=True))
+        return self.__fri_client.call_many(node_addresses, packets)
+
     def _init_network_operation(self, operation, parameters):
         """Initiate new operation over fabnet network"""
         message_id = self.operator.async_remote_call(None, operation, parameters, True)
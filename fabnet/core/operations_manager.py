@@ -24,8 +24,10 @@ from fabnet.core.constants import RC_ALREADY_PROCESSED, RC_PERMISSION_DENIED, \
                                 RC_MESSAGE_ID_NOT_FOUND, KEEP_ALIVE_METHOD
 
 class OperationsManager:
-    def __init__(self, operations_classes, server_name, key_storage=None):
+    def __init__(self, operations_classes, server_name, key_storage=None, dedup_table=None):
         self.__operations = {}
+        #node-wide table of seen message ids (see DedupTable)
+        self.dedup_table = dedup_table
         self.__op_stat = None
 
         self.operator_cl = OperatorClient(server_name)
@@ -58,20 +60,22 @@ class OperationsManager:
         """
         t0 = None
         try:
-            rcode = self.operator_cl.register_request(packet.message_id, packet.method, packet.sender)
-            if rcode == RC_ALREADY_PROCESSED:
-                return
             if packet.method == KEEP_ALIVE_METHOD:
+                rcode = self.operator_cl.register_request(packet.message_id, packet.method, packet.sender)
                 return FabnetPacketResponse(ret_code=rcode)
 
+            if not self.__register_request(packet):
+                return
+
             if self.__op_stat is not None:
                 t0 = datetime.now()
 
             operation_obj = self.__operations.get(packet.method, None)
             if operation_obj is None:
                 if packet.is_multicast:
-                    #transit packet
-                    self.operator_cl.call_to_neighbours(packet.message_id, packet.method, packet.parameters, packet.is_multicast)
+                    #transit packet (parameters are forwarded without decoding)
+                    self.operator_cl.call_to_neighbours(packet.message_id, packet.method, \
+                                    packet.encoded_parameters(), packet.is_multicast)
                     return
                 else:
                     raise Exception('Method "%s" does not implemented! Available methods: %s'%(packet.method, self.__operations.keys()))
@@ -84,7 +88,8 @@ class OperationsManager:
             message_id = packet.message_id
             n_packet = operation_obj.before_resend(packet)
             if n_packet:
-                self.operator_cl.call_to_neighbours(message_id, packet.method, packet.parameters, packet.is_multicast)
+                self.operator_cl.call_to_neighbours(message_id, packet.method, \
+                                    packet.encoded_parameters(), packet.is_multicast)
 
             s_packet = operation_obj.process(packet)
             if s_packet:
@@ -110,6 +115,21 @@ class OperationsManager:
                 self.__op_stat.update(packet.method, dt)
 
 
+    def __register_request(self, packet):
+        """Return False if packet is already processing/processed"""
+        if self.dedup_table is None:
+            rcode = self.operator_cl.register_request(packet.message_id, packet.method, packet.sender)
+            return rcode != RC_ALREADY_PROCESSED
+
+        if not self.dedup_table.put_safe(packet.message_id, packet.method, packet.sender):
+            return False
+
+        if not self.dedup_table.fits(packet.method, packet.sender):
+            #operator restores message info from dedup table on callback,
+            #so it is registered in operator only if it is not fully kept there
+            self.operator_cl.register_request(packet.message_id, packet.method, packet.sender)
+        return True
+
     def after_process(self, packet, ret_packet):
         """process some logic after response is send"""
         if packet.method == KEEP_ALIVE_METHOD:
@@ -166,7 +186,7 @@ class OperationsManager:
         else:
             binary_data_pointer = None
         self.operator_cl.response_to_sender(sender, packet.message_id, \
-                        packet.ret_code, packet.ret_message, packet.ret_parameters,\
+                        packet.ret_code, packet.ret_message, packet.encoded_ret_parameters(),\
                         binary_data_pointer)
 
     def get_session(self, session_id):
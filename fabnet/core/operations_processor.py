@@ -14,9 +14,10 @@ import traceback
 import threading
 
 from fabnet.utils.logger import oper_logger as logger
-from fabnet.core.fri_base import FabnetPacketResponse
+from fabnet.core.fri_base import FabnetPacketResponse, FriConnectionClosed, FriBinaryProcessor
 from fabnet.core.constants import RC_OK, RC_ERROR, RC_INVALID_CERT, \
-                                RC_REQ_CERTIFICATE, STAT_COLLECTOR_TIMEOUT, SO_OPERS_TIME
+                                RC_REQ_CERTIFICATE, STAT_COLLECTOR_TIMEOUT, SO_OPERS_TIME, \
+                                SO_COMPRESSION, SO_SSL_HANDSHAKES
 from fabnet.core.workers import ProcessBasedFriWorker
 from fabnet.core.key_storage import InvalidCertificate
 from fabnet.core.statistic import StatisticCollector, StatMap
@@ -39,10 +40,32 @@ class OperationsProcessor(ProcessBasedFriWorker):
                                         thr_name, self.__op_stat, STAT_COLLECTOR_TIMEOUT)
         self.__stat_collector.start()
 
+        compression_stat = StatMap()
+        FriBinaryProcessor.compressor.set_stat_map(compression_stat)
+        self.__compr_stat_collector = StatisticCollector(self.oper_manager.operator_cl, SO_COMPRESSION, \
+                                        thr_name, compression_stat, STAT_COLLECTOR_TIMEOUT)
+        self.__compr_stat_collector.start()
+
+        self.__ssl_stat_collector = None
+        if self._key_storage:
+            self.ssl_stat = StatMap()
+            self.__ssl_stat_collector = StatisticCollector(self.oper_manager.operator_cl, SO_SSL_HANDSHAKES, \
+                                        thr_name, self.ssl_stat, STAT_COLLECTOR_TIMEOUT)
+            self.__ssl_stat_collector.start()
+
     def after_stop(self):
+        #stopping collectors at once
+        self.__compr_stat_collector.stop_flag.set()
+        if self.__ssl_stat_collector:
+            self.__ssl_stat_collector.stop_flag.set()
         self.__stat_collector.stop()
+        self.__compr_stat_collector.stop()
+        if self.__ssl_stat_collector:
+            self.__ssl_stat_collector.stop()
 
     def process(self, socket_processor):
+        keep_alive = False
+        packet = None
         try:
             packet = socket_processor.recv_packet()
 
@@ -63,12 +86,20 @@ class OperationsProcessor(ProcessBasedFriWorker):
                     else:
                         if not ret_packet:
                             ret_packet = FabnetPacketResponse()
+                        ret_packet.keep_alive = packet.keep_alive
+                        socket_processor.accept_protocol_rev(packet, ret_packet)
                         socket_processor.send_packet(ret_packet)
-                        socket_processor.close_socket(force=True)
+                        if ret_packet.keep_alive:
+                            keep_alive = True
+                        else:
+                            socket_processor.close_socket(force=True)
                 finally:
                     self.oper_manager.after_process(packet, ret_packet)
             else:
                 self.oper_manager.callback(packet)
+        except FriConnectionClosed, err:
+            #keep-alive connection is closed by client
+            keep_alive = False
         except InvalidCertificate, err:
             if not socket_processor.is_closed():
                 err_packet = FabnetPacketResponse(ret_code=RC_INVALID_CERT, ret_message=str(err))
@@ -85,11 +116,17 @@ class OperationsProcessor(ProcessBasedFriWorker):
             except Exception, err:
                 logger.error("Can't send error message to socket: %s"%err)
         finally:
-            if socket_processor:
+            if packet:
+                packet.close()
+            if socket_processor and not keep_alive:
                 socket_processor.close_socket(force=True)
 
+        return keep_alive
+
 
     def check_session(self, sock_proc, session_id, send_allow=False):
+        #chunks are pushed without allow packet over multiplexed connection
+        send_allow = send_allow and not sock_proc.is_multiplexed()
         if not self._key_storage:
             if send_allow:
                 sock_proc.send_packet(FabnetPacketResponse())
@@ -100,6 +137,10 @@ class OperationsProcessor(ProcessBasedFriWorker):
 
         session = self.oper_manager.get_session(session_id)
         if session is None:
+            if sock_proc.is_multiplexed():
+                #session is opened while multiplexed protocol negotiation
+                raise InvalidCertificate('No session found for multiplexed connection!')
+
             cert_req_packet = FabnetPacketResponse(ret_code=RC_REQ_CERTIFICATE, ret_message='Certificate request')
             sock_proc.send_packet(cert_req_packet)
             cert_packet = sock_proc.recv_packet()
@@ -8,13 +8,121 @@ Copyright (C) 2013 Konstantin Andrusenko
 @author Konstantin Andrusenko
 @date November 16, 2012
 """
+import time
 import threading
 import traceback
+from collections import deque
+
 from fabnet.utils.logger import oper_logger as logger
 from fabnet.core.fri_base import FabnetPacketResponse
 from fabnet.core.fri_client import FriClient
 from fabnet.core.workers import ThreadBasedAbstractWorker
-from fabnet.core.constants import RC_OK, RC_DONT_STARTED
+from fabnet.core.constants import RC_OK, RC_DONT_STARTED, FRI_AGENT_BATCH_SIZE
+
+
+class AsyncCallsQueue:
+    """Queues of async packets by destination address.
+    Ready queue (queue of FriAgent workers) contains destination addresses.
+    Destination is in ready queue once while it has queued packets,
+    so its packets are sent in order by one FriAgent thread at once
+    (slow destination can not occupy all threads). Destination is queued
+    again after each batch, so destinations are served in turn.
+    """
+    def __init__(self, ready_queue, batch_size=FRI_AGENT_BATCH_SIZE):
+        self.__ready_queue = ready_queue
+        self.__batch_size = batch_size
+        self.__lock = threading.Condition(threading.Lock())
+        self.__queues = {} #address -> deque of (put time, packet)
+        self.__scheduled = set() #addresses in ready queue or in work
+        self.__queued = 0
+        self.__sent_packets = 0
+        self.__sent_batches = 0
+
+    def put(self, address, packet):
+        self.__lock.acquire()
+        try:
+            queue = self.__queues.get(address, None)
+            if queue is None:
+                queue = self.__queues[address] = deque()
+            queue.append((time.time(), packet))
+            self.__queued += 1
+
+            if address in self.__scheduled:
+                return
+            self.__scheduled.add(address)
+        finally:
+            self.__lock.release()
+
+        self.__ready_queue.put(address)
+
+    def get_batch(self, address):
+        """Return list of queued packets of destination (up to batch_size)"""
+        self.__lock.acquire()
+        try:
+            queue = self.__queues.get(address, None)
+            if not queue:
+                return []
+            batch = [queue.popleft()[1] for _ in xrange(min(len(queue), self.__batch_size))]
+            self.__queued -= len(batch)
+            self.__sent_packets += len(batch)
+            self.__sent_batches += 1
+            return batch
+        finally:
+            self.__lock.release()
+
+    def batch_done(self, address):
+        """Batch of destination is sent. Destination is returned
+        to ready queue if it has queued packets"""
+        self.__lock.acquire()
+        try:
+            if self.__queues.get(address, None):
+                reschedule = True
+            else:
+                reschedule = False
+                self.__queues.pop(address, None)
+                self.__scheduled.discard(address)
+                if not self.__scheduled:
+                    self.__lock.notify_all()
+        finally:
+            self.__lock.release()
+
+        if reschedule:
+            self.__ready_queue.put(address)
+
+    def wait_empty(self, timeout):
+        """Wait while queued packets are sent (but not longer than timeout).
+        Return True if all packets are sent"""
+        deadline = time.time() + timeout
+        self.__lock.acquire()
+        try:
+            while self.__scheduled:
+                rest = deadline - time.time()
+                if rest <= 0:
+                    return False
+                self.__lock.wait(rest)
+            return True
+        finally:
+            self.__lock.release()
+
+    def get_stat(self):
+        """Return queued packets count and lag (age of oldest queued packet)
+        of destinations with queued packets"""
+        now = time.time()
+        self.__lock.acquire()
+        try:
+            lags = {}
+            for address, queue in self.__queues.items():
+                if queue:
+                    lags[address] = round(now - queue[0][0], 3)
+            return {'queued': self.__queued,
+                    'destinations': len(lags),
+                    'max_lag': max(lags.values()) if lags else 0,
+                    'lag': lags,
+                    'sent_packets': self.__sent_packets,
+                    'sent_batches': self.__sent_batches}
+        finally:
+            self.__lock.release()
+
 
 class FriAgent(ThreadBasedAbstractWorker):
     def __init__(self, name, queue, operator):
@@ -23,13 +131,23 @@ class FriAgent(ThreadBasedAbstractWorker):
         self.operator = operator
         self.self_address = operator.self_address
         self.fri_client = operator.fri_client
+        self.async_calls = operator.async_calls
 
-    def worker_routine(self, item):
-        if len(item) != 2:
-            raise Exception('Expected (<address>,<packet>), but "%s" occured'%item)
-
-        address, packet = item
+    def worker_routine(self, address):
+        """Send batch of queued packets of destination.
+        Packets are sent over pooled connection to destination"""
+        try:
+            for packet in self.async_calls.get_batch(address):
+                try:
+                    self.__send_packet(address, packet)
+                except Exception, err:
+                    logger.error('[FriAgent] %s'%err)
+                    logger.write = logger.debug
+                    traceback.print_exc(file=logger)
+        finally:
+            self.async_calls.batch_done(address)
 
+    def __send_packet(self, address, packet):
         rcode, rmsg = self.fri_client.call(address, packet)
         if rcode == RC_OK:
             return
@@ -48,4 +166,3 @@ class FriAgent(ThreadBasedAbstractWorker):
                 return
             logger.error("Can't send error response to self node")
 
-
@@ -25,16 +25,19 @@ from fabnet.utils.internal import total_seconds
 from fabnet.core.message_container import MessageContainer
 from fabnet.core.workers_manager import WorkersManager
 from fabnet.core.sessions_manager import SessionsManager
-from fabnet.core.operator.async_call_agent import FriAgent
+from fabnet.core.operator.async_call_agent import FriAgent, AsyncCallsQueue
 from fabnet.core.operator.neighbours_discovery import NeigboursDiscoveryRoutines
 from fabnet.core.constants import MC_SIZE
-from fabnet.core.fri_base import FabnetPacketRequest, FabnetPacketResponse, FileBasedChunks
+from fabnet.core.fri_base import FabnetPacketRequest, FabnetPacketResponse, FileBasedChunks, \
+                FriBinaryProcessor
 from fabnet.core.fri_client import FriClient
-from fabnet.core.statistic import Statistic
+from fabnet.core.statistic import Statistic, StatMap
 from fabnet.core.constants import RC_OK, RC_ERROR, RC_NOT_MY_NEIGHBOUR, NT_SUPERIOR, NT_UPPER, \
                 RC_ALREADY_PROCESSED, RC_MESSAGE_ID_NOT_FOUND, ET_INFO,\
                 KEEP_ALIVE_METHOD, KEEP_ALIVE_TRY_COUNT, CHECK_NEIGHBOURS_TIMEOUT,\
-                KEEP_ALIVE_MAX_WAIT_TIME, ONE_DIRECT_NEIGHBOURS_COUNT, SO_OPERS_TIME
+                KEEP_ALIVE_MAX_WAIT_TIME, ONE_DIRECT_NEIGHBOURS_COUNT, SO_OPERS_TIME, \
+                SO_COMPRESSION, SI_ASYNC_CALLS, SI_DEDUP_TABLE, SI_OPERATOR_RPC, \
+                CFG_OPERATOR_RPC_PROFILING, FRI_CLIENT_TIMEOUT
 
 from fabnet.operations.manage_neighbours import ManageNeighbour
 from fabnet.operations.discovery_operation import DiscoveryOperation
@@ -59,6 +62,9 @@ class OperException(Exception):
 class Operator:
     OPTYPE = 'Base'
     OPERATIONS_LIST = []
+    #node-wide table of seen message ids (see DedupTable),
+    #it is set by OperatorProcess and shared with OperationsManager of node
+    dedup_table = None
 
     @classmethod
     def update_operations_list(cls, operations_list):
@@ -66,8 +72,15 @@ class Operator:
         cls.OPERATIONS_LIST = []
         cls.OPERATIONS_LIST = base_list + operations_list
 
+    @classmethod
+    def get_spool_dir(cls, home_dir):
+        """Return directory for spooled binary data of received packets
+        (system temp directory is used if None returned)"""
+        return None
+
     def __init__(self, self_address, home_dir='/tmp/', key_storage=None, \
                     is_init_node=False, node_name='unknown-node', config={}):
+        self.__rpc_profiler = None
         config_file = os.path.join(home_dir, 'node_config')
         Config.load(config_file)
         self.update_config(config, self.OPTYPE)
@@ -92,8 +105,8 @@ class Operator:
 
         self.__fri_agents_manager = WorkersManager(FriAgent, server_name=node_name, \
                     init_params=(self,))
+        self.async_calls = AsyncCallsQueue(self.__fri_agents_manager.get_queue())
         self.__fri_agents_manager.start_carefully()
-        self.__async_requests = self.__fri_agents_manager.get_queue()
 
         self.__check_neighbours_thread = CheckNeighboursThread(self)
         self.__check_neighbours_thread.setName('%s-CheckNeighbours'%(node_name,))
@@ -105,6 +118,9 @@ class Operator:
         self.__discovery = NeigboursDiscoveryRoutines(self)
         self.__api_workers_mgr = None
         self.__stat = Statistic()
+        #statistic of packets compressed by operator's FRI clients
+        self.__compression_stat = StatMap()
+        FriBinaryProcessor.compressor.set_stat_map(self.__compression_stat)
         init_oper_stat = {}
         for opclass in self.OPERATIONS_LIST:
             init_oper_stat[opclass.get_name()] = 0
@@ -137,6 +153,11 @@ class Operator:
             except Exception, err:
                 logger.error('Inherired operator does not stopped! Details: %s'%err)
 
+            #packets of destination that is sending now are returned to agents queue
+            #after current batch, so they are sent before agents stopping
+            if not self.async_calls.wait_empty(FRI_CLIENT_TIMEOUT):
+                logger.warning('async packets are not sent before operator stopping: %s'%\
+                                    self.async_calls.get_stat()['queued'])
             self.__fri_agents_manager.stop()
             self.__check_neighbours_thread.join()
             logger.info('operator is stopped!')
@@ -196,6 +217,17 @@ class Operator:
 
     def update_config(self, config, section=None):
         Config.update_config(config, section=section)
+        self.__apply_rpc_profiling_config()
+
+    def __apply_rpc_profiling_config(self):
+        if self.__rpc_profiler:
+            enabled = Config.get(CFG_OPERATOR_RPC_PROFILING)
+            self.__rpc_profiler.set_enabled(str(enabled).lower() in ('1', 'true', 'yes', 'on'))
+
+    def set_rpc_profiler(self, rpc_profiler):
+        """Set profiler of RPC calls to operator (see RPCProfiler)"""
+        self.__rpc_profiler = rpc_profiler
+        self.__apply_rpc_profiling_config()
 
     def get_config(self):
         return Config.get_config_dict()
@@ -233,12 +265,20 @@ class Operator:
             w_count, w_busy = workers_manager.get_workers_stat()
             ret_stat['%sWMStat'%workers_manager.get_workers_name()] = \
                                 {'workers': w_count, 'busy': w_busy}
+        ret_stat[SI_ASYNC_CALLS] = self.async_calls.get_stat()
+        if self.dedup_table is not None:
+            ret_stat[SI_DEDUP_TABLE] = self.dedup_table.get_stat()
+        if self.__rpc_profiler:
+            ret_stat[SI_OPERATOR_RPC] = self.__rpc_profiler.get_stat()
 
         return ret_stat
 
 
     def get_statistic(self):
         operator_stat = self.on_statisic_request()
+        compression_stat = self.__compression_stat.dump()
+        if compression_stat:
+            self.__stat.update(SO_COMPRESSION, 'Operator', compression_stat)
         null_op_stat = copy.copy(self.__null_oper_stat)
         stat = self.__stat.dump()
         op_stat = stat.get(SO_OPERS_TIME, {})
@@ -249,6 +289,8 @@ class Operator:
 
     def reset_statistic(self):
         self.__stat.reset()
+        if self.__rpc_profiler:
+            self.__rpc_profiler.reset()
 
     def update_statistic(self, stat_obj, stat_owner, stat):
         self.__stat.update(stat_obj, stat_owner, stat)
@@ -257,12 +299,12 @@ class Operator:
         if method == KEEP_ALIVE_METHOD:
             return self._process_keep_alive(sender)
 
-        inserted = self.msg_container.put_safe(message_id,
-                        {'operation': method,
-                         'sender': sender,
-                         'responses_count': 0,
-                         'responses': {},
-                         'datetime': datetime.now()})
+        if self.dedup_table is not None:
+            #message id is registered in workers dedup table too
+            #(it is already there if request is received by worker)
+            self.dedup_table.put_safe(message_id, method, sender)
+
+        inserted = self.msg_container.put_safe(message_id, self.__new_message_info(method, sender))
 
         if not inserted:
             #this message is already processing/processed
@@ -271,8 +313,29 @@ class Operator:
 
         return RC_OK
 
-    def register_callback(self, message_id, from_node=None, params_for_save=None):
+    def __new_message_info(self, method, sender, dt=None):
+        return {'operation': method,
+                'sender': sender,
+                'responses_count': 0,
+                'responses': {},
+                'datetime': dt or datetime.now()}
+
+    def __get_message_info(self, message_id):
         msg_info = self.msg_container.get(message_id)
+        if msg_info is not None or self.dedup_table is None:
+            return msg_info
+
+        #request is registered by worker in dedup table only
+        registered = self.dedup_table.get(message_id)
+        if registered is None:
+            return None
+        method, sender, timestamp = registered
+        self.msg_container.put_safe(message_id, \
+                self.__new_message_info(method, sender, datetime.fromtimestamp(timestamp)))
+        return self.msg_container.get(message_id)
+
+    def register_callback(self, message_id, from_node=None, params_for_save=None):
+        msg_info = self.__get_message_info(message_id)
         if not msg_info:
             return RC_MESSAGE_ID_NOT_FOUND
 
@@ -290,7 +353,9 @@ class Operator:
 
     def wait_response(self, message_id, timeout, response_count=1):
         for i in xrange(timeout*10):
-            msg_info = self.msg_container.get(message_id)
+            msg_info = self.__get_message_info(message_id)
+            if msg_info is None:
+                raise OperException('Message %s does not found!'%message_id)
             self._lock()
             try:
                 if msg_info['responses_count'] >= response_count:
@@ -304,7 +369,9 @@ class Operator:
 
 
     def update_message(self, message_id, key, value):
-        msg_info = self.msg_container.get(message_id)
+        msg_info = self.__get_message_info(message_id)
+        if msg_info is None:
+            raise OperException('Message %s does not found!'%message_id)
         self._lock()
         try:
             msg_info[key] = value
@@ -313,7 +380,10 @@ class Operator:
 
 
     def get_message_item(self, message_id, key):
-        msg_info = self.msg_container.get(message_id)
+        """Return copy of message item (None if message or item does not found)"""
+        msg_info = self.__get_message_info(message_id)
+        if msg_info is None:
+            return None
         self._lock()
         try:
             item = msg_info.get(key, None)
@@ -399,8 +469,11 @@ class Operator:
         superiors = self.get_neighbours(NT_SUPERIOR)
 
         remove_nodes = []
-        for superior in superiors:
-            resp = self.fri_client.call_sync(superior, ka_packet)
+        calls = self.fri_client.call_many(superiors, ka_packet)
+        calls.wait()
+        for future in calls.futures:
+            superior = future.node_address
+            resp = future.result()
             cnt = 0
             self._lock()
             try:
@@ -459,6 +532,15 @@ class Operator:
         return self.__call_operation(node_address, packet)
 
 
+    def call_nodes(self, node_addresses, packets):
+        """Send sync request packets to nodes concurrently
+        Return FriCallsGroup object (see FriClient.call_many)"""
+        for node_address, packet in zip(node_addresses, packets):
+            if node_address != self.self_address:
+                self.register_request(packet.message_id, packet.method, None)
+
+        return self.fri_client.call_many(node_addresses, packets)
+
     def call_network(self, packet, from_address=None):
         packet.sender = None
         packet.is_multicast = True
@@ -474,7 +556,7 @@ class Operator:
         if hasattr(packet, 'sync') and packet.sync:
             return self.fri_client.call_sync(address, packet)
 
-        self.__async_requests.put((address, packet))
+        self.async_calls.put(address, packet)
 
     def async_remote_call(self, node_address, operation, parameters, multicast=False, bin_data_pointer=None):
         if bin_data_pointer:
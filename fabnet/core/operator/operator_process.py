@@ -12,34 +12,73 @@ This module contains the OperatorProcess class implementation
 """
 
 import os
-import pickle
 import time
 import threading
 import traceback
+import struct
+import itertools
 import multiprocessing as mp
-from Queue import Queue
 from multiprocessing.connection import Listener, Client
 
 from fabnet.core.workers_manager import WorkersManager
 from fabnet.core.workers import ThreadBasedAbstractWorker
+from fabnet.core.operator.rpc_codec import encode_request, decode_request, \
+                            encode_response, encode_error, decode_response
+from fabnet.core.operator.rpc_profiler import RPCProfiler
 from fabnet.core.constants import OPERATOR_SOCKET_ADDRESS, \
                             S_PENDING, S_ERROR, S_INWORK, \
                             MIN_WORKERS_COUNT, MAX_WORKERS_COUNT
 from fabnet.utils.logger import oper_logger as logger
 
+#RPC messages over operator channel are prefixed by request id
+REQUEST_ID_STRUCT = struct.Struct('<Q')
+
+class OperatorChannelHandler(threading.Thread):
+    """Reader of RPC requests from client connection (see OperatorChannel).
+    Requests are processed by OperatorWorker threads, so many calls
+    of one connection are processed concurrently
+    (responses are sent with request id)"""
+    def __init__(self, conn, queue, rpc_profiler):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.__conn = conn
+        self.__queue = queue
+        self.__rpc_profiler = rpc_profiler
+        self.__send_lock = threading.Lock()
+
+    def run(self):
+        while True:
+            try:
+                data = self.__conn.recv_bytes()
+            except (EOFError, IOError):
+                break
+            #receiving time for queue wait time profiling
+            received = time.time() if self.__rpc_profiler.enabled else None
+            self.__queue.put((self, data, received))
+        self.__conn.close()
+
+    def send_bytes(self, data):
+        self.__send_lock.acquire()
+        try:
+            self.__conn.send_bytes(data)
+        finally:
+            self.__send_lock.release()
+
+
 class OperatorWorker(ThreadBasedAbstractWorker):
-    def __init__(self, name, queue, operator):
+    def __init__(self, name, queue, operator, rpc_profiler):
         ThreadBasedAbstractWorker.__init__(self, name, queue)
         self.__operator = operator
-
-    def worker_routine(self, conn):
+        self.__rpc_profiler = rpc_profiler
+
+    def worker_routine(self, item):
+        channel, data, received = item
+        req_id = data[:REQUEST_ID_STRUCT.size]
+        t0 = time.time() if received is not None else None
+        method = None
+        is_error = False
         try:
-            pickled_data = conn.recv_bytes()
-            raw_packet = pickle.loads(pickled_data)
-            method = raw_packet.get('method', None)
-            if not method:
-                raise Exception('Method name does not found!')
-            args = raw_packet.get('args', ())
+            method, args = decode_request(data, REQUEST_ID_STRUCT.size)
 
             method_f = getattr(self.__operator, method, None)
             if not method_f:
@@ -48,19 +87,156 @@ class OperatorWorker(ThreadBasedAbstractWorker):
             #logger.debug('rpc call %s%s'%(method, args))
 
             resp = method_f(*args)
-            raw_resp = pickle.dumps({'rcode': 0, 'resp': resp})
-            conn.send_bytes(raw_resp)
+            raw_resp = encode_response(resp)
         except Exception, err:
             #logger.error('operator error: [%s] %s'%(err.__class__.__name__, err))
             #logger.write = logger.debug
             #traceback.print_exc(file=logger)
+            is_error = True
+            raw_resp = encode_error(err)
+
+        try:
+            channel.send_bytes(req_id + raw_resp)
+        except Exception, err:
+            logger.error('operator cant send response of %s call. Details: %s'%(method, err))
+
+        if t0 is not None:
+            self.__rpc_profiler.update(method or 'unknown', t0 - received, time.time() - t0, \
+                        len(data) - REQUEST_ID_STRUCT.size, len(raw_resp), is_error)
+
+
+class OperatorChannelClosed(Exception):
+    """Request is not sent over channel (it can be sent over new channel)"""
+    pass
+
+
+class OperatorChannel:
+    """Persistent connection to operator process.
+    Many calls can be sent over channel at once (from different threads).
+    Responses are read by one of waiting callers (reader role is passed
+    to next waiting caller when reader receives own response),
+    responses of other calls are routed to them by request id
+    """
+    def __init__(self, address, authkey=None):
+        self.__conn = Client(address, authkey=authkey)
+        self.__cond = threading.Condition(threading.Lock())
+        self.__send_lock = threading.Lock()
+        self.__responses = {} #request id -> received response of waiting caller
+        self.__ids = itertools.count()
+        self.__reading = False
+        self.__error = None
+
+    def is_alive(self):
+        return self.__error is None
+
+    def call(self, method, args=()):
+        """Send RPC request and wait response.
+        Return encoded response (see decode_response)"""
+        raw_packet = encode_request(method, args)
+        self.__send_lock.acquire()
+        try:
+            if self.__error:
+                raise OperatorChannelClosed(self.__error)
+            req_id = self.__ids.next()
+            self.__conn.send_bytes(REQUEST_ID_STRUCT.pack(req_id) + raw_packet)
+        except OperatorChannelClosed, err:
+            raise err
+        except Exception, err:
+            self.__fail(err)
+            raise OperatorChannelClosed(err)
+        finally:
+            self.__send_lock.release()
+
+        return self.__wait_response(req_id)
+
+    def __wait_response(self, req_id):
+        self.__cond.acquire()
+        try:
+            while True:
+                if req_id in self.__responses:
+                    return self.__responses.pop(req_id)
+                if self.__error:
+                    raise self.__error
+                if not self.__reading:
+                    self.__reading = True
+                    break
+                self.__cond.wait()
+        finally:
+            self.__cond.release()
+
+        try:
+            while True:
+                try:
+                    resp = self.__conn.recv_bytes()
+                    resp_id, = REQUEST_ID_STRUCT.unpack_from(resp)
+                except EOFError, err:
+                    self.__fail(Exception('connection is closed by operator'))
+                    raise self.__error
+                except Exception, err:
+                    self.__fail(err)
+                    raise err
+
+                if resp_id == req_id:
+                    return resp
+
+                self.__cond.acquire()
+                try:
+                    self.__responses[resp_id] = resp
+                    self.__cond.notify_all()
+                finally:
+                    self.__cond.release()
+        finally:
+            self.__cond.acquire()
             try:
-                raw_resp = pickle.dumps({'rcode': 1, 'ex': err})
-                conn.send_bytes(raw_resp)
-            except Exception, s_err:
-                logger.error('operator cant send error message: [%s] %s. Details: %s'%(err.__class__.__name__, err, s_err))
+                self.__reading = False
+                self.__cond.notify_all()
+            finally:
+                self.__cond.release()
+
+    def __fail(self, err):
+        self.__cond.acquire()
+        try:
+            if self.__error is None:
+                self.__error = err or Exception('unknown error')
+            self.__cond.notify_all()
         finally:
-            conn.close()
+            self.__cond.release()
+        self.close()
+
+    def close(self):
+        try:
+            self.__conn.close()
+        except Exception, err:
+            pass
+
+
+class OperatorChannels:
+    """Channels to operator processes (by socket address) shared
+    by all OperatorClient objects of process"""
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__channels = {}
+        self.__pid = os.getpid()
+
+    def get(self, address, authkey=None):
+        if self.__pid != os.getpid():
+            #channels of parent process are not shared with forked process
+            self.__pid = os.getpid()
+            self.__lock = threading.Lock()
+            for channel in self.__channels.values():
+                channel.close()
+            self.__channels = {}
+
+        self.__lock.acquire()
+        try:
+            channel = self.__channels.get((address, authkey), None)
+            if channel is None or not channel.is_alive():
+                channel = self.__channels[(address, authkey)] = OperatorChannel(address, authkey)
+            return channel
+        finally:
+            self.__lock.release()
+
+OPERATOR_CHANNELS = OperatorChannels()
 
 
 class OperatorClient:
@@ -75,41 +251,34 @@ class OperatorClient:
         return lambda *args: self.__call(method, args)
 
     def __call(self, method, args=()):
-        conn = None
         addr = OPERATOR_SOCKET_ADDRESS%self.__server_name
         try:
-            raw_packet = pickle.dumps({'method': method, 'args': args})
-            conn = Client(addr, authkey=self.__authkey)
-            conn.send_bytes(raw_packet)
-            raw_resp = conn.recv_bytes()
+            try:
+                resp = OPERATOR_CHANNELS.get(addr, self.__authkey).call(method, args)
+            except OperatorChannelClosed, err:
+                #channel is broken before request sending (operator is restarted, for example)
+                resp = OPERATOR_CHANNELS.get(addr, self.__authkey).call(method, args)
         except Exception, err:
             msg = 'Communication with operator process at address %s are failed! Details: %s'
             if not str(err):
                 err = 'unknown'
             raise Exception(msg % (addr, err))
-        finally:
-            if conn:
-                conn.close()
-
-        resp = pickle.loads(raw_resp)
-        if resp.get('rcode', 1) != 0:
-            exc = resp.get('ex', Exception('unknown operator error'))
-            raise exc
-
-        return resp.get('resp', None)
-
 
+        return decode_response(resp, REQUEST_ID_STRUCT.size)
 
 
 class OperatorProcess(mp.Process):
     def __init__(self, operator_class, self_address, home_dir, keystore, is_init_node, server_name='',\
-                    min_workers=MIN_WORKERS_COUNT, max_workers=MAX_WORKERS_COUNT, authkey='', config={}):
+                    min_workers=MIN_WORKERS_COUNT, max_workers=MAX_WORKERS_COUNT, authkey='', config={}, \
+                    dedup_table=None):
         mp.Process.__init__(self)
         self.__is_stopped = mp.Value("b", True, lock=mp.Lock())
         self.__status =  mp.Value("i", S_PENDING, lock=mp.Lock())
         self.__operator_class = operator_class
         self.__operator_args = (self_address, home_dir, keystore, is_init_node, server_name, config)
         self.__operator = None
+        self.__dedup_table = dedup_table
+        self.__rpc_profiler = None
         self.__workers_mgr = None
 
         self.__authkey = authkey
@@ -141,8 +310,12 @@ class OperatorProcess(mp.Process):
 
         try:
             self.__operator = self.__operator_class(*self.__operator_args)
+            self.__operator.dedup_table = self.__dedup_table
+            self.__rpc_profiler = RPCProfiler()
+            if hasattr(self.__operator, 'set_rpc_profiler'):
+                self.__operator.set_rpc_profiler(self.__rpc_profiler)
             self.__workers_mgr = WorkersManager(OperatorWorker, self.__min_workers, self.__max_workers, \
-                                    self.__server_name+'-op', init_params=(self.__operator,))
+                                    self.__server_name+'-op', init_params=(self.__operator, self.__rpc_profiler))
             self.__workers_mgr.start_carefully()
             self.__operator.set_operator_api_workers_manager(self.__workers_mgr)
             self.__queue = self.__workers_mgr.get_queue()
@@ -161,7 +334,7 @@ class OperatorProcess(mp.Process):
                 if self.__is_stopped.value:
                     conn.close()
                     break
-                self.__queue.put(conn)
+                OperatorChannelHandler(conn, self.__queue, self.__rpc_profiler).start()
         except Exception, err:
             self.__status.value = S_ERROR
             logger.error('OperatorProcess failed: %s'%err)
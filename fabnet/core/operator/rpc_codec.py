@@ -0,0 +1,123 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.core.operator.rpc_codec
+@author Konstantin Andrusenko
+@date August 20, 2013
+
+This module contains the codec of RPC messages between
+OperatorClient and operator process (see OperatorChannel).
+
+Request: method id (1 byte index in RPC_METHODS, or RPC_METHOD_BY_NAME
+followed by method name length and name) and pickled arguments tuple
+(nothing for call without arguments).
+
+Response: return code (RPC_OK or RPC_ERROR) and value tag with value.
+Scalar values (None, int, str) are encoded natively, other values
+are pickled. Exception of failed call is pickled after RPC_ERROR.
+
+Pickling is done by cPickle with highest protocol
+(natively encoded containers are slower than cPickle).
+"""
+import struct
+import cPickle as pickle
+
+#registered operator methods. NEVER remove or reorder items in this list - append only!
+#removed method is replaced by RPC_RESERVED prefixed name (its id is not reused)
+RPC_METHODS = ('register_request', 'register_callback', 'call_to_neighbours', 'response_to_sender',
+        'async_remote_call', 'call_node', 'call_network', 'get_session', 'put_session',
+        'update_message', 'get_message_item', 'wait_response', 'get_neighbours',
+        'get_self_address', 'get_home_dir', 'get_node_name', 'get_status', 'get_type',
+        'update_statistic', 'find_range', 'get_ranges_table_status', 'dump_ranges_table',
+        'get_dht_range', 'get_tempfile', 'get_data_block_path', '#get_verified_checksum',
+        'get_config_value', 'is_stopped', 'get_statistic')
+
+RPC_RESERVED = '#'
+RPC_METHOD_IDS = dict((name, chr(i)) for i, name in enumerate(RPC_METHODS) \
+                        if not name.startswith(RPC_RESERVED))
+RPC_METHOD_BY_NAME = '\xff'
+
+RPC_OK = '\x00'
+RPC_ERROR = '\x01'
+
+T_NONE = RPC_OK + 'N'
+T_INT = RPC_OK + 'i'
+T_STR = RPC_OK + 's'
+T_PICKLE = RPC_OK + 'P'
+
+ST_INT = struct.Struct('<q')
+MIN_INT = -2**63
+MAX_INT = 2**63
+
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+
+class RPCCodecException(Exception):
+    pass
+
+
+def encode_request(method, args):
+    method_id = RPC_METHOD_IDS.get(method, None)
+    if method_id is None:
+        if len(method) > 255:
+            raise RPCCodecException('Too long method name "%s..."'%method[:32])
+        method_id = RPC_METHOD_BY_NAME + chr(len(method)) + method
+
+    if not args:
+        return method_id
+    return method_id + pickle.dumps(tuple(args), PICKLE_PROTOCOL)
+
+def decode_request(data, pos=0):
+    """Return (method name, arguments tuple) of encoded request"""
+    try:
+        method_id = data[pos]
+        if method_id == RPC_METHOD_BY_NAME:
+            end = pos + 2 + ord(data[pos+1])
+            method = data[pos+2:end]
+        else:
+            method = RPC_METHODS[ord(method_id)]
+            end = pos + 1
+    except IndexError:
+        raise RPCCodecException('Invalid RPC request')
+
+    if end == len(data):
+        return method, ()
+    return method, pickle.loads(data[end:])
+
+
+def encode_response(value):
+    v_type = type(value)
+    if value is None:
+        return T_NONE
+    if v_type is int and MIN_INT <= value < MAX_INT:
+        return T_INT + ST_INT.pack(value)
+    if v_type is str:
+        return T_STR + value
+    return T_PICKLE + pickle.dumps(value, PICKLE_PROTOCOL)
+
+def encode_error(err):
+    try:
+        raw = pickle.dumps(err, PICKLE_PROTOCOL)
+        pickle.loads(raw)
+    except Exception:
+        #exception can not be restored by client
+        raw = pickle.dumps(Exception('%s: %s'%(err.__class__.__name__, err)), PICKLE_PROTOCOL)
+    return RPC_ERROR + raw
+
+def decode_response(data, pos=0):
+    """Return value of encoded response or raise exception of failed call"""
+    tag = data[pos:pos+2]
+    if tag == T_NONE:
+        return None
+    if tag == T_INT:
+        return ST_INT.unpack_from(data, pos+2)[0]
+    if tag == T_STR:
+        return data[pos+2:]
+    if tag == T_PICKLE:
+        return pickle.loads(data[pos+2:])
+    if tag[:1] == RPC_ERROR:
+        raise pickle.loads(data[pos+1:])
+    raise RPCCodecException('Invalid RPC response')
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.core.operator.rpc_profiler
+@author Konstantin Andrusenko
+@date August 24, 2013
+
+This module contains the implementation of RPCProfiler class.
+Profiler collects statistic of RPC calls to operator process per method:
+    calls and errors counts
+    processing time (from dispatching to OperatorWorker to response sending)
+    and its histogram (RPC_LATENCY_BUCKETS)
+    queue wait time (from request receiving to dispatching)
+    request and response payload sizes
+Profiling is enabled by OPERATOR_RPC_PROFILING config parameter
+(it can be changed at runtime by UpdateNodeConfig operation)
+"""
+import time
+import bisect
+import threading
+
+from fabnet.core.constants import RPC_LATENCY_BUCKETS
+
+LATENCY_LABELS = ['<%gms'%(bound*1000) for bound in RPC_LATENCY_BUCKETS] + \
+                    ['>=%gms'%(RPC_LATENCY_BUCKETS[-1]*1000)]
+
+
+class MethodStat:
+    __slots__ = ('calls', 'errors', 'proc_time', 'max_proc_time', 'wait_time', 'max_wait_time',
+                    'req_bytes', 'resp_bytes', 'latency')
+
+    def __init__(self):
+        self.calls = self.errors = 0
+        self.proc_time = self.max_proc_time = 0.
+        self.wait_time = self.max_wait_time = 0.
+        self.req_bytes = self.resp_bytes = 0
+        self.latency = [0] * len(LATENCY_LABELS)
+
+    def dump(self):
+        calls = float(self.calls)
+        return {'calls': self.calls,
+                'errors': self.errors,
+                'avg_time_ms': round(self.proc_time * 1000 / calls, 3),
+                'max_time_ms': round(self.max_proc_time * 1000, 3),
+                'avg_wait_ms': round(self.wait_time * 1000 / calls, 3),
+                'max_wait_ms': round(self.max_wait_time * 1000, 3),
+                'req_bytes': self.req_bytes,
+                'resp_bytes': self.resp_bytes,
+                'avg_req_size': int(self.req_bytes / calls),
+                'avg_resp_size': int(self.resp_bytes / calls),
+                'latency': dict((label, cnt) for label, cnt in zip(LATENCY_LABELS, self.latency) if cnt)}
+
+
+class RPCProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.__lock = threading.Lock()
+        self.__methods = {}
+        self.__start_time = time.time()
+
+    def set_enabled(self, enabled):
+        enabled = bool(enabled)
+        if enabled and not self.enabled:
+            self.reset()
+        self.enabled = enabled
+
+    def update(self, method, wait_time, proc_time, req_size, resp_size, is_error=False):
+        self.__lock.acquire()
+        try:
+            stat = self.__methods.get(method, None)
+            if stat is None:
+                stat = self.__methods[method] = MethodStat()
+
+            stat.calls += 1
+            if is_error:
+                stat.errors += 1
+            stat.proc_time += proc_time
+            if proc_time > stat.max_proc_time:
+                stat.max_proc_time = proc_time
+            stat.wait_time += wait_time
+            if wait_time > stat.max_wait_time:
+                stat.max_wait_time = wait_time
+            stat.req_bytes += req_size
+            stat.resp_bytes += resp_size
+            stat.latency[bisect.bisect_right(RPC_LATENCY_BUCKETS, proc_time)] += 1
+        finally:
+            self.__lock.release()
+
+    def reset(self):
+        self.__lock.acquire()
+        try:
+            self.__methods = {}
+            self.__start_time = time.time()
+        finally:
+            self.__lock.release()
+
+    def get_stat(self):
+        self.__lock.acquire()
+        try:
+            period = time.time() - self.__start_time
+            methods = dict((method, stat.dump()) for method, stat in self.__methods.iteritems())
+        finally:
+            self.__lock.release()
+
+        calls = sum(stat['calls'] for stat in methods.itervalues())
+        return {'enabled': self.enabled,
+                'period': round(period, 3),
+                'calls': calls,
+                'calls_per_sec': round(calls / period, 3) if period else 0,
+                'methods': methods}
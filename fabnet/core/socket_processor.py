@@ -8,102 +8,311 @@ Copyright (C) 2012 Konstantin Andrusenko
 @author Konstantin Andrusenko
 @date December 28, 2012
 
-This module contains the implementation of SocketBasedChunks and  SocketProcessor classes.
+This module contains the implementation of SocketBasedChunks, PrefetchedChunks
+and SocketProcessor classes.
 """
+import sys
+import time
+import ssl
 import socket
+import select
 import threading
 
-from constants import BUF_SIZE, RC_REQ_CERTIFICATE, FRI_PACKET_INFO_LEN, RC_REQ_BINARY_CHUNK
+from constants import BUF_SIZE, RC_REQ_CERTIFICATE, FRI_PACKET_INFO_LEN, RC_REQ_BINARY_CHUNK, \
+                        FRI_PROTOCOL_REV, FRI_PROTOCOL_REV_BIN_HEADER, FRI_PROTOCOL_IDENTIFIER, \
+                        FRI_BIN_HEADER_IDENTIFIER, FRI_CHUNKS_WINDOW, FRI_PROTOCOL_REV_COMPRESSION, \
+                        FRI_COMPRESSED_IDENTIFIER
 from fri_base import FriBinaryProcessor, FabnetPacketRequest, FabnetPacketResponse, \
-            FriException, FriBinaryData, RamBasedBinaryData, FabnetPacket
+            FriException, FriConnectionClosed, FriBinaryData, RamBasedBinaryData, FabnetPacket, \
+            FileBasedChunks, SpooledBinaryData
+from link_tuner import tune_socket
+from inflight_budget import StreamBudget
+from fabnet.utils.sendfile import sendfile, SENDFILE_SUPPORTED
+
+#socket module of python 2.x does not define MSG_MORE (linux only flag)
+MSG_MORE = getattr(socket, 'MSG_MORE', 0x8000 if sys.platform.startswith('linux') else 0)
 
 
 class SocketBasedChunks(FriBinaryData):
-    def __init__(self, socket_processor, chunks_count):
+    """Binary chunks stream received from socket.
+    Chunks are requested by RC_REQ_BINARY_CHUNK packets. If sender supports
+    chunks window (binary_chunk_window in init packet), first request grants
+    'credits' for whole window and next requests grant one chunk each
+    (when previous chunk is consumed), so sender streams chunks
+    without waiting request for each chunk.
+    Chunks are granted within node-wide budget (SocketProcessor.inflight_budget),
+    received chunks are held in budget until stream is closed.
+    """
+    def __init__(self, socket_processor, chunks_count, window=1):
         self.__sock_proc = socket_processor
         self.__chunks_count = chunks_count
+        self.__window = max(window, 1)
         self.__last_idx = 0
+        self.__granted = 0
+        self.__budget = StreamBudget(socket_processor.inflight_budget, chunks_count)
+
+    def __del__(self):
+        self.__budget.release()
 
     def chunks_count(self):
         return self.__chunks_count
 
+    def __grant_chunks(self):
+        if self.__granted >= self.__chunks_count:
+            return
+
+        #stream does not wait budget while it has granted chunks for receiving
+        #(they are received first, so reserved budget is released by all streams)
+        outstanding = self.__granted - self.__last_idx
+        if self.__window == 1:
+            #lock-step mode (sender does not support chunks window)
+            self.__budget.reserve(1, wait=True)
+            self.__sock_proc.send_packet(FabnetPacketResponse(ret_code=RC_REQ_BINARY_CHUNK))
+            self.__granted += 1
+            return
+
+        credits = min(self.__window - outstanding, self.__chunks_count - self.__granted)
+        if credits <= 0 or not self.__budget.reserve(credits, wait=(outstanding == 0)):
+            return
+        self.__sock_proc.send_packet(FabnetPacketResponse(ret_code=RC_REQ_BINARY_CHUNK, \
+                                    ret_parameters={'credits': credits}))
+        self.__granted += credits
+
     def get_next_chunk(self):
-        if self.__last_idx >= self.__chunks_count:
+        if self.__last_idx >= self.__chunks_count or not self.__sock_proc:
             return None
 
         try:
-            self.__sock_proc.send_packet(FabnetPacketResponse(ret_code=RC_REQ_BINARY_CHUNK))
+            self.__grant_chunks()
             packet, bin_data = self.__sock_proc.read_next_packet()
             self.__last_idx += 1
+            self.__budget.received(len(bin_data))
 
             if packet.binary_chunk_idx > packet.binary_chunk_cnt:
-                raise FriException('Chunk index is bigger than chunks count (%s>%s)'%(idx, cnt))
+                raise FriException('Chunk index is bigger than chunks count (%s>%s)'%\
+                                    (packet.binary_chunk_idx, packet.binary_chunk_cnt))
 
             if self.__last_idx == self.__chunks_count:
-                self.__sock_proc.allow_close_socket()
+                self.__release_socket()
 
             return bin_data
         except Exception, err:
-            self.__sock_proc.allow_close_socket()
+            self.__release_socket(is_broken=True)
             raise err
 
+    def __release_socket(self, is_broken=False):
+        #socket processor can be reused after all chunks are received,
+        #so we should not touch it anymore
+        sock_proc = self.__sock_proc
+        self.__sock_proc = None
+        if not sock_proc:
+            return
+
+        if is_broken:
+            sock_proc.mark_broken()
+        sock_proc.allow_close_socket()
+
     def close(self):
-        if self.__sock_proc:
-            self.__sock_proc.allow_close_socket()
+        #not received chunks are pending in socket
+        self.__release_socket(is_broken=self.__last_idx < self.__chunks_count)
+        self.__budget.release()
+
+
+class PrefetchedChunks(FileBasedChunks):
+    """Binary chunks of first packet spooled to file by event loop front end.
+    Chunks are held in node-wide budget until data is read or closed
+    """
+    def __init__(self, file_path, budget=None, held_bytes=0):
+        FileBasedChunks.__init__(self, file_path, remove_on_close=True)
+        self.__budget = budget
+        self.__held = held_bytes
+
+    def __del__(self):
+        self.__release()
+        FileBasedChunks.__del__(self)
+
+    def __release(self):
+        if self.__budget and self.__held:
+            self.__budget.release(0, self.__held)
+        self.__held = 0
+
+    def close(self):
+        FileBasedChunks.close(self)
+        self.__release()
 
 
 class SocketProcessor:
     force_close_flag = threading.Event()
+    chunks_window = FRI_CHUNKS_WINDOW
+    #node-wide budget of received binary chunks (InFlightBudget object or None)
+    inflight_budget = None
 
     def __init__(self, sock, cert=None):
         self.__sock = sock
-        self.__rest_data = ''
+        self.__buf = None #receive buffer (allocated at first read)
+        self.__read_size = BUF_SIZE #size of receive buffer
+        self.__link_params = None #LinkParams object applied to socket
+        self.__buf_start = 0 #received data of next packet is buf[buf_start:buf_end]
+        self.__buf_end = 0
         self.__cert = cert
         self.__can_close_socket = False #socket can be closed (no pending chunks)
         self.__need_sock_close = False #socket should be closed (after all chunks received)
         self.__send_on_close = None #packet that should be send before close socket (ignore if None)
-
-    def read_next_packet(self):
-        data = ''
-        exp_len = None
-        header_len = 0
-        has_rest = len(self.__rest_data) > 0
-        while True:
+        self.__release_routine = None #routine that returns socket to connections pool (close socket if None)
+        self.__is_broken = False #socket is in unknown state and can not be reused
+        self.__spooled_path = None #file with binary chunks of first packet (received by front end)
+        self.__spooled_held = 0 #bytes of spooled chunks held in inflight_budget
+        self.protocol_rev = 0 #negotiated FRI protocol revision
+
+    def set_prefetched(self, data, spooled_path=None, held_bytes=0):
+        """Set data received from socket before (by event loop front end).
+        Binary chunks of first packet are spooled to file by front end,
+        so they are not requested from socket.
+        held_bytes of spooled chunks are released in inflight_budget
+        when binary data of packet is closed"""
+        self.__buf = bytearray(max(self.__read_size, len(data)))
+        self.__buf[:len(data)] = data
+        self.__buf_start, self.__buf_end = 0, len(data)
+        self.__spooled_path = spooled_path
+        self.__spooled_held = held_bytes
+
+    def __recv_into(self, view, nbytes):
+        recv_into = getattr(self.__sock, 'recv_into', None)
+        if recv_into:
+            return recv_into(view, nbytes)
+
+        #M2Crypto SSL connection has no recv_into method
+        received = self.__sock.recv(nbytes)
+        if not received:
+            return 0
+        view[:len(received)] = received
+        return len(received)
+
+    def __fill(self, buf, start, end, need_len):
+        """Receive data into buf[end:] until need_len bytes
+        are available from start position. Return new end position"""
+        view = memoryview(buf)
+        buf_len = len(buf)
+        while end - start < need_len:
             if self.force_close_flag.is_set():
                 raise FriException('forcing socket close!')
 
-            if self.__rest_data:
-                data = self.__rest_data
-                self.__rest_data = ''
-            else:
-                received = self.__sock.recv(BUF_SIZE)
+            received = self.__recv_into(view[end:], buf_len - end)
+            if not received:
+                if start == end:
+                    raise FriConnectionClosed('empty data block')
+                raise FriException('Invalid FRI packet! Connection is closed '\
+                        'after %s of %s bytes received'%(end-start, need_len))
+            end += received
+        return end
 
-                if not received:
-                    break
+    def read_next_packet(self):
+        """Read next packet from socket.
+        Data is received by recv_into() into preallocated buffer, received bytes
+        of next packet are kept in buffer (without copying). Packet that is not fit
+        into buffer is received into its own buffer, so its binary data is returned
+        as memoryview object (without copying)
+        """
+        if self.__buf is None or (len(self.__buf) != self.__read_size \
+                                    and self.__buf_start == self.__buf_end):
+            #buffer is reallocated by reader thread (it has no received data)
+            self.__buf = bytearray(self.__read_size)
+        buf = self.__buf
+        start, end = self.__buf_start, self.__buf_end
+        try:
+            if len(buf) - start < FRI_PACKET_INFO_LEN:
+                buf[:end-start] = buf[start:end]
+                start, end = 0, end-start
+            end = self.__fill(buf, start, end, FRI_PACKET_INFO_LEN)
+
+            exp_len, header_len = FriBinaryProcessor.get_expected_len(str(buf[start:start+FRI_PACKET_INFO_LEN]))
+            if exp_len <= len(buf):
+                if len(buf) - start < exp_len:
+                    buf[:end-start] = buf[start:end]
+                    start, end = 0, end-start
+                end = self.__fill(buf, start, end, exp_len)
+                data = buffer(buf, start, exp_len)
+                start += exp_len
+                packet, bin_data = FriBinaryProcessor.from_binary(data, exp_len, header_len)
+            else:
+                if FRI_PACKET_INFO_LEN + header_len <= len(buf):
+                    if len(buf) - start < FRI_PACKET_INFO_LEN + header_len:
+                        buf[:end-start] = buf[start:end]
+                        start, end = 0, end-start
+                    end = self.__fill(buf, start, end, FRI_PACKET_INFO_LEN + header_len)
+                    spooled = self.__spool_packet(buf, start, end, exp_len, header_len)
+                else:
+                    spooled = None
+
+                if spooled:
+                    packet, bin_data = spooled
+                else:
+                    packet_buf = bytearray(exp_len)
+                    packet_buf[:end-start] = buf[start:end]
+                    self.__fill(packet_buf, 0, end-start, exp_len)
+                    packet, bin_data = FriBinaryProcessor.from_binary(memoryview(packet_buf), exp_len, header_len)
+                start = end = 0
+        except Exception, err:
+            #packet is received partially, so socket can not be reused
+            self.__is_broken = True
+            raise err
+        finally:
+            if start == end:
+                start = end = 0
+            self.__buf_start, self.__buf_end = start, end
 
-                data += received
+        packet = FabnetPacket.create(packet)
+        return packet, bin_data
 
-            if exp_len is None:
-                if has_rest and len(data) < FRI_PACKET_INFO_LEN:
-                    continue
-                exp_len, header_len = FriBinaryProcessor.get_expected_len(data)
-            if exp_len and len(data) >= exp_len:
-                break
+    def __spool_packet(self, buf, start, end, exp_len, header_len):
+        """Receive binary data of packet that is not fit into buffer
+        into SpooledBinaryData object (data is spilled to file if it is large).
+        Packet header should be received into buf[start:end] already.
+        Return (header, binary data) tuple or None if packet can not be spooled
+        (compressed packets and binary chunks packets are not spooled)"""
+        prot = str(buf[start:start+4])
+        if prot == FRI_COMPRESSED_IDENTIFIER:
+            return None
+        header = FriBinaryProcessor.decode_header(prot, \
+                    memoryview(buf)[start+FRI_PACKET_INFO_LEN:start+FRI_PACKET_INFO_LEN+header_len])
+        if header.get('binary_chunk_idx', 0):
+            return None
 
-        if not data:
-            raise FriException('empty data block')
+        bin_data = SpooledBinaryData()
+        try:
+            pos = start + FRI_PACKET_INFO_LEN + header_len
+            bin_data.write(buffer(buf, pos, end-pos))
+            rest = exp_len - (end - start)
+            view = memoryview(buf)
+            while rest > 0:
+                if self.force_close_flag.is_set():
+                    raise FriException('forcing socket close!')
+                received = self.__recv_into(view, min(rest, len(buf)))
+                if not received:
+                    raise FriException('Invalid FRI packet! Connection is closed '\
+                            'after %s of %s bytes received'%(exp_len-rest, exp_len))
+                bin_data.write(view[:received])
+                rest -= received
+        except Exception, err:
+            bin_data.close()
+            raise err
+        return header, bin_data
 
-        if len(data) > exp_len:
-            self.__rest_data = data[exp_len:]
-            data = data[:exp_len]
+    def set_link_params(self, link_params):
+        """Apply LinkParams object of peer link (see LinkTuner):
+        socket buffers are increased and receive buffer is resized at next read"""
+        if link_params is None or link_params is self.__link_params:
+            return
+        self.__link_params = link_params
+        tune_socket(self.__sock, link_params.sock_buf_size)
+        self.__read_size = link_params.read_size
 
-        packet, bin_data = FriBinaryProcessor.from_binary(data, exp_len, header_len)
-        packet = FabnetPacket.create(packet)
-        return packet, bin_data
+    def __has_rest_data(self):
+        return self.__buf_start < self.__buf_end
 
     def __send_cert(self):
         req = FabnetPacketRequest(method='crtput', parameters={'certificate': self.__cert})
-        self.__sock.sendall(req.dump())
+        self.__sock.sendall(req.dump(protocol_id=self.get_protocol_id()))
 
     def recv_packet(self, allow_socket_close=True):
         packet, bin_data = self.read_next_packet()
@@ -115,12 +324,21 @@ class SocketProcessor:
         if cnt > 0 and bin_data:
             raise FriException('Binary data found in init chunk packet (%s chunks expected)'%cnt)
 
-        if cnt > 0:
-            packet.binary_data = SocketBasedChunks(self, cnt)
+        if cnt > 0 and self.__spooled_path:
+            packet.binary_data = PrefetchedChunks(self.__spooled_path, \
+                                        self.inflight_budget, self.__spooled_held)
+            self.__spooled_held = 0
+            packet.binary_chunk_cnt = 0
+            self.__spooled_path = None
+        elif cnt > 0:
+            window = min(packet.binary_chunk_window, self.chunks_window)
+            packet.binary_data = SocketBasedChunks(self, cnt, window)
             self.__can_close_socket = False
             return packet
 
-        if bin_data:
+        if isinstance(bin_data, FriBinaryData):
+            packet.binary_data = bin_data
+        elif bin_data:
             packet.binary_data = RamBasedBinaryData(bin_data)
 
         if allow_socket_close:
@@ -131,31 +349,169 @@ class SocketProcessor:
     def send_packet(self, packet, wait_response=False):
         if packet.binary_data and packet.binary_data.chunks_count() > 1:
             packet.binary_chunk_cnt = packet.binary_data.chunks_count()
+            if self.chunks_window > 1:
+                packet.binary_chunk_window = self.chunks_window
 
-            self.__sock.sendall(packet.dump(with_bin=False))
+            self.__sock.sendall(packet.dump(with_bin=False, protocol_id=self.get_protocol_id()))
+            packet.binary_chunk_window = 0
 
             if packet.is_request:
                 allow_packet, _ = self.read_next_packet()
                 if allow_packet.is_response and allow_packet.ret_code == RC_REQ_CERTIFICATE:
                     self.__send_cert()
 
+            #chunks are sent while receiver granted credits
+            #(peer without chunks window support requests each chunk)
+            credits = 0
+            t0 = None
             for i in xrange(packet.binary_chunk_cnt):
-                resp_packet = self.recv_packet()
-                if resp_packet.ret_code != RC_REQ_BINARY_CHUNK:
-                    return resp_packet
-
+                if credits == 0:
+                    resp_packet = self.recv_packet()
+                    if resp_packet.ret_code != RC_REQ_BINARY_CHUNK:
+                        return resp_packet
+                    credits = int(resp_packet.ret_parameters.get('credits', 1))
+                    if t0 is None:
+                        t0 = time.time()
+
+                credits -= 1
                 packet.binary_chunk_idx = i+1
-                dumped_chunk = packet.dump_next_chunk()
-                self.__sock.sendall(dumped_chunk)
+                self.send_packet_data(packet, next_chunk=True)
 
+            if t0 is not None:
+                packet.transfer_time = time.time() - t0
             packet.binary_chunk_cnt = None
             packet.binary_chunk_idx = None
         else:
-            self.__sock.sendall(packet.dump())
+            self.send_packet_data(packet)
 
         if wait_response:
             return self.recv_packet()
 
+    def __is_plain_socket(self):
+        #SSL sockets encrypt data in user space
+        return isinstance(self.__sock, socket.socket) and not isinstance(self.__sock, ssl.SSLSocket)
+
+    def __can_sendfile(self):
+        return SENDFILE_SUPPORTED and self.__is_plain_socket()
+
+    def send_buffers(self, buffers):
+        """Send list of buffers without joining them (last buffer is a payload).
+        Leading buffers are sent with MSG_MORE flag over plain socket,
+        so kernel forms segments from data of all buffers (as writev does)"""
+        if len(buffers) == 1:
+            self.__sock.sendall(buffers[0])
+            return
+
+        head = ''.join(buffers[:-1])
+        payload = buffers[-1]
+        if self.__is_plain_socket():
+            self.__sock.sendall(head, MSG_MORE)
+        else:
+            if isinstance(payload, memoryview):
+                payload = payload.tobytes()
+            self.__sock.sendall(head)
+        self.__sock.sendall(payload)
+
+    def send_packet_data(self, packet, next_chunk=False):
+        """Send packet with binary data (or with next binary chunk only).
+        File based binary data is sent by sendfile() over plain TCP
+        socket (without reading file data into memory)"""
+        protocol_id = self.get_protocol_id()
+        region = None
+        if packet.binary_data and self.__can_sendfile():
+            region = packet.binary_data.get_next_chunk_region()
+
+        if region is None:
+            if next_chunk:
+                chunk = packet.binary_data.get_next_chunk_view() if packet.binary_data else None
+                if not chunk:
+                    raise FriException('Binary data of message %s is ended unexpectedly'%packet.message_id)
+                self.send_buffers(packet.dump_chunk(chunk, protocol_id))
+            else:
+                self.__sock.sendall(packet.dump(protocol_id=protocol_id))
+            return
+
+        fd, offset, length = region
+        self.__sock.sendall(packet.dump_header(length, protocol_id))
+        sendfile(self.__sock, fd, offset, length)
+
+    def sendall(self, data):
+        self.__sock.sendall(data)
+
+    def is_multiplexed(self):
+        return False
+
+    def get_protocol_id(self):
+        """Return protocol identifier (header codec) for sending packets"""
+        if self.protocol_rev >= FRI_PROTOCOL_REV_COMPRESSION:
+            return FRI_COMPRESSED_IDENTIFIER
+        if self.protocol_rev >= FRI_PROTOCOL_REV_BIN_HEADER:
+            return FRI_BIN_HEADER_IDENTIFIER
+        return FRI_PROTOCOL_IDENTIFIER
+
+    def accept_protocol_rev(self, request, response):
+        """Negotiate FRI protocol revision requested by client.
+        Revision is accepted for keep-alive connections only"""
+        if request.protocol_rev and request.keep_alive and response.keep_alive:
+            self.protocol_rev = min(request.protocol_rev, FRI_PROTOCOL_REV)
+            response.protocol_rev = self.protocol_rev
+
+    def settimeout(self, timeout):
+        if self.__sock:
+            self.__sock.settimeout(timeout)
+
+    def mark_broken(self):
+        self.__is_broken = True
+
+    def is_alive(self):
+        """Check that idle socket is not closed by peer"""
+        if not self.__sock or self.__has_rest_data() or self.__is_broken:
+            return False
+
+        try:
+            readable, _, _ = select.select([self.__sock], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return False
+
+        #idle socket is readable if it is closed by peer (or garbage received)
+        return not readable
+
+    def wait_next_packet(self, timeout):
+        """Wait next packet on keep-alive socket.
+        Return False if no data received in timeout"""
+        if not self.__sock or self.__is_broken:
+            return False
+
+        if self.__has_rest_data():
+            return True
+
+        pending = getattr(self.__sock, 'pending', None)
+        if pending and pending():
+            return True
+
+        try:
+            readable, _, _ = select.select([self.__sock], [], [], timeout)
+        except (select.error, socket.error, ValueError):
+            return False
+
+        return bool(readable)
+
+    def release_socket(self, release_routine):
+        """Return socket to connections pool (by release_routine call)
+        instead of closing. Socket will be released after all pending
+        chunks are received"""
+        self.__release_routine = release_routine
+        self.close_socket()
+
+    def drop_socket(self):
+        """Forget socket without shutdown
+        (for sockets shared with other process)"""
+        if self.__sock:
+            try:
+                self.__sock.close()
+            except socket.error:
+                pass
+            self.__sock = None
 
     def allow_close_socket(self):
         """This method trying close socket from SocketBasedChunks"""
@@ -177,6 +533,15 @@ class SocketProcessor:
     def __close_sock(self):
         if not self.__sock:
             return
+
+        release_routine = self.__release_routine
+        self.__release_routine = None
+        if release_routine and not (self.__is_broken or self.__has_rest_data() or self.__send_on_close):
+            self.__need_sock_close = False
+            self.__can_close_socket = False
+            release_routine(self)
+            return
+
         try:
             if self.__send_on_close:
                 self.send_packet(self.__send_on_close)
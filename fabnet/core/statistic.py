@@ -46,7 +46,7 @@ class StatAtom:
         return self.__value / float(self.__cnt)
 
     def dump(self):
-        if not self.__cnt:
+        if self.__cnt is None:
             return self.__value
         return (self.__cnt, self.__value)
 
@@ -72,6 +72,10 @@ class StatMap:
         finally:
             self.__lock.release()
 
+    def increment(self, key, value=1):
+        """Counter (values are summed, not averaged)"""
+        self.update(key, value, 0)
+
     def set(self, key, value):
         self.__lock.acquire()
         try:
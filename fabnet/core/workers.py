@@ -8,17 +8,70 @@ Copyright (C) 2013 Konstantin Andrusenko
 @author Konstantin Andrusenko
 @date January 03, 2013
 """
+import os
+import time
 import threading
 import traceback
 import socket
+import select
+import errno
 import multiprocessing as mp
 
 from fabnet.utils.logger import core_logger as logger
-from fabnet.core.constants import STOP_WORKER_EVENT
+from fabnet.core.constants import STOP_WORKER_EVENT, FRI_KEEP_ALIVE_TIMEOUT, \
+                                    FRI_KEEP_ALIVE_CHECK_PERIOD, FRI_PROTOCOL_REV_MULTIPLEXED, \
+                                    FRI_ACCEPT_CHECK_PERIOD
 from fabnet.core.socket_processor import SocketProcessor
+from fabnet.core.multiplexed_socket import MultiplexedConnectionHandler
+from fabnet.core.fri_event_loop import FramedConnection, NONBLOCK_ERRORS
+from fabnet.core.fri_server import bind_reuseport_socket, LocalConnection, check_peer_credentials
+from fabnet.core.fri_base import FriException
 from multiprocessing.reduction import rebuild_handle
 
-from M2Crypto.SSL import Context, Connection
+from M2Crypto.SSL import Connection
+
+def wait_keep_alive(worker, socket_proc):
+    """Wait next packet on keep-alive socket.
+    Socket is released if no packet received in FRI_KEEP_ALIVE_TIMEOUT
+    or worker has pending work in queue (new connection or stop event)
+    that no free worker can get.
+    Worker is not busy while waiting
+    """
+    if socket_proc.wait_next_packet(0):
+        return True
+
+    worker.set_busy(False)
+    wait_time = 0
+    while wait_time < FRI_KEEP_ALIVE_TIMEOUT:
+        if worker.has_pending_work() and not worker.has_free_workers():
+            return False
+        if socket_proc.wait_next_packet(FRI_KEEP_ALIVE_CHECK_PERIOD):
+            worker.set_busy(True)
+            return True
+        wait_time += FRI_KEEP_ALIVE_CHECK_PERIOD
+    return False
+
+def accept_ssl(ssl_context, sock, ssl_stat=None):
+    """Server side SSL handshake over accepted socket.
+    Handshakes count and time (full and resumed) are collected
+    into ssl_stat StatMap object (if set)
+    """
+    t0 = time.time()
+    conn = Connection(ssl_context, sock)
+    conn.setup_ssl()
+    conn.set_accept_state()
+    conn.accept_ssl()
+
+    if ssl_stat is not None:
+        dt = (time.time() - t0) * 1000
+        ssl_stat.increment('handshakes')
+        if conn.session_reused():
+            ssl_stat.increment('resumed_handshakes')
+            ssl_stat.update('resumed_handshake_ms', dt)
+        else:
+            ssl_stat.update('full_handshake_ms', dt)
+    return conn
+
 
 class ThreadBasedAbstractWorker(threading.Thread):
     is_threaded = True
@@ -29,15 +82,45 @@ class ThreadBasedAbstractWorker(threading.Thread):
         self.setName(name)
         self.__queue = queue
         self.__busy_flag = threading.Event()
+        #shared count of workers waiting for work in queue (set by workers manager)
+        self.free_count = None
 
     def is_busy(self):
         return self.__busy_flag.is_set()
 
+    def set_busy(self, is_busy):
+        if is_busy:
+            self.__busy_flag.set()
+        else:
+            self.__busy_flag.clear()
+
+    def has_pending_work(self):
+        return not self.__queue.empty()
+
+    def has_free_workers(self):
+        if self.free_count is None:
+            return False
+        return self.free_count.value > 0
+
+    def __set_free(self, is_free):
+        if self.free_count is None:
+            return
+        lock = self.free_count.get_lock()
+        lock.acquire()
+        try:
+            self.free_count.value += 1 if is_free else -1
+        finally:
+            lock.release()
+
     def run(self):
         self.before_start()
         logger.info('worker is started!')
         while True:
-            data = self.__queue.get()
+            self.__set_free(True)
+            try:
+                data = self.__queue.get()
+            finally:
+                self.__set_free(False)
             if data == STOP_WORKER_EVENT:
                 break
 
@@ -76,6 +159,11 @@ class ProcessBasedAbstractWorker(mp.Process):
         self.__is_busy = mp.Value("b", False, lock=mp.Lock())
         self.__queue = queue
         self.__name = name
+        #(hostname, port) for accepting connections by worker itself (SO_REUSEPORT mode)
+        self.listen_address = None
+        self.__listen_sock = None
+        #shared count of workers waiting for work in queue (set by workers manager)
+        self.free_count = None
 
     def getName(self):
         return self.__name
@@ -83,15 +171,80 @@ class ProcessBasedAbstractWorker(mp.Process):
     def is_busy(self):
         return self.__is_busy.value
 
+    def set_busy(self, is_busy):
+        self.__is_busy.value = is_busy
+
+    def has_pending_work(self):
+        if not self.__queue.empty():
+            return True
+        if self.__listen_sock:
+            return bool(select.select([self.__listen_sock], [], [], 0)[0])
+        return False
+
+    def has_free_workers(self):
+        if self.free_count is None:
+            return False
+        return self.free_count.value > 0
+
+    def __set_free(self, is_free):
+        if self.free_count is None:
+            return
+        lock = self.free_count.get_lock()
+        lock.acquire()
+        try:
+            self.free_count.value += 1 if is_free else -1
+        finally:
+            lock.release()
+
+    def __get_work(self):
+        """Return next item from queue or connection accepted
+        on own listening socket (SO_REUSEPORT mode)"""
+        if not self.__listen_sock:
+            return self.__queue.get()
+
+        while True:
+            if not self.__queue.empty():
+                return self.__queue.get()
+
+            try:
+                readable = select.select([self.__listen_sock], [], [], FRI_ACCEPT_CHECK_PERIOD)[0]
+            except select.error, err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise err
+            if not readable:
+                continue
+
+            try:
+                sock, _ = self.__listen_sock.accept()
+            except socket.error, err:
+                if err.errno in NONBLOCK_ERRORS or err.errno == errno.ECONNABORTED:
+                    continue
+                raise err
+            sock.setblocking(1)
+            return sock
+
     def run(self):
         cur_thread = threading.current_thread()
         cur_thread.setName(self.__name)
 
+        if self.listen_address:
+            try:
+                self.__listen_sock = bind_reuseport_socket(*self.listen_address)
+                self.__listen_sock.setblocking(0)
+            except Exception, err:
+                logger.error('[%s] listening socket does not bound: %s'%(self.__name, err))
+                return
+
         self.before_start()
 
         logger.info('worker is started!')
         while True:
-            data = self.__queue.get()
+            self.__set_free(True)
+            try:
+                data = self.__get_work()
+            finally:
+                self.__set_free(False)
             if data == STOP_WORKER_EVENT:
                 break
 
@@ -106,6 +259,15 @@ class ProcessBasedAbstractWorker(mp.Process):
                 #self.__queue.task_done()
                 self.__is_busy.value = False
 
+        if self.__listen_sock:
+            #connections from backlog of this socket are reset by kernel
+            try:
+                self.__listen_sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.__listen_sock.close()
+            self.__listen_sock = None
+
         self.after_stop()
         logger.info('worker is stopped!')
 
@@ -127,25 +289,48 @@ class ThreadBasedFriWorker(ThreadBasedAbstractWorker):
         ThreadBasedAbstractWorker.__init__(self, name, queue)
         self._key_storage = key_storage
         self._ssl_context = None if not self._key_storage else self._key_storage.get_node_context()
+        self.ssl_stat = None
 
     def worker_routine(self, socket):
-        if self._key_storage:
-            socket = Connection(self._ssl_context, socket)
-            socket.setup_ssl()
-            socket.set_accept_state()
-            socket.accept_ssl()
+        framed_conn = None
+        if isinstance(socket, FramedConnection):
+            #first packet is received by event loop front end
+            framed_conn = socket
+            socket = framed_conn.sock
+        elif isinstance(socket, LocalConnection):
+            #unix socket connection is not wrapped by SSL
+            socket = socket.sock
+            try:
+                check_peer_credentials(socket)
+            except Exception, err:
+                socket.close()
+                raise err
+        elif self._key_storage:
+            socket = accept_ssl(self._ssl_context, socket, self.ssl_stat)
 
         socket_proc = SocketProcessor(socket)
+        if framed_conn:
+            socket_proc.set_prefetched(framed_conn.data, framed_conn.spooled_path, \
+                                        framed_conn.held_bytes)
 
         try:
-            self.process(socket_proc)
+            while self.process(socket_proc):
+                if socket_proc.protocol_rev >= FRI_PROTOCOL_REV_MULTIPLEXED:
+                    MultiplexedConnectionHandler(socket_proc, self).serve()
+                    break
+                if not wait_keep_alive(self, socket_proc):
+                    break
             socket_proc.close_socket()
         except Exception, err:
             socket_proc.close_socket(force=True)
             raise err
 
     def process(self, socket_processor):
-        """This method must be implemented in inherited class"""
+        """This method must be implemented in inherited class
+        Return True if socket should be kept alive for next packet
+        (socket_processor can be multiplexed, so this method can be
+        called from many threads at once)
+        """
         raise RuntimeError('Not implemented')
 
 
@@ -154,28 +339,61 @@ class ProcessBasedFriWorker(ProcessBasedAbstractWorker):
         ProcessBasedAbstractWorker.__init__(self, name, queue)
         self._key_storage = key_storage
         self._ssl_context = None if not self._key_storage else self._key_storage.get_node_context()
+        self.ssl_stat = None
 
     def worker_routine(self, reduced_socket):
-        fd = rebuild_handle(reduced_socket)
-        sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
-        mp.forking.close(fd)
-
-        if self._key_storage:
-            sock = Connection(self._ssl_context, sock)
-            sock.setup_ssl()
-            sock.set_accept_state()
-            sock.accept_ssl()
+        framed_conn = None
+        is_local = False
+        if isinstance(reduced_socket, FramedConnection):
+            #first packet is received by event loop front end
+            framed_conn = reduced_socket
+            reduced_socket = framed_conn.sock
+        elif isinstance(reduced_socket, LocalConnection):
+            #connection is accepted on unix socket
+            is_local = True
+            reduced_socket = reduced_socket.sock
+
+        if isinstance(reduced_socket, socket.socket):
+            #connection is accepted by worker itself (SO_REUSEPORT mode)
+            sock = reduced_socket
+        else:
+            fd = rebuild_handle(reduced_socket)
+            family = socket.AF_UNIX if is_local else socket.AF_INET
+            sock = socket.fromfd(fd, family, socket.SOCK_STREAM)
+            mp.forking.close(fd)
+
+        if is_local:
+            #unix socket connection is not wrapped by SSL
+            try:
+                check_peer_credentials(sock)
+            except Exception, err:
+                sock.close()
+                raise err
+        elif self._key_storage and not framed_conn:
+            sock = accept_ssl(self._ssl_context, sock, self.ssl_stat)
 
         socket_proc = SocketProcessor(sock)
+        if framed_conn:
+            socket_proc.set_prefetched(framed_conn.data, framed_conn.spooled_path, \
+                                        framed_conn.held_bytes)
 
         try:
-            self.process(socket_proc)
+            while self.process(socket_proc):
+                if socket_proc.protocol_rev >= FRI_PROTOCOL_REV_MULTIPLEXED:
+                    MultiplexedConnectionHandler(socket_proc, self).serve()
+                    break
+                if not wait_keep_alive(self, socket_proc):
+                    break
             socket_proc.close_socket()
         except Exception, err:
             socket_proc.close_socket(force=True)
             raise err
 
     def process(self, socket_processor):
-        """This method must be implemented in inherited class"""
+        """This method must be implemented in inherited class
+        Return True if socket should be kept alive for next packet
+        (socket_processor can be multiplexed, so this method can be
+        called from many threads at once)
+        """
         raise RuntimeError('Not implemented')
 
@@ -38,6 +38,10 @@ class WorkersManager(threading.Thread):
         self.__workers_idx = 0
         self.__lock = threading.Lock()
         self.__status = S_PENDING
+        self.__listen_address = None
+        #count of workers waiting for work in queue
+        #(idle keep-alive connections are released if there is no free worker)
+        self.__free_count = mp.Value('i', 0)
         self.stopped = threading.Event()
 
     def get_queue(self):
@@ -47,6 +51,11 @@ class WorkersManager(threading.Thread):
         finally:
             self.__lock.release()
 
+    def set_listen_address(self, listen_address):
+        """Workers accept connections on (hostname, port) itself
+        (SO_REUSEPORT mode, supported by process based workers only)"""
+        self.__listen_address = listen_address
+
     def get_workers_name(self):
         return self.worker_class.__name__
 
@@ -103,8 +112,9 @@ class WorkersManager(threading.Thread):
         while not self.stopped.is_set():
             try:
                 time.sleep(.5)
-                act, busy = self.get_workers_stat()
-                if act != busy:
+                #workers holding idle keep-alive connections are not busy
+                #but can not get work from queue, so free workers are counted
+                if self.__free_count.value > 0:
                     not_empty_queue_count = 0
                     empty_queue_count += 1
                 else:
@@ -134,6 +144,9 @@ class WorkersManager(threading.Thread):
 
             worker_name = '%s-%s#%02i' % (self.server_name, self.worker_class.__name__, self.__workers_idx)
             worker = self.worker_class(worker_name, self.queue, *self.init_params)
+            if self.__listen_address:
+                worker.listen_address = self.__listen_address
+            worker.free_count = self.__free_count
 
             self.__workers_idx += 1
             worker.start()
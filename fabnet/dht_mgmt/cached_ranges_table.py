@@ -0,0 +1,123 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.dht_mgmt.cached_ranges_table
+
+@author Konstantin Andrusenko
+@date August 16, 2013
+
+This module contains the implementation of CachedRangesTable class.
+Hash ranges table is owned by operator process, workers keep read-only
+snapshot of it and find ranges of keys locally (without RPC call).
+Operator increments version of ranges table (counter in memory mapped
+file in node home directory) on each table change, so workers check
+snapshot actuality by reading the counter.
+"""
+import os
+import mmap
+import struct
+import pickle
+import bisect
+import threading
+
+from fabnet.dht_mgmt.constants import RANGES_TABLE_VERSION_FILE
+
+VERSION_STRUCT = struct.Struct('<Q')
+
+
+class RangesTableVersion:
+    """Counter of ranges table changes shared by processes of node"""
+    def __init__(self, home_dir, create=True):
+        path = os.path.join(home_dir, RANGES_TABLE_VERSION_FILE)
+        flags = os.O_RDWR | os.O_CREAT if create else os.O_RDONLY
+        fd = os.open(path, flags, 0644)
+        try:
+            if create and os.fstat(fd).st_size < VERSION_STRUCT.size:
+                os.ftruncate(fd, VERSION_STRUCT.size)
+            access = mmap.ACCESS_WRITE if create else mmap.ACCESS_READ
+            self.__mm = mmap.mmap(fd, VERSION_STRUCT.size, access=access)
+        finally:
+            os.close(fd)
+
+    def get(self):
+        return VERSION_STRUCT.unpack_from(self.__mm)[0]
+
+    def increment(self):
+        VERSION_STRUCT.pack_into(self.__mm, 0, self.get() + 1)
+
+
+class CachedRangesTable:
+    def __init__(self, operator, home_dir):
+        self.__operator = operator
+        self.__home_dir = home_dir
+        self.__version = None
+        self.__lock = threading.Lock()
+        #(version, ranges starts, ranges) of current snapshot
+        self.__snapshot = (None, [], [])
+        self.__refreshes = 0
+
+    def __get_snapshot(self):
+        if self.__version is None:
+            try:
+                self.__version = RangesTableVersion(self.__home_dir, create=False)
+            except EnvironmentError:
+                #ranges table is not versioned by operator
+                return None
+
+        version = self.__version.get()
+        snapshot = self.__snapshot
+        if snapshot[0] == version:
+            return snapshot
+
+        self.__lock.acquire()
+        try:
+            if self.__snapshot[0] == version:
+                return self.__snapshot
+
+            #version is read before dump, so snapshot can be newer than version (not older)
+            ranges = pickle.loads(self.__operator.dump_ranges_table())[0]
+            ranges = [(r.start, r.end, r.node_address) for r in ranges]
+            self.__snapshot = (version, [r[0] for r in ranges], ranges)
+            self.__refreshes += 1
+            return self.__snapshot
+        finally:
+            self.__lock.release()
+
+    def find_range(self, key):
+        """Return (start, end, node address) of range that contains key
+        or None if range is not found (the same as DHTOperator.find_range)"""
+        snapshot = self.__get_snapshot()
+        if snapshot is None:
+            return self.__operator.find_range(key)
+
+        if type(key) in (str, unicode):
+            key = long(key, 16)
+        _, starts, ranges = snapshot
+        idx = bisect.bisect_right(starts, key) - 1
+        if idx < 0 or ranges[idx][1] < key:
+            return None
+        return ranges[idx]
+
+    def get_refreshes_count(self):
+        return self.__refreshes
+
+
+CACHED_TABLES = {}
+CACHED_TABLES_LOCK = threading.Lock()
+
+def get_ranges_table(operator, home_dir):
+    """Return CachedRangesTable of node (by home directory) for current process"""
+    table = CACHED_TABLES.get(home_dir, None)
+    if table is not None:
+        return table
+
+    CACHED_TABLES_LOCK.acquire()
+    try:
+        if home_dir not in CACHED_TABLES:
+            CACHED_TABLES[home_dir] = CachedRangesTable(operator, home_dir)
+        return CACHED_TABLES[home_dir]
+    finally:
+        CACHED_TABLES_LOCK.release()
@@ -11,9 +11,20 @@ RC_NO_DATA = 324
 RC_OLD_DATA = 325
 RC_INVALID_DATA = 326
 RC_NO_FREE_SPACE = 327
+RC_CHECKSUM_MISMATCH = 328
+
+#checksum of data block verified while receiving is trusted during this time (in seconds)
+#for skipping rewrite of the same data block (resent replica). CheckDataBlock always re-reads data
+VERIFIED_CHECKSUM_TTL = 60
+#max count of verified checksums kept in memory (least recently used are evicted)
+VERIFIED_CHECKSUMS_MAX_COUNT = 10000
 
 MIN_REPLICA_COUNT = 2
 
+#file (in node home directory) with version of hash ranges table,
+#it is mapped to memory by operator and workers (see CachedRangesTable)
+RANGES_TABLE_VERSION_FILE = 'ranges_table.version'
+
 
 DEFAULT_DHT_CONFIG = { 'WAIT_RANGE_TIMEOUT': 120, #if no ranges found for init DHT node, wait this timeout (in seconds)
                         'DHT_CYCLE_TRY_COUNT': 3, #waiting WAIT_RANGE_TIMEOUT*DHT_CYCLE_TRY_COUNT seconds before node crash
@@ -14,10 +14,16 @@ import time
 import struct
 import hashlib
 
+from fabnet.core.fri_base import FriBinaryData
+
 DATA_BLOCK_LABEL = 'FDB01'
 STRUCT_FMT = '<5sd20sb20s20s'
 
 
+class DataBlockChecksumMismatch(Exception):
+    pass
+
+
 class DataBlockHeader:
     HEADER_LEN = struct.calcsize(STRUCT_FMT)
 
@@ -72,3 +78,68 @@ class DataBlockHeader:
             raise Exception('Data block has bad checksum')
 
 
+class VerifiedBinaryData(FriBinaryData):
+    """Binary data of data block that is verified while chunks are read.
+    If has_header is True, binary data begins with data block header
+    and checksum from header is expected (header checksum is compared
+    with exp_checksum at once if exp_checksum is passed).
+    DataBlockChecksumMismatch is raised when mismatch is detected,
+    so data transfer is aborted without data block re-reading
+    """
+    def __init__(self, binary_data, exp_checksum=None, has_header=False):
+        self.__binary_data = binary_data
+        self.__exp_checksum = exp_checksum
+        self.__header = '' if has_header else None
+        self.__h_func = hashlib.sha1('')
+        self.__checksum = None
+
+    def chunks_count(self):
+        return self.__binary_data.chunks_count()
+
+    def __parse_header(self, chunk):
+        rest = DataBlockHeader.HEADER_LEN - len(self.__header)
+        header_part = chunk[:rest]
+        if isinstance(header_part, memoryview):
+            header_part = header_part.tobytes()
+        self.__header += header_part
+        if len(self.__header) < DataBlockHeader.HEADER_LEN:
+            return None
+
+        _, _, checksum, _, _ = DataBlockHeader.unpack(self.__header)
+        if self.__exp_checksum and self.__exp_checksum != checksum:
+            raise DataBlockChecksumMismatch('Data block header checksum is not equal to expected')
+        self.__exp_checksum = checksum
+        self.__header = None
+        return chunk[rest:]
+
+    def get_next_chunk(self):
+        chunk = self.__binary_data.get_next_chunk()
+        if chunk is None:
+            self.__verify()
+            return None
+
+        data = chunk
+        if self.__header is not None:
+            data = self.__parse_header(chunk)
+        if data:
+            self.__h_func.update(data)
+        return chunk
+
+    def __verify(self):
+        if self.__checksum is not None:
+            return
+        if self.__header is not None:
+            raise DataBlockChecksumMismatch('Data block is truncated (no data block header found)')
+
+        checksum = self.__h_func.hexdigest()
+        if self.__exp_checksum and self.__exp_checksum != checksum:
+            raise DataBlockChecksumMismatch('Data block checksum is not equal to expected')
+        self.__checksum = checksum
+
+    def checksum(self):
+        """Return verified checksum of data block data
+        (all chunks should be read before)"""
+        return self.__checksum
+
+    def close(self):
+        self.__binary_data.close()
@@ -18,8 +18,9 @@ from datetime import datetime
 
 from fabnet.core.operator import Operator
 from hash_ranges_table import HashRange, HashRangesTable
+from fabnet.dht_mgmt.cached_ranges_table import RangesTableVersion
 from fabnet.dht_mgmt.fs_mapped_ranges import FSHashRanges
-from fabnet.core.fri_base import FabnetPacketRequest
+from fabnet.core.fri_base import FabnetPacketRequest, SpooledBinaryData
 from fabnet.utils.logger import oper_logger as logger
 from fabnet.core.config import Config
 from fabnet.dht_mgmt.constants import DS_INITIALIZE, DS_DESTROYING, DS_NORMALWORK, \
@@ -57,6 +58,12 @@ OPERLIST = [GetRangeDataRequestOperation, GetRangesTableOperation,
 class DHTOperator(Operator):
     OPTYPE = 'DHT'
 
+    @classmethod
+    def get_spool_dir(cls, home_dir):
+        #received data blocks are spooled to range tmp directory,
+        #so they are on the same file system with range
+        return os.path.join(home_dir, 'dht_range', 'tmp')
+
     def __init__(self, self_address, home_dir='/tmp/', key_storage=None, \
                         is_init_node=False, node_name='unknown', config={}):
         cur_cfg = {}
@@ -66,7 +73,8 @@ class DHTOperator(Operator):
                                         is_init_node, node_name, cur_cfg)
 
         self.status = DS_INITIALIZE
-        self.ranges_table = HashRangesTable()
+        #workers find ranges in snapshot of table, it is refreshed when version is changed
+        self.ranges_table = HashRangesTable(RangesTableVersion(home_dir))
         if is_init_node:
             self.ranges_table.append(MIN_HASH, MAX_HASH, self.self_address)
 
@@ -76,6 +84,7 @@ class DHTOperator(Operator):
 
         self.__split_requests_cache = []
         self.__dht_range = FSHashRanges.discovery_range(self.save_path, ret_full=is_init_node)
+        SpooledBinaryData.set_spool_dir(self.get_spool_dir(home_dir))
         self.__start_dht_try_count = 0
         self.__init_dht_thread = None
         if is_init_node:
@@ -405,8 +414,8 @@ class DHTOperator(Operator):
     def join_subranges(self):
         self.get_dht_range().join_subranges()
 
-    def put_data_block(self, key, tempfile_path, is_replica, carefully_save):
-        self.get_dht_range().put(key, tempfile_path, is_replica, carefully_save)
+    def put_data_block(self, key, tempfile_path, is_replica, carefully_save, checksum=None):
+        self.get_dht_range().put(key, tempfile_path, is_replica, carefully_save, checksum)
 
     def get_subranges(self):
         self.get_dht_range().get_subranges()
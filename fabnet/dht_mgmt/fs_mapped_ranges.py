@@ -16,10 +16,12 @@ import hashlib
 import copy
 import time
 from datetime import datetime
+from collections import OrderedDict
 
 from fabnet.utils.logger import oper_logger as logger
 from fabnet.utils.internal import total_seconds
-from fabnet.dht_mgmt.constants import MIN_HASH, MAX_HASH
+from fabnet.dht_mgmt.constants import MIN_HASH, MAX_HASH, VERIFIED_CHECKSUM_TTL, \
+                                        VERIFIED_CHECKSUMS_MAX_COUNT
 from fabnet.core.config import Config
 from fabnet.dht_mgmt.data_block import DataBlockHeader
 from fabnet.core.fri_base import FileBasedChunks
@@ -43,10 +45,59 @@ class FSHashRangesNoFreeSpace(FSHashRangesException):
     pass
 
 
+class VerifiedChecksums:
+    """Checksums of data blocks verified while receiving.
+    Checksum is valid while data block file is not changed (size and mtime)
+    and ttl is not expired. Least recently used checksums are evicted
+    """
+    def __init__(self, max_count=VERIFIED_CHECKSUMS_MAX_COUNT, ttl=VERIFIED_CHECKSUM_TTL):
+        self.__checksums = OrderedDict()
+        self.__max_count = max_count
+        self.__ttl = ttl
+        self.__lock = threading.Lock()
+
+    def update(self, path, checksum=None):
+        self.__lock.acquire()
+        try:
+            self.__checksums.pop(path, None)
+            if checksum is None:
+                return
+
+            while len(self.__checksums) >= self.__max_count:
+                self.__checksums.popitem(last=False)
+            f_stat = os.stat(path)
+            self.__checksums[path] = (checksum, f_stat.st_size, f_stat.st_mtime, time.time())
+        finally:
+            self.__lock.release()
+
+    def get(self, path):
+        self.__lock.acquire()
+        try:
+            item = self.__checksums.pop(path, None)
+            if item is None:
+                return None
+
+            checksum, size, mtime, verify_time = item
+            try:
+                f_stat = os.stat(path)
+            except OSError:
+                f_stat = None
+            if f_stat is None or (f_stat.st_size, f_stat.st_mtime) != (size, mtime) \
+                    or time.time() - verify_time > self.__ttl:
+                return None
+            self.__checksums[path] = item
+            return checksum
+        finally:
+            self.__lock.release()
+
+VERIFIED_CHECKSUMS = VerifiedChecksums()
+
+
 class TmpFile:
-    def __init__(self, f_path, data, seek=0):
+    def __init__(self, f_path, data, seek=0, calc_checksum=True):
         self.__f_path = f_path
-        self.__checksum = hashlib.sha1()
+        #checksum is not calculated if data is verified by caller
+        self.__checksum = hashlib.sha1() if calc_checksum else None
         self.__link_idx = 1
 
         if type(data) not in (list, tuple):
@@ -84,13 +135,16 @@ class TmpFile:
         return link
 
     def __int_write(self, fobj, data):
-        self.__checksum.update(data)
+        if self.__checksum:
+            self.__checksum.update(data)
         fobj.write(data)
 
     def __del__(self):
         self.remove()
 
     def checksum(self):
+        if not self.__checksum:
+            return None
         return self.__checksum.hexdigest()
 
     def write(self, data, seek=None):
@@ -368,6 +422,13 @@ class FSHashRanges:
             return '%040x'%key
         return key
 
+    def __read_header(self, f_name):
+        f_obj = open(f_name, 'rb')
+        try:
+            return f_obj.read(DataBlockHeader.HEADER_LEN)
+        finally:
+            f_obj.close()
+
     def __check_ex_data_block(self, old_f_name, new_f_name):
         if os.path.exists(old_f_name):
             logger.debug('Checking data block datetime at %s...'%old_f_name)
@@ -397,7 +458,8 @@ class FSHashRanges:
                 raise FSHashRangesPermissionDenied('Alien data block')
 
 
-    def __put_data(self, key, tmp_file_path, save_to_reservation=False, save_to_replicas=False, check_dt=False):
+    def __put_data(self, key, tmp_file_path, save_to_reservation=False, save_to_replicas=False, \
+                        check_dt=False, checksum=None):
         key = self._str_key(key)
         need_lock = False
 
@@ -413,6 +475,12 @@ class FSHashRanges:
                 need_lock = True
 
         dest = os.path.join(range_dir, key)
+        if checksum and VERIFIED_CHECKSUMS.get(dest) == checksum \
+                and self.__read_header(dest) == self.__read_header(tmp_file_path):
+            #the same data block is just written and verified (resent replica)
+            os.remove(tmp_file_path)
+            return
+
         if check_dt:
             self.__check_ex_data_block(dest, tmp_file_path)
 
@@ -421,6 +489,7 @@ class FSHashRanges:
 
         try:
             shutil.move(tmp_file_path, dest)
+            VERIFIED_CHECKSUMS.update(dest, checksum)
         finally:
             if need_lock:
                 self.__parallel_writes.dec()
@@ -504,21 +573,23 @@ class FSHashRanges:
 
 
 
-    def put(self, key, tmp_file_path, is_replica=False, check_dt=False):
+    def put(self, key, tmp_file_path, is_replica=False, check_dt=False, checksum=None):
+        """Save data block from tmp_file_path.
+        checksum - checksum of data block that is verified while receiving (or None)"""
         if is_replica:
-            self.__put_data(key, tmp_file_path, save_to_replicas=True, check_dt=check_dt)
+            self.__put_data(key, tmp_file_path, save_to_replicas=True, check_dt=check_dt, checksum=checksum)
             return
 
         if self.__child_ranges.size():
             for child_range in self.__child_ranges.copy():
                 if not child_range._in_range(key):
                     continue
-                return child_range.put(key, tmp_file_path, check_dt)
+                return child_range.put(key, tmp_file_path, check_dt=check_dt, checksum=checksum)
 
         if self._in_range(key):
-            self.__put_data(key, tmp_file_path, check_dt=check_dt)
+            self.__put_data(key, tmp_file_path, check_dt=check_dt, checksum=checksum)
         else:
-            self.__put_data(key, tmp_file_path, save_to_reservation=True, check_dt=check_dt)
+            self.__put_data(key, tmp_file_path, save_to_reservation=True, check_dt=check_dt, checksum=checksum)
 
 
     def get_path(self, key, is_replica=False):
@@ -44,7 +44,9 @@ class HashRange:
 
 
 class HashRangesTable:
-    def __init__(self):
+    def __init__(self, version=None):
+        """version - RangesTableVersion object (incremented on each table change)"""
+        self.__version = version
         self.__ranges = []
         self.__lock = threading.RLock()
         self.__last_dm = datetime(1, 1, 1, 1, 1, 1, 1)
@@ -78,6 +80,12 @@ class HashRangesTable:
         finally:
             self.__lock.release()
 
+    def __changed(self):
+        self.__last_dm = datetime.utcnow()
+        self.__mod_index += 1
+        if self.__version is not None:
+            self.__version.increment()
+
     def get_mod_index(self):
         self.__lock.acquire()
         try:
@@ -116,8 +124,7 @@ class HashRangesTable:
 
             h_range = HashRange(start, end, node_addr)
             self.__sorted_insert(h_range)
-            self.__last_dm = datetime.utcnow()
-            self.__mod_index += 1
+            self.__changed()
         finally:
             self.__lock.release()
 
@@ -133,8 +140,7 @@ class HashRangesTable:
                 #raise RangeException('Range does not found for hash %s'%ex_hash)
 
             del self.__ranges[self.__ranges.index(r_obj)]
-            self.__last_dm = datetime.utcnow()
-            self.__mod_index += 1
+            self.__changed()
         finally:
             self.__lock.release()
 
@@ -209,6 +215,8 @@ class HashRangesTable:
                 is_old_ex = self.__ranges
 
             self.__ranges, self.__last_dm, self.__mod_index = pickle.loads(ranges_dump)
+            if self.__version is not None:
+                self.__version.increment()
 
             logger.debug('HASH RANGES: %s'%'\n'.join([r.to_str() for r in self.__ranges]))
 
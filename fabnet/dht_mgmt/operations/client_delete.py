@@ -14,6 +14,7 @@ import hashlib
 from fabnet.core.operation_base import  OperationBase
 from fabnet.core.fri_base import FabnetPacketResponse
 from fabnet.core.constants import RC_OK, RC_ERROR
+from fabnet.dht_mgmt.cached_ranges_table import get_ranges_table
 from fabnet.utils.logger import oper_logger as logger
 from fabnet.dht_mgmt.key_utils import KeyUtils
 from fabnet.core.constants import NODE_ROLE, CLIENT_ROLE
@@ -55,22 +56,29 @@ class ClientDeleteOperation(OperationBase):
 
         keys = KeyUtils.generate_new_keys(self.node_name, replica_count, prime_key=key)
         is_replica = False
+        nodes = []
+        params_list = []
+        ranges_table = get_ranges_table(self.operator, self.home_dir)
         for key in keys:
-            h_range = self.operator.find_range(key)
+            h_range = ranges_table.find_range(key)
             if not h_range:
                 return FabnetPacketResponse(ret_code=RC_ERROR, \
                         ret_message='Internal error: No hash range found for key=%s!'%key)
             else:
                 _, _, node_address = h_range
-                params = {'key': key, 'is_replica': is_replica, \
-                            'carefully_delete': True, 'user_id': packet.session_id}
-
-                resp = self._init_operation(node_address, 'DeleteDataBlock', params, sync=True)
-                if resp.ret_code != RC_OK:
-                    return FabnetPacketResponse(ret_code=resp.ret_code, \
-                            ret_message='DeleteDataBlock failed at %s: %s'%(node_address, resp.ret_message))
+                nodes.append(node_address)
+                params_list.append({'key': key, 'is_replica': is_replica, \
+                            'carefully_delete': True, 'user_id': packet.session_id})
             is_replica = True
 
+        calls = self._init_sync_operations(nodes, 'DeleteDataBlock', params_list)
+        calls.wait()
+        for future in calls.futures:
+            resp = future.result()
+            if resp.ret_code != RC_OK:
+                return FabnetPacketResponse(ret_code=resp.ret_code, \
+                        ret_message='DeleteDataBlock failed at %s: %s'%(future.node_address, resp.ret_message))
+
         return FabnetPacketResponse()
 
 
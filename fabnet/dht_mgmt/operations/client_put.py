@@ -15,6 +15,7 @@ from fabnet.core.operation_base import  OperationBase
 from fabnet.core.fri_base import FabnetPacketResponse, BinaryDataPointer
 from fabnet.core.constants import RC_OK, RC_ERROR
 from fabnet.dht_mgmt.constants import MIN_REPLICA_COUNT
+from fabnet.dht_mgmt.cached_ranges_table import get_ranges_table
 from fabnet.utils.logger import oper_logger as logger
 from fabnet.dht_mgmt.key_utils import KeyUtils
 from fabnet.dht_mgmt.data_block import DataBlockHeader
@@ -75,34 +76,54 @@ class ClientPutOperation(OperationBase):
         header = DataBlockHeader.pack(keys[0], replica_count, checksum, packet.session_id)
         tempfile.write(header, seek=0)
 
+        targets = []
+        ranges_table = get_ranges_table(self.operator, self.home_dir)
         for key in keys:
-            h_range = self.operator.find_range(key)
+            h_range = ranges_table.find_range(key)
             if not h_range:
                 logger.info('[ClientPutOperation] Internal error: No hash range found for key=%s!'%key)
             else:
                 _, _, node_address = h_range
-                params = {'key': key, 'is_replica': is_replica, 'replica_count': replica_count, 'carefully_save': carefully_save}
-                if succ_count >= wait_writes_count:
-                    binary_data_pointer = BinaryDataPointer(tempfile.hardlink(), remove_on_close=True)
-                    self._init_operation(node_address, 'PutDataBlock', params, binary_data=binary_data_pointer)
+                targets.append((key, is_replica, node_address))
+            is_replica = True
+
+        while targets and succ_count < wait_writes_count:
+            #data blocks that should be written before response are sent concurrently
+            nodes = []
+            params_list = []
+            while targets and succ_count + len(nodes) < wait_writes_count:
+                key, is_replica, node_address = targets.pop(0)
+                if self.self_address == node_address and local_save is None:
+                    local_save = (key, is_replica)
+                    succ_count += 1
                 else:
-                    if self.self_address == node_address and local_save is None:
-                        local_save = (key, is_replica)
-                        succ_count += 1
-                    else:
-                        resp = self._init_operation(node_address, 'PutDataBlock', params, sync=True, binary_data=tempfile.chunks())
-                        if resp.ret_code != RC_OK:
-                            logger.error('[ClientPutOperation] PutDataBlock error from %s: %s'%(node_address, resp.ret_message))
-                            errors.append('From %s: %s'%(node_address, resp.ret_message))
-                        else:
-                            succ_count += 1
+                    nodes.append(node_address)
+                    params_list.append({'key': key, 'is_replica': is_replica, 'checksum': checksum, \
+                            'replica_count': replica_count, 'carefully_save': carefully_save})
+
+            if not nodes:
+                continue
+
+            calls = self._init_sync_operations(nodes, 'PutDataBlock', params_list, \
+                                                [tempfile.chunks() for _ in nodes])
+            for future in calls.iter_completed():
+                resp = future.result()
+                if resp.ret_code != RC_OK:
+                    logger.error('[ClientPutOperation] PutDataBlock error from %s: %s'%(future.node_address, resp.ret_message))
+                    errors.append('From %s: %s'%(future.node_address, resp.ret_message))
+                else:
+                    succ_count += 1
 
-            is_replica = True
+        for key, is_replica, node_address in targets:
+            params = {'key': key, 'is_replica': is_replica, 'replica_count': replica_count, \
+                        'carefully_save': carefully_save, 'checksum': checksum}
+            binary_data_pointer = BinaryDataPointer(tempfile.hardlink(), remove_on_close=True)
+            self._init_operation(node_address, 'PutDataBlock', params, binary_data=binary_data_pointer)
 
         try:
             if local_save:
                 key, is_replica = local_save
-                self.operator.put_data_block(key, tempfile.file_path(), is_replica, carefully_save)
+                self.operator.put_data_block(key, tempfile.file_path(), is_replica, carefully_save, checksum)
         except Exception, err:
             succ_count -= 1
             msg = 'Saving data block to local range is failed: %s'%err
@@ -15,6 +15,7 @@ from fabnet.core.operation_base import  OperationBase
 from fabnet.core.fri_base import FabnetPacketResponse
 from fabnet.core.constants import RC_OK, RC_ERROR
 from fabnet.dht_mgmt.constants import MIN_REPLICA_COUNT, RC_NO_DATA
+from fabnet.dht_mgmt.cached_ranges_table import get_ranges_table
 from fabnet.utils.logger import oper_logger as logger
 from fabnet.dht_mgmt.key_utils import KeyUtils
 from fabnet.core.constants import NODE_ROLE, CLIENT_ROLE
@@ -55,9 +56,10 @@ class GetKeysInfoOperation(OperationBase):
 
         is_replica = False
         ret_keys = []
+        ranges_table = get_ranges_table(self.operator, self.home_dir)
         for key in keys:
             long_key = self._validate_key(key)
-            range_obj = self.operator.find_range(long_key)
+            range_obj = ranges_table.find_range(long_key)
             if not range_obj:
                 logger.warning('[GetKeysInfoOperation] Internal error: No hash range found for key=%s!'%key)
             else:
@@ -15,8 +15,8 @@ from fabnet.core.operation_base import  OperationBase
 from fabnet.core.fri_base import FabnetPacketResponse
 from fabnet.core.constants import RC_OK, RC_ERROR, RC_PERMISSION_DENIED, \
                                     NODE_ROLE, CLIENT_ROLE
-from fabnet.dht_mgmt.constants import RC_OLD_DATA, RC_NO_FREE_SPACE
-from fabnet.dht_mgmt.data_block import DataBlockHeader
+from fabnet.dht_mgmt.constants import RC_OLD_DATA, RC_NO_FREE_SPACE, RC_CHECKSUM_MISMATCH
+from fabnet.dht_mgmt.data_block import DataBlockHeader, VerifiedBinaryData, DataBlockChecksumMismatch
 from fabnet.dht_mgmt.key_utils import KeyUtils
 from fabnet.dht_mgmt.fs_mapped_ranges import TmpFile, FSHashRangesOldDataDetected, \
                     FSHashRangesNoFreeSpace, FSHashRangesPermissionDenied
@@ -60,12 +60,20 @@ class PutDataBlockOperation(OperationBase):
 
             header = DataBlockHeader.pack(primary_key, replica_count, checksum, user_id)
             data_list.append(header)
+            binary_data = VerifiedBinaryData(packet.binary_data, checksum)
+        else:
+            #data block header is received with data
+            #(transfer is aborted on header if checksum is expected)
+            binary_data = VerifiedBinaryData(packet.binary_data, checksum, has_header=True)
 
-        data_list.append(packet.binary_data)
+        data_list.append(binary_data)
         tempfile_path = self.operator.get_tempfile()
         try:
-            tempfile = TmpFile(tempfile_path, data_list)
-            self.operator.put_data_block(key, tempfile_path, is_replica, carefully_save)
+            #data is hashed once by VerifiedBinaryData
+            tempfile = TmpFile(tempfile_path, data_list, calc_checksum=False)
+            self.operator.put_data_block(key, tempfile_path, is_replica, carefully_save, binary_data.checksum())
+        except DataBlockChecksumMismatch, err:
+            return FabnetPacketResponse(ret_code=RC_CHECKSUM_MISMATCH, ret_message=str(err))
         except FSHashRangesOldDataDetected, err:
             return FabnetPacketResponse(ret_code=RC_OLD_DATA, ret_message=str(err))
         except FSHashRangesNoFreeSpace, err:
@@ -15,6 +15,7 @@ from fabnet.core.operation_base import  OperationBase
 from fabnet.core.fri_base import FabnetPacketResponse
 from fabnet.core.constants import RC_OK, RC_ERROR, NODE_ROLE, CLIENT_ROLE
 from fabnet.dht_mgmt.constants import MIN_REPLICA_COUNT
+from fabnet.dht_mgmt.cached_ranges_table import get_ranges_table
 from fabnet.utils.logger import oper_logger as logger
 from fabnet.dht_mgmt.key_utils import KeyUtils
 
@@ -48,7 +49,8 @@ class PutKeysInfoOperation(OperationBase):
         else:
             key = KeyUtils.generate_key(self.node_name)
 
-        range_obj = self.operator.find_range(key)
+        ranges_table = get_ranges_table(self.operator, self.home_dir)
+        range_obj = ranges_table.find_range(key)
         if not range_obj:
             return FabnetPacketResponse(ret_code=RC_ERROR, ret_message=\
                         '[PutKeysInfoOperation] Internal error: No hash range found for key=%s!'%key)
@@ -90,15 +90,18 @@ class RepairProcess:
             logger.error('[RepairDataBlocks] %s'%err)
             return
 
+        check_keys = []
         if is_replica and self._in_check_range(data_keys[0]):
-            self.__check_data_block(key, is_replica,  data_keys[0], checksum, is_replica=False)
+            check_keys.append((data_keys[0], False))
 
         for repl_key in data_keys[1:]:
             if repl_key == key:
                 continue
 
             if self._in_check_range(repl_key):
-                self.__check_data_block(key, is_replica, repl_key, checksum, is_replica=True)
+                check_keys.append((repl_key, True))
+
+        self.__check_data_blocks(key, is_replica, check_keys, checksum)
 
     def __validate_key(self, key):
         try:
@@ -108,17 +111,32 @@ class RepairProcess:
         except Exception:
             return None
 
-    def __check_data_block(self, local_key, local_is_replica, check_key, checksum, is_replica=False):
-        long_key = self.__validate_key(check_key)
-        if long_key is None:
-            logger.error('[RepairDataBlocks] Invalid data key "%s"'%key)
-            self.__invalid_local_blocks += 1
+    def __check_data_blocks(self, local_key, local_is_replica, check_keys, checksum):
+        """Check data blocks with keys from check_keys list ([(key, is_replica), ...])
+        CheckDataBlock requests are sent to nodes concurrently"""
+        checks = []
+        for check_key, is_replica in check_keys:
+            long_key = self.__validate_key(check_key)
+            if long_key is None:
+                logger.error('[RepairDataBlocks] Invalid data key "%s"'%check_key)
+                self.__invalid_local_blocks += 1
+                continue
+
+            range_obj = self.operator.ranges_table.find(long_key)
+            params = {'key': check_key, 'checksum': checksum, 'is_replica': is_replica}
+            req = FabnetPacketRequest(method='CheckDataBlock', sender=self.operator.self_address, sync=True, parameters=params)
+            checks.append((check_key, is_replica, range_obj, req))
+
+        if not checks:
+            return
 
-        range_obj = self.operator.ranges_table.find(long_key)
-        params = {'key': check_key, 'checksum': checksum, 'is_replica': is_replica}
-        req = FabnetPacketRequest(method='CheckDataBlock', sender=self.operator.self_address, sync=True, parameters=params)
-        resp = self.operator.call_node(range_obj.node_address, req)
+        calls = self.operator.call_nodes([c[2].node_address for c in checks], [c[3] for c in checks])
+        calls.wait()
+        for (check_key, is_replica, range_obj, _), future in zip(checks, calls.futures):
+            self.__process_check_result(local_key, local_is_replica, check_key, \
+                                            is_replica, range_obj, future.result())
 
+    def __process_check_result(self, local_key, local_is_replica, check_key, is_replica, range_obj, resp):
         if resp.ret_code in (RC_NO_DATA, RC_INVALID_DATA):
             logger.info('Invalid data block at %s with key=%s ([%s]%s). Sending valid block...'%\
                     (range_obj.node_address, check_key, resp.ret_code, resp.ret_message))
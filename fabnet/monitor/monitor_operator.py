@@ -127,11 +127,13 @@ class CollectNodeStatisticsThread(threading.Thread):
                 logger.debug('Collecting %s nodes statistic...'%self.check_status)
                 nodeaddrs = self.operator.get_nodes_list(self.check_status)
 
-                for nodeaddr in nodeaddrs:
-                    logger.debug('Get statistic from %s'%nodeaddr)
+                packet_obj = FabnetPacketRequest(method='NodeStatistic', sync=True)
+                calls = self.client.call_many(nodeaddrs, packet_obj)
+                for future in calls.iter_completed():
+                    nodeaddr = future.node_address
+                    logger.debug('Statistic from %s is received'%nodeaddr)
 
-                    packet_obj = FabnetPacketRequest(method='NodeStatistic', sync=True)
-                    ret_packet = self.client.call_sync(nodeaddr, packet_obj)
+                    ret_packet = future.result()
                     if self.check_status == UP and ret_packet.ret_code:
                         logger.warning('Node with address %s does not response... Details: %s'%(nodeaddr, ret_packet))
                         self.operator.change_node_status(nodeaddr, DOWN)
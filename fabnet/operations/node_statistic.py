@@ -14,8 +14,10 @@ import resource
 from datetime import datetime
 from fabnet.core.operation_base import  OperationBase
 from fabnet.core.fri_base import FabnetPacketResponse
+from fabnet.core.socket_processor import SocketProcessor
 from fabnet.utils.logger import oper_logger as logger
-from fabnet.core.constants import NODE_ROLE, CLIENT_ROLE, SI_SYS_INFO, SI_BASE_INFO
+from fabnet.core.constants import NODE_ROLE, CLIENT_ROLE, SI_SYS_INFO, SI_BASE_INFO, \
+                                    SI_INFLIGHT_BUDGET
 from upgrade_node_operation import UpgradeNodeOperation, VERSION_FILE
 
 
@@ -77,6 +79,9 @@ class NodeStatisticOperation(OperationBase):
         sysinfo['fabnet_version'] = self.get_node_version()
 
         ret_params[SI_SYS_INFO] = sysinfo
+
+        if SocketProcessor.inflight_budget:
+            ret_params[SI_INFLIGHT_BUDGET] = SocketProcessor.inflight_budget.get_stat()
         return FabnetPacketResponse(ret_parameters=ret_params)
 
     def callback(self, packet, sender=None):
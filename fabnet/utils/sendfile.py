@@ -0,0 +1,79 @@
+#!/usr/bin/python
+"""
+Copyright (C) 2013 Konstantin Andrusenko
+    See the documentation for further information on copyrights,
+    or contact the author. All Rights Reserved.
+
+@package fabnet.utils.sendfile
+@author Konstantin Andrusenko
+@date July 18, 2013
+
+This module contains the sendfile() routine (zero-copy sending
+of file region to socket). sendfile(2) system call is used over ctypes
+(os.sendfile is not available in python 2.x). SENDFILE_SUPPORTED is False
+if sendfile(2) is not supported by OS
+"""
+import os
+import sys
+import errno
+import select
+import socket
+import ctypes
+import ctypes.util
+
+
+def _load_sendfile():
+    if hasattr(os, 'sendfile'):
+        return os.sendfile
+
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        c_sendfile = libc.sendfile64
+    except (OSError, AttributeError):
+        return None
+
+    c_sendfile.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t]
+    c_sendfile.restype = ctypes.c_ssize_t
+
+    def os_sendfile(out_fd, in_fd, offset, count):
+        c_offset = ctypes.c_int64(offset)
+        sent = c_sendfile(out_fd, in_fd, ctypes.byref(c_offset), count)
+        if sent < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return sent
+
+    return os_sendfile
+
+_os_sendfile = _load_sendfile()
+
+SENDFILE_SUPPORTED = _os_sendfile is not None
+
+
+def sendfile(sock, in_fd, offset, count):
+    """Send count bytes of file (opened as in_fd) from offset position
+    to socket. Socket timeout is respected (socket with timeout is non-blocking)
+    """
+    timeout = sock.gettimeout()
+    out_fd = sock.fileno()
+    while count > 0:
+        try:
+            sent = _os_sendfile(out_fd, in_fd, offset, count)
+        except OSError, err:
+            if err.errno == errno.EINTR:
+                continue
+            if err.errno != errno.EAGAIN:
+                raise socket.error(err.errno, err.strerror)
+
+            _, writable, _ = select.select([], [out_fd], [], timeout)
+            if not writable:
+                raise socket.timeout('timed out')
+            continue
+
+        if sent == 0:
+            raise IOError('Unexpected end of file (%s bytes are not sent)'%count)
+        offset += sent
+        count -= sent
@@ -3,11 +3,18 @@ import time
 import os
 import logging
 import json
+import socket
 import threading
-from fabnet.core.constants import RC_OK, RC_ERROR
-from fabnet.core.fri_base import FabnetPacketRequest, FabnetPacketResponse
-from fabnet.core.fri_server import FriServer
-from fabnet.core.fri_client import FriClient
+import tempfile
+import shutil
+from fabnet.core.constants import RC_OK, RC_ERROR, FRI_PROTOCOL_REV
+from fabnet.core.fri_base import FabnetPacketRequest, FabnetPacketResponse, RamBasedBinaryData, \
+                                    SpooledBinaryData
+from fabnet.core.fri_server import FriServer, get_unix_socket_path, set_unix_socket_dir
+from fabnet.core.fri_client import FriClient, FriIOPool, get_local_socket_path
+from fabnet.core.socket_processor import SocketProcessor
+from fabnet.core.connections_pool import ConnectionsPool
+from fabnet.core.inflight_budget import InFlightBudget
 from fabnet.core.workers_manager import WorkersManager
 from fabnet.core.workers import ProcessBasedFriWorker, ThreadBasedFriWorker
 from fabnet.core.key_storage import FileBasedKeyStorage
@@ -42,17 +49,48 @@ class MyThreadBasedFriProcessor(ThreadBasedFriWorker):
     def process(self, packet_processor):
         test_packet_process(packet_processor)
 
+class KeepAliveFriProcessor(ThreadBasedFriWorker):
+    def process(self, packet_processor):
+        fri_request = packet_processor.recv_packet()
+        resp = FabnetPacketResponse(ret_code=RC_OK, ret_message='Hello, dear friend!',
+                        ret_parameters={'worker': self.getName()}, keep_alive=fri_request.keep_alive)
+        packet_processor.send_packet(resp)
+        return resp.keep_alive
+
+class MultiplexedFriProcessor(ThreadBasedFriWorker):
+    def process(self, packet_processor):
+        fri_request = packet_processor.recv_packet()
+        if fri_request.binary_chunk_cnt > 0 and not packet_processor.is_multiplexed():
+            #allow packet (see OperationsProcessor.check_session)
+            packet_processor.send_packet(FabnetPacketResponse())
+        ret_params = {'worker': self.getName()}
+        binary_data = None
+        if fri_request.method == 'Sleep':
+            time.sleep(fri_request.parameters['timeout'])
+        elif fri_request.method == 'GetData':
+            binary_data = RamBasedBinaryData('x'*fri_request.parameters['size'], 1000)
+        elif fri_request.method == 'PutData':
+            ret_params['size'] = len(fri_request.binary_data.data())
+
+        resp = FabnetPacketResponse(ret_code=RC_OK, ret_parameters=ret_params, \
+                        binary_data=binary_data, keep_alive=fri_request.keep_alive)
+        packet_processor.accept_protocol_rev(fri_request, resp)
+        packet_processor.send_packet(resp)
+        return resp.keep_alive
+
 #   self.__test_server(FileBasedKeyStorage(VALID_STORAGE, PASSWD))
 
 class TestAbstractFriServer(unittest.TestCase):
-    def __start_server(self, processor_class, routine, ks=None, add_args=()):
+    def __start_server(self, processor_class, routine, ks=None, add_args=(), event_loop=False, \
+                            reuse_port=False, unix_socket=False):
         server_name = 'test-node'
         cur_thread = threading.current_thread()
         cur_thread.setName('%s-main'%server_name)
 
         workers_mgr = WorkersManager(processor_class, min_count=1, max_count=8, \
                                 server_name=server_name, init_params=(ks,))
-        fri_server = FriServer('127.0.0.1', 6666, workers_mgr, server_name)
+        fri_server = FriServer('127.0.0.1', 6666, workers_mgr, server_name, \
+                                event_loop=event_loop, reuse_port=reuse_port, unix_socket=unix_socket)
 
         fri_server.start()
 
@@ -164,6 +202,289 @@ class TestAbstractFriServer(unittest.TestCase):
         self.__start_server(MyProcessBasedFriProcessor, stress_routine, ks)
 
 
+    def test04_keep_alive_connections(self):
+        def call_methods():
+            pool = ConnectionsPool(max_idle_per_node=1)
+            fri_client = FriClient(conn_pool=pool)
+
+            workers = set()
+            for i in xrange(10):
+                resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='HelloFabregas'))
+                self.assertEqual(resp.ret_code, 0, resp.ret_message)
+                self.assertEqual(resp.keep_alive, True)
+                workers.add(resp.ret_parameters['worker'])
+
+            #all packets are processed over one connection
+            self.assertEqual(len(workers), 1)
+            stat = pool.get_stat()
+            self.assertEqual(stat['idle'], 1)
+            self.assertEqual(stat['hits'], 9)
+            self.assertEqual(stat['misses'], 1)
+
+            pool.clear()
+            self.assertEqual(pool.get_stat()['idle'], 0)
+            resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='HelloFabregas'))
+            self.assertEqual(resp.ret_code, 0, resp.ret_message)
+
+        self.__start_server(KeepAliveFriProcessor, call_methods)
+
+    def test05_multiplexed_connection(self):
+        def call_methods():
+            pool = ConnectionsPool()
+            fri_client = FriClient(conn_pool=pool)
+
+            resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='HelloFabregas'))
+            self.assertEqual(resp.ret_code, 0, resp.ret_message)
+            self.assertEqual(resp.protocol_rev, FRI_PROTOCOL_REV)
+            self.assertEqual(pool.get_stat()['multiplexed'], 1)
+
+            results = {}
+            def call(name, packet):
+                resp = fri_client.call_sync('127.0.0.1:6666', packet)
+                data = resp.binary_data.data() if resp.binary_data else None
+                results[name] = (datetime.now(), resp, data)
+
+            threads = [threading.Thread(target=call, args=('slow', \
+                            FabnetPacketRequest(method='Sleep', parameters={'timeout': 2}))),
+                       threading.Thread(target=call, args=('get', \
+                            FabnetPacketRequest(method='GetData', parameters={'size': 100500}))),
+                       threading.Thread(target=call, args=('put', \
+                            FabnetPacketRequest(method='PutData', binary_data=RamBasedBinaryData('y'*50500, 1000))))]
+            for thread in threads:
+                thread.start()
+                time.sleep(.2)
+            call('fast', FabnetPacketRequest(method='HelloFabregas'))
+            for thread in threads:
+                thread.join()
+
+            workers = set()
+            for name, (_, resp, _) in results.items():
+                self.assertEqual(resp.ret_code, 0, '%s: %s'%(name, resp.ret_message))
+                workers.add(resp.ret_parameters['worker'])
+
+            #responses are received out of order over one connection
+            self.assertEqual(len(workers), 1)
+            self.assertTrue(results['fast'][0] < results['slow'][0])
+            self.assertEqual(results['get'][2], 'x'*100500)
+            self.assertEqual(results['put'][1].ret_parameters['size'], 50500)
+            self.assertEqual(pool.get_stat()['multiplexed'], 1)
+            pool.clear()
+
+        self.__start_server(MultiplexedFriProcessor, call_methods)
+
+    def test06_event_loop_front_end(self):
+        def call_methods():
+            #slow clients do not hold workers (max workers count is 8)
+            data = FabnetPacketRequest(method='HelloFabregas').dump()
+            slow_socks = []
+            for i in xrange(20):
+                sock = socket.create_connection(('127.0.0.1', 6666))
+                sock.sendall(data[:10])
+                slow_socks.append(sock)
+
+            fri_client = FriClient(conn_pool=ConnectionsPool())
+            resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='HelloFabregas'))
+            self.assertEqual(resp.ret_code, 0, resp.ret_message)
+
+            #binary chunks are spooled by front end
+            fri_client = FriClient(conn_pool=ConnectionsPool())
+            resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='PutData', \
+                                    binary_data=RamBasedBinaryData('y'*50500, 1000)))
+            self.assertEqual(resp.ret_code, 0, resp.ret_message)
+            self.assertEqual(resp.ret_parameters['size'], 50500)
+
+            for sock in slow_socks:
+                sock.sendall(data[10:])
+            for sock in slow_socks:
+                proc = SocketProcessor(sock)
+                resp = proc.recv_packet()
+                self.assertEqual(resp.ret_code, 0, resp.ret_message)
+                proc.close_socket(force=True)
+
+        def call_process_workers():
+            fri_client = FriClient()
+            for i in xrange(10):
+                resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='HelloFabregas'))
+                self.assertEqual(resp.ret_code, 0, resp.ret_message)
+                self.assertEqual(resp.ret_message, 'Hello, dear friend!')
+
+        self.__start_server(MultiplexedFriProcessor, call_methods, event_loop=True)
+        self.__start_server(MyProcessBasedFriProcessor, call_process_workers, event_loop=True)
+
+    def test07_reuse_port_workers(self):
+        def call_methods():
+            errors = []
+            def client_routine():
+                try:
+                    for i in xrange(5):
+                        fri_client = FriClient(conn_pool=ConnectionsPool())
+                        resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='HelloFabregas'))
+                        if resp.ret_message != 'Hello, dear friend!':
+                            errors.append(resp.ret_message)
+                except Exception, err:
+                    errors.append(str(err))
+
+            threads = [threading.Thread(target=client_routine) for i in xrange(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+
+        self.__start_server(MyProcessBasedFriProcessor, call_methods, reuse_port=True)
+
+        #port is bound without SO_REUSEPORT by other socket
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('127.0.0.1', 6666))
+        sock.listen(5)
+        try:
+            workers_mgr = WorkersManager(MyProcessBasedFriProcessor, min_count=1, init_params=(None,))
+            fri_server = FriServer('127.0.0.1', 6666, workers_mgr, reuse_port=True)
+            self.assertFalse(fri_server.start())
+        finally:
+            sock.close()
+
+    def test08_call_many(self):
+        def call_methods():
+            fri_client = FriClient(conn_pool=ConnectionsPool())
+            #all calls are sent over one multiplexed connection
+            resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='HelloFabregas'))
+            self.assertEqual(resp.ret_code, 0, resp.ret_message)
+            addresses = ['127.0.0.1:6666']*4
+
+            t0 = time.time()
+            packets = [FabnetPacketRequest(method='Sleep', parameters={'timeout': 1}) for i in addresses]
+            calls = fri_client.call_many(addresses, packets)
+            self.assertEqual(len(calls.wait(1)), 1)
+            self.assertEqual(len(calls.wait()), 3)
+            #calls are processed concurrently
+            self.assertTrue(time.time() - t0 < 3)
+            for future in calls.futures:
+                self.assertEqual(future.result().ret_code, 0, future.result().ret_message)
+
+            calls = fri_client.call_many(addresses[:1], FabnetPacketRequest(method='Sleep', parameters={'timeout': 1}))
+            self.assertEqual(calls.wait(timeout=0.2), [])
+            self.assertEqual(calls.futures[0].result(0), None)
+            self.assertEqual(len(calls.wait()), 1)
+
+            #not started calls are cancelled
+            fri_client = FriClient(conn_pool=ConnectionsPool(), io_pool=FriIOPool(1))
+            calls = fri_client.call_many(addresses[:3], FabnetPacketRequest(method='Sleep', parameters={'timeout': 1}))
+            time.sleep(.2)
+            self.assertEqual(calls.cancel(), 2)
+            completed = calls.wait()
+            self.assertEqual(len([f for f in completed if f.cancelled()]), 2)
+            self.assertEqual(calls.futures[0].result().ret_code, 0)
+            self.assertNotEqual(calls.futures[1].result().ret_code, 0)
+
+        self.__start_server(MultiplexedFriProcessor, call_methods)
+
+    def test09_unix_socket(self):
+        socket_dir = tempfile.mkdtemp()
+        os.chmod(socket_dir, 0755)
+        set_unix_socket_dir(os.path.join(socket_dir, 'sockets'))
+        self.assertEqual(os.stat(os.path.join(socket_dir, 'sockets')).st_mode & 0777, 0700)
+        unix_path = get_unix_socket_path('127.0.0.1', 6666)
+        try:
+            self.__test_unix_socket(unix_path)
+        finally:
+            set_unix_socket_dir(None)
+            shutil.rmtree(socket_dir)
+
+    def __test_unix_socket(self, unix_path):
+        def call_methods():
+            self.assertEqual(get_local_socket_path('127.0.0.1', 6666), unix_path)
+            self.assertEqual(get_local_socket_path('127.0.0.1', 6667), None)
+            self.assertEqual(os.stat(unix_path).st_mode & 0077, 0)
+            fri_client = FriClient(conn_pool=ConnectionsPool())
+            for i in xrange(3):
+                resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='HelloFabregas'))
+                self.assertEqual(resp.ret_code, 0, resp.ret_message)
+                self.assertEqual(resp.ret_message, 'Hello, dear friend!')
+
+        self.__start_server(MyThreadBasedFriProcessor, call_methods, unix_socket=True)
+        self.assertFalse(os.path.exists(unix_path))
+        self.__start_server(MyProcessBasedFriProcessor, call_methods, unix_socket=True)
+        self.__start_server(MyProcessBasedFriProcessor, call_methods, unix_socket=True, reuse_port=True)
+
+        #unix socket is used for address of current host only
+        remote_path = get_unix_socket_path('10.255.0.5', 6666)
+        open(remote_path, 'w').close()
+        try:
+            self.assertEqual(get_local_socket_path('10.255.0.5', 6666), None)
+        finally:
+            os.remove(remote_path)
+
+        #TCP connection is used if unix socket does not accept connections
+        open(unix_path, 'w').close()
+        try:
+            def call_tcp():
+                fri_client = FriClient(conn_pool=ConnectionsPool())
+                resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='HelloFabregas'))
+                self.assertEqual(resp.ret_code, 0, resp.ret_message)
+            self.__start_server(MyThreadBasedFriProcessor, call_tcp)
+        finally:
+            os.remove(unix_path)
+
+    def test10_resend_binary_data(self):
+        fri_client = FriClient(conn_pool=ConnectionsPool())
+        def call_hello():
+            resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='HelloFabregas'))
+            self.assertEqual(resp.ret_code, 0, resp.ret_message)
+
+        def call_put():
+            #pooled connection is closed by stopped server,
+            #so binary data is resent over new connection
+            binary_data = RamBasedBinaryData('z'*20500, 1000)
+            resp = fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='PutData', \
+                                            binary_data=binary_data))
+            self.assertEqual(resp.ret_code, 0, resp.ret_message)
+            self.assertEqual(resp.ret_parameters['size'], 20500)
+
+        self.__start_server(MultiplexedFriProcessor, call_hello)
+        self.__start_server(MultiplexedFriProcessor, call_put)
+
+
+    def test11_event_loop_budget(self):
+        budget = InFlightBudget(inflight_limit=3000, held_limit=30000, wait_timeout=5)
+        spool_dir = tempfile.mkdtemp()
+        def call_put():
+            #in-flight budget is exhausted by other stream
+            budget.grant(3000)
+            results = []
+            def put_routine():
+                fri_client = FriClient(conn_pool=ConnectionsPool())
+                results.append(fri_client.call_sync('127.0.0.1:6666', FabnetPacketRequest(method='PutData', \
+                                binary_data=RamBasedBinaryData('z'*20500, 1000))))
+            thread = threading.Thread(target=put_routine)
+            thread.start()
+
+            #chunks are not granted, first packet is spooled in spool directory
+            time.sleep(1)
+            self.assertEqual(results, [])
+            self.assertEqual(len(os.listdir(spool_dir)), 1)
+
+            budget.release(3000, 0)
+            thread.join()
+            self.assertEqual(results[0].ret_code, 0, results[0].ret_message)
+            self.assertEqual(results[0].ret_parameters['size'], 20500)
+
+            stat = budget.get_stat()
+            self.assertEqual(stat['delayed_grants'], 1)
+            self.assertEqual(stat['timed_out_grants'], 0)
+            self.assertEqual(stat['inflight_bytes'], 0)
+            self.assertEqual(stat['held_bytes'], 0)
+
+        SocketProcessor.inflight_budget = budget
+        SpooledBinaryData.set_spool_dir(spool_dir)
+        try:
+            self.__start_server(MultiplexedFriProcessor, call_put, event_loop=True)
+        finally:
+            SocketProcessor.inflight_budget = None
+            SpooledBinaryData.set_spool_dir(None)
+            shutil.rmtree(spool_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import time
+import threading
+from Queue import Queue
+
+from fabnet.core.operator.async_call_agent import AsyncCallsQueue
+
+
+class TestAsyncCallsQueue(unittest.TestCase):
+    def test01_batches(self):
+        ready = Queue()
+        calls = AsyncCallsQueue(ready, batch_size=3)
+        for i in xrange(5):
+            calls.put('node1', 'p1_%s'%i)
+        calls.put('node2', 'p2_0')
+
+        #destination is scheduled once while it has queued packets
+        self.assertEqual(ready.qsize(), 2)
+        stat = calls.get_stat()
+        self.assertEqual(stat['queued'], 6)
+        self.assertEqual(sorted(stat['lag'].keys()), ['node1', 'node2'])
+
+        self.assertEqual(ready.get(), 'node1')
+        self.assertEqual(calls.get_batch('node1'), ['p1_0', 'p1_1', 'p1_2'])
+        calls.put('node1', 'p1_5')
+        self.assertEqual(ready.qsize(), 1)
+        calls.batch_done('node1')
+
+        #destinations are served in turn
+        self.assertEqual(ready.get(), 'node2')
+        self.assertEqual(calls.get_batch('node2'), ['p2_0'])
+        calls.batch_done('node2')
+        self.assertEqual(ready.get(), 'node1')
+        self.assertEqual(calls.get_batch('node1'), ['p1_3', 'p1_4', 'p1_5'])
+        calls.batch_done('node1')
+        self.assertTrue(ready.empty())
+
+        stat = calls.get_stat()
+        self.assertEqual(stat['queued'], 0)
+        self.assertEqual(stat['destinations'], 0)
+        self.assertEqual(stat['sent_packets'], 7)
+        self.assertEqual(stat['sent_batches'], 3)
+
+        calls.put('node2', 'p2_1')
+        self.assertEqual(ready.get(), 'node2')
+
+    def test02_order_and_slow_destination(self):
+        ready = Queue()
+        calls = AsyncCallsQueue(ready, batch_size=4)
+        sent = {}
+        lock = threading.Lock()
+
+        def agent():
+            while True:
+                address = ready.get()
+                if address is None:
+                    break
+                for packet in calls.get_batch(address):
+                    if address == 'slow':
+                        time.sleep(0.05)
+                    lock.acquire()
+                    sent.setdefault(address, []).append(packet)
+                    lock.release()
+                calls.batch_done(address)
+
+        threads = [threading.Thread(target=agent) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for i in xrange(20):
+                calls.put('slow', i)
+                for address in ('node1', 'node2', 'node3'):
+                    calls.put(address, i)
+
+            t0 = time.time()
+            while len(sent.get('node3', [])) < 20 and time.time() - t0 < 5:
+                time.sleep(0.01)
+            #fast destinations are not blocked by slow one
+            self.assertTrue(len(sent.get('slow', [])) < 20)
+            self.assertTrue(calls.get_stat()['lag'].get('slow', 0) > 0)
+        finally:
+            while calls.get_stat()['queued']:
+                time.sleep(0.05)
+            for thread in threads:
+                ready.put(None)
+            for thread in threads:
+                thread.join()
+
+        for address in ('slow', 'node1', 'node2', 'node3'):
+            self.assertEqual(sent[address], range(20))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import os
+import tempfile
+
+from fabnet.core.constants import FRI_SHM_DIR
+from fabnet.core.fri_base import FileBasedChunks, RamBasedBinaryData, SpooledBinaryData, \
+                    BinaryDataPointer, serialize_binary_data
+
+
+class TestBinaryHandoff(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp('-fabnet-test')
+        SpooledBinaryData.set_spool_dir(self.tmp_dir)
+
+    def tearDown(self):
+        SpooledBinaryData.set_spool_dir(None)
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def __check_pointer(self, pointer, data):
+        self.assertTrue(isinstance(pointer, BinaryDataPointer))
+        self.assertTrue(pointer.remove_on_close)
+        bin_data = FileBasedChunks.from_data_pointer(pointer)
+        self.assertEqual(bin_data.data(), data)
+        bin_data.close()
+        del bin_data
+        self.assertFalse(os.path.exists(pointer.file_path))
+
+    def test01_file_based_data(self):
+        data = 'x'*100000
+        path = os.path.join(self.tmp_dir, 'data_block')
+        open(path, 'wb').write(data)
+
+        pointer = serialize_binary_data(FileBasedChunks(path))
+        #file is linked to spool directory (not copied)
+        self.assertEqual(os.path.dirname(pointer.file_path), self.tmp_dir)
+        self.assertEqual(os.stat(pointer.file_path).st_ino, os.stat(path).st_ino)
+        os.remove(path)
+        self.__check_pointer(pointer, data)
+
+        #partially read data is copied
+        open(path, 'wb').write(data)
+        bin_data = FileBasedChunks(path, chunk_size=1000)
+        bin_data.get_next_chunk()
+        pointer = serialize_binary_data(bin_data)
+        self.assertNotEqual(os.stat(pointer.file_path).st_ino, os.stat(path).st_ino)
+        self.__check_pointer(pointer, data[1000:])
+
+    def test02_spooled_data(self):
+        spooled = SpooledBinaryData(max_ram_size=1000)
+        spooled.write('a'*600)
+        spooled.write('b'*600)
+        self.assertTrue(spooled.is_spilled())
+        pointer = serialize_binary_data(spooled)
+        self.assertEqual(os.path.dirname(pointer.file_path), self.tmp_dir)
+        self.__check_pointer(pointer, 'a'*600 + 'b'*600)
+
+        pointer = serialize_binary_data(RamBasedBinaryData('test data'))
+        if os.path.isdir(FRI_SHM_DIR):
+            self.assertEqual(os.path.dirname(pointer.file_path), FRI_SHM_DIR)
+        self.__check_pointer(pointer, 'test data')
+
+
+if __name__ == '__main__':
+    unittest.main()
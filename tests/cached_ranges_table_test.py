@@ -0,0 +1,65 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from fabnet.dht_mgmt.hash_ranges_table import HashRangesTable
+from fabnet.dht_mgmt.cached_ranges_table import CachedRangesTable, RangesTableVersion
+from fabnet.dht_mgmt.constants import MIN_HASH, MAX_HASH
+
+
+class RangesOperator:
+    def __init__(self, home_dir):
+        self.ranges_table = HashRangesTable(RangesTableVersion(home_dir))
+        self.dumps_count = 0
+
+    def dump_ranges_table(self):
+        self.dumps_count += 1
+        return self.ranges_table.dump()
+
+    def find_range(self, key):
+        range_obj = self.ranges_table.find(long(key, 16))
+        return range_obj.start, range_obj.end, range_obj.node_address
+
+
+class TestCachedRangesTable(unittest.TestCase):
+    def setUp(self):
+        self.home_dir = tempfile.mkdtemp('-fabnet-test')
+
+    def tearDown(self):
+        shutil.rmtree(self.home_dir)
+
+    def test01_find_range(self):
+        middle = MAX_HASH / 2
+        operator = RangesOperator(self.home_dir)
+        operator.ranges_table.append(MIN_HASH, middle, '127.0.0.1:1986')
+        table = CachedRangesTable(operator, self.home_dir)
+
+        self.assertEqual(table.find_range('%040x'%10), (MIN_HASH, middle, '127.0.0.1:1986'))
+        self.assertEqual(table.find_range(middle), (MIN_HASH, middle, '127.0.0.1:1986'))
+        self.assertEqual(table.find_range(middle+1), None)
+        self.assertEqual(operator.dumps_count, 1)
+
+        #snapshot is refreshed after ranges table change only
+        operator.ranges_table.append(middle+1, MAX_HASH, '127.0.0.1:1987')
+        self.assertEqual(table.find_range(MAX_HASH), (middle+1, MAX_HASH, '127.0.0.1:1987'))
+        self.assertEqual(table.find_range(MIN_HASH), (MIN_HASH, middle, '127.0.0.1:1986'))
+        self.assertEqual(operator.dumps_count, 2)
+
+        new_table = HashRangesTable()
+        new_table.append(MIN_HASH, MAX_HASH, '127.0.0.1:1988')
+        operator.ranges_table.load(new_table.dump())
+        self.assertEqual(table.find_range(middle), (MIN_HASH, MAX_HASH, '127.0.0.1:1988'))
+        self.assertEqual(table.get_refreshes_count(), 3)
+
+    def test02_not_versioned_table(self):
+        operator = RangesOperator(self.home_dir)
+        operator.ranges_table.append(MIN_HASH, MAX_HASH, '127.0.0.1:1986')
+        #ranges are found by operator if version file is not exists
+        table = CachedRangesTable(operator, os.path.join(self.home_dir, 'unknown'))
+        self.assertEqual(table.find_range('%040x'%10), (MIN_HASH, MAX_HASH, '127.0.0.1:1986'))
+        self.assertEqual(operator.dumps_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import os
+import pickle
+
+from fabnet.core.constants import FRI_COMPRESSED_IDENTIFIER, FRI_BIN_HEADER_IDENTIFIER, CC_ZLIB, CC_BZ2
+from fabnet.core.compression import PacketCompressor, CompressionException
+from fabnet.core.statistic import StatMap
+from fabnet.core.fri_base import FriBinaryProcessor, FabnetPacketResponse, FriException
+
+
+class TestCompression(unittest.TestCase):
+    def __check_packet(self, packet, exp_protocol_id):
+        data = packet.dump(protocol_id=FRI_COMPRESSED_IDENTIFIER)
+        self.assertEqual(data[:4], exp_protocol_id)
+        header, bin_data = FriBinaryProcessor.from_binary(data, *FriBinaryProcessor.get_expected_len(data))
+        self.assertEqual(header, packet.to_dict())
+        self.assertEqual(bin_data, packet.binary_data.data() if packet.binary_data else '')
+        return data
+
+    def test01_packets(self):
+        stat = StatMap()
+        FriBinaryProcessor.compressor.set_stat_map(stat)
+        try:
+            ranges = [(i*1000, i*1000+999, '192.168.0.%s:1987'%i) for i in xrange(200)]
+            packet = FabnetPacketResponse(ret_parameters={'ranges_table': pickle.dumps(ranges)})
+            data = self.__check_packet(packet, FRI_COMPRESSED_IDENTIFIER)
+            self.assertTrue(len(data) < len(packet.dump(protocol_id=FRI_BIN_HEADER_IDENTIFIER))/3)
+
+            self.__check_packet(FabnetPacketResponse(binary_data='a'*(1024*1024)), FRI_COMPRESSED_IDENTIFIER)
+            self.__check_packet(FabnetPacketResponse(binary_data=os.urandom(100000)), FRI_BIN_HEADER_IDENTIFIER)
+            self.__check_packet(FabnetPacketResponse(ret_message='ok'), FRI_BIN_HEADER_IDENTIFIER)
+        finally:
+            FriBinaryProcessor.compressor.set_stat_map(None)
+
+        stat = stat.dump()
+        self.assertEqual(stat['zlib6_saved_bytes'][0], 1)
+        self.assertEqual(stat['zlib1_saved_bytes'][0], 1)
+        self.assertTrue('zlib6_decompress_ms' in stat)
+        self.assertTrue(stat['skipped_ratio'][1] > 0.9)
+
+        data = FabnetPacketResponse(binary_data='a'*10000).dump(protocol_id=FRI_COMPRESSED_IDENTIFIER)
+        data = data[:-10] + 'x'*10
+        with self.assertRaises(FriException):
+            FriBinaryProcessor.from_binary(data, *FriBinaryProcessor.get_expected_len(data))
+
+    def test02_codecs(self):
+        compressor = PacketCompressor(strong_codec=(CC_BZ2, 9), fast_codec=(CC_ZLIB, 1))
+        data = 'test data ' * 1000
+        compressed = compressor.compress(data)
+        self.assertEqual(ord(compressed[0]), (CC_BZ2 << 4) | 9)
+        self.assertEqual(compressor.decompress(compressed), data)
+
+        with self.assertRaises(CompressionException):
+            compressor.decompress(chr(15 << 4) + compressed[1:])
+        with self.assertRaises(CompressionException):
+            PacketCompressor(strong_codec=(15, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import os
+import time
+import hashlib
+import tempfile
+
+from fabnet.core.fri_base import RamBasedBinaryData, FabnetPacketRequest
+from fabnet.core.constants import RC_OK
+from fabnet.dht_mgmt.constants import RC_CHECKSUM_MISMATCH
+from fabnet.dht_mgmt.data_block import DataBlockHeader, VerifiedBinaryData, DataBlockChecksumMismatch
+from fabnet.dht_mgmt.fs_mapped_ranges import VerifiedChecksums
+from fabnet.dht_mgmt.operations.put_data_block import PutDataBlockOperation
+
+
+class CountedBinaryData(RamBasedBinaryData):
+    def __init__(self, data, chunk_size):
+        RamBasedBinaryData.__init__(self, data, chunk_size)
+        self.read_chunks = 0
+
+    def get_next_chunk(self):
+        chunk = RamBasedBinaryData.get_next_chunk(self)
+        if chunk is not None:
+            self.read_chunks += 1
+        return chunk
+
+
+class PutOperator:
+    def __init__(self, tmp_dir):
+        self.tmp_dir = tmp_dir
+        self.saved = []
+
+    def get_tempfile(self):
+        return os.path.join(self.tmp_dir, 'put.%s'%len(self.saved))
+
+    def put_data_block(self, key, tempfile_path, is_replica, carefully_save, checksum):
+        self.saved.append((key, open(tempfile_path, 'rb').read(), checksum))
+
+
+class TestDataBlock(unittest.TestCase):
+    def __read(self, binary_data):
+        while binary_data.get_next_chunk() is not None:
+            pass
+
+    def test01_verified_binary_data(self):
+        data = 'Hello, fabregas! '*1000
+        checksum = hashlib.sha1(data).hexdigest()
+        header = DataBlockHeader.pack('%040x'%100, 2, checksum)
+
+        verified = VerifiedBinaryData(RamBasedBinaryData(data, 1000), checksum)
+        self.assertEqual(verified.data(), data)
+        self.assertEqual(verified.checksum(), checksum)
+
+        #header is splitted between chunks
+        verified = VerifiedBinaryData(RamBasedBinaryData(header+data, 10), has_header=True)
+        self.__read(verified)
+        self.assertEqual(verified.checksum(), checksum)
+
+        verified = VerifiedBinaryData(RamBasedBinaryData(data[:-1]+'X', 1000), checksum)
+        with self.assertRaises(DataBlockChecksumMismatch):
+            self.__read(verified)
+
+        #mismatch is detected at first chunk
+        bad_header = DataBlockHeader.pack('%040x'%100, 2, hashlib.sha1('other').hexdigest())
+        verified = VerifiedBinaryData(RamBasedBinaryData(bad_header+data, 1000), checksum, has_header=True)
+        with self.assertRaises(DataBlockChecksumMismatch):
+            verified.get_next_chunk()
+
+        verified = VerifiedBinaryData(RamBasedBinaryData(header[:10], 1000), has_header=True)
+        with self.assertRaises(DataBlockChecksumMismatch):
+            self.__read(verified)
+
+    def test02_verified_checksums(self):
+        fd, path = tempfile.mkstemp('-fabnet-test')
+        os.write(fd, 'test data')
+        os.close(fd)
+        try:
+            checksums = VerifiedChecksums()
+            checksums.update(path, 'checksum')
+            self.assertEqual(checksums.get(path), 'checksum')
+
+            time.sleep(0.01)
+            open(path, 'ab').write('changed')
+            self.assertEqual(checksums.get(path), None)
+
+            checksums.update(path, 'checksum')
+            checksums.update(path, None)
+            self.assertEqual(checksums.get(path), None)
+
+            checksums = VerifiedChecksums(ttl=0.01)
+            checksums.update(path, 'checksum')
+            time.sleep(0.02)
+            self.assertEqual(checksums.get(path), None)
+        finally:
+            os.remove(path)
+
+    def test03_verified_checksums_lru(self):
+        paths = []
+        for i in xrange(3):
+            fd, path = tempfile.mkstemp('-fabnet-test')
+            os.close(fd)
+            paths.append(path)
+        try:
+            checksums = VerifiedChecksums(max_count=2)
+            checksums.update(paths[0], 'checksum0')
+            checksums.update(paths[1], 'checksum1')
+            self.assertEqual(checksums.get(paths[0]), 'checksum0')
+            #least recently used checksum is evicted only
+            checksums.update(paths[2], 'checksum2')
+            self.assertEqual(checksums.get(paths[1]), None)
+            self.assertEqual(checksums.get(paths[0]), 'checksum0')
+            self.assertEqual(checksums.get(paths[2]), 'checksum2')
+        finally:
+            for path in paths:
+                os.remove(path)
+
+
+    def test04_put_data_block(self):
+        data = 'Hello, fabregas! '*1000
+        checksum = hashlib.sha1(data).hexdigest()
+        header = DataBlockHeader.pack('%040x'%100, 2, checksum)
+        key = '%040x'%200
+        tmp_dir = tempfile.mkdtemp()
+        operator = PutOperator(tmp_dir)
+        operation = PutDataBlockOperation(operator, None, '127.0.0.1:1987', tmp_dir, None)
+        try:
+            packet = FabnetPacketRequest(method='PutDataBlock', sender='127.0.0.1:1986', \
+                    parameters={'key': key, 'checksum': checksum}, \
+                    binary_data=RamBasedBinaryData(header+data, 1000))
+            resp = operation.process(packet)
+            self.assertEqual(resp.ret_code, RC_OK, resp.ret_message)
+            self.assertEqual(operator.saved, [(key, header+data, checksum)])
+
+            #expected checksum is checked on header (data is not read)
+            bad_header = DataBlockHeader.pack('%040x'%100, 2, hashlib.sha1('other').hexdigest())
+            bin_data = CountedBinaryData(bad_header+data, 1000)
+            packet = FabnetPacketRequest(method='PutDataBlock', sender='127.0.0.1:1986', \
+                    parameters={'key': key, 'checksum': checksum}, binary_data=bin_data)
+            resp = operation.process(packet)
+            self.assertEqual(resp.ret_code, RC_CHECKSUM_MISMATCH)
+            self.assertEqual(bin_data.read_chunks, 1)
+            self.assertEqual(len(operator.saved), 1)
+        finally:
+            for f_name in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, f_name))
+            os.rmdir(tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
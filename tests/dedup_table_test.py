@@ -0,0 +1,83 @@
+import unittest
+import tempfile
+import shutil
+import multiprocessing as mp
+
+from fabnet.core.dedup_table import DedupTable, DEDUP_SET_WAYS
+from fabnet.core.fri_base import new_message_id
+from fabnet.core.operator.base_operator import Operator, OperException
+
+
+def insert_routine(table, message_ids, inserted):
+    cnt = 0
+    for message_id in message_ids:
+        if table.put_safe(message_id, 'NotifyOperation', '127.0.0.1:1987'):
+            cnt += 1
+    inserted.put(cnt)
+
+
+class TestDedupTable(unittest.TestCase):
+    def test01_put_get(self):
+        table = DedupTable(capacity=DEDUP_SET_WAYS*4, stripes=2)
+        message_id = new_message_id()
+        self.assertEqual(table.get(message_id), None)
+        self.assertTrue(table.put_safe(message_id, 'ManageNeighbour', '127.0.0.1:1986'))
+        self.assertFalse(table.put_safe(message_id, 'ManageNeighbour', None))
+        method, sender, timestamp = table.get(message_id)
+        self.assertEqual((method, sender), ('ManageNeighbour', '127.0.0.1:1986'))
+
+        long_id = 'x'*100
+        self.assertTrue(table.put_safe(long_id, 'NodeStatistic'))
+        self.assertEqual(table.get(long_id)[:2], ('NodeStatistic', None))
+        self.assertFalse(table.fits('NodeStatistic', 'h'*100))
+
+        #table has fixed capacity, the oldest ids are evicted
+        for i in xrange(100):
+            table.put_safe(new_message_id(), 'NotifyOperation')
+        self.assertEqual(table.get(message_id), None)
+        stat = table.get_stat()
+        self.assertEqual(stat['capacity'], DEDUP_SET_WAYS*4)
+        self.assertEqual(stat['inserted'], 102)
+        self.assertEqual(stat['duplicates'], 1)
+        self.assertEqual(stat['evicted'], 102 - DEDUP_SET_WAYS*4)
+
+    def test02_shared_by_processes(self):
+        table = DedupTable(capacity=4096, stripes=4)
+        message_ids = [new_message_id() for _ in xrange(1000)]
+        inserted = mp.Queue()
+        procs = [mp.Process(target=insert_routine, args=(table, message_ids, inserted)) \
+                    for _ in xrange(4)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+
+        #each message id is registered by one process only
+        self.assertEqual(sum(inserted.get() for _ in procs), len(message_ids))
+        self.assertEqual(table.get_stat()['duplicates'], 3*len(message_ids))
+
+    def test03_operator_messages(self):
+        home_dir = tempfile.mkdtemp()
+        Operator.dedup_table = DedupTable(capacity=4096, stripes=4)
+        operator = Operator('127.0.0.1:1987', home_dir, node_name='dedup-test')
+        try:
+            #request is registered by worker in dedup table only
+            message_id = new_message_id()
+            Operator.dedup_table.put_safe(message_id, 'NodeStatistic', '127.0.0.1:1986')
+            operator.update_message(message_id, '127.0.0.1:1988', {'key': 'value'})
+            self.assertEqual(operator.get_message_item(message_id, '127.0.0.1:1988'), {'key': 'value'})
+            self.assertEqual(operator.register_callback(message_id), ('NodeStatistic', '127.0.0.1:1986'))
+            operator.wait_response(message_id, 1)
+
+            unknown_id = new_message_id()
+            self.assertEqual(operator.get_message_item(unknown_id, '127.0.0.1:1988'), None)
+            self.assertRaises(OperException, operator.update_message, unknown_id, 'key', 'value')
+            self.assertRaises(OperException, operator.wait_response, unknown_id, 1)
+        finally:
+            Operator.dedup_table = None
+            operator.stop()
+            shutil.rmtree(home_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
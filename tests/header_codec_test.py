@@ -0,0 +1,111 @@
+import unittest
+import json
+import hashlib
+import uuid
+import pickle
+
+from fabnet.core.constants import FRI_PROTOCOL_IDENTIFIER, FRI_BIN_HEADER_IDENTIFIER
+from fabnet.core.header_codec import BinaryHeaderCodec, HeaderCodecException, get_header_codec, \
+                    LazyHeaderValue
+from fabnet.core.fri_base import FriBinaryProcessor, FabnetPacketRequest, FabnetPacketResponse, \
+                    FriException
+
+
+class TestHeaderCodec(unittest.TestCase):
+    def test01_binary_codec(self):
+        key = hashlib.sha1('test data').hexdigest()
+        header = {'message_id': str(uuid.uuid1()), 'method': 'PutDataBlock', 'sync': False,
+                'sender': '127.0.0.1:1986', 'parameters': {'key': key, 'checksum': hashlib.sha1('data').hexdigest(),
+                'is_replica': True, 'carefully_save': None, 'replica_count': 2, 'some_float': 1.5,
+                'long_list': range(300), 'big_int': long(key, 16), 'neg_big_int': -long(key, 16),
+                'long_str': 'x'*1000, 'unicode': u'\u0442\u0435\u0441\u0442', 'UPPER_HEX': key.upper(),
+                'int64': 2**40, 'neg_int': -70000}}
+        data = BinaryHeaderCodec.encode(header)
+        self.assertTrue(len(data) < len(json.dumps(header)))
+        self.assertEqual(BinaryHeaderCodec.decode(data), header)
+
+        self.assertEqual(BinaryHeaderCodec.decode(BinaryHeaderCodec.encode({1: (1, 2)})), {'1': [1, 2]})
+
+        with self.assertRaises(HeaderCodecException):
+            BinaryHeaderCodec.decode(data[:-1])
+        with self.assertRaises(HeaderCodecException):
+            BinaryHeaderCodec.decode(data + 'N')
+        with self.assertRaises(HeaderCodecException):
+            BinaryHeaderCodec.encode({'obj': object()})
+
+    def test02_fri_packets(self):
+        packet = FabnetPacketRequest(method='GetKeysInfo', sender='127.0.0.1:1987', \
+                parameters={'key': hashlib.sha1('key').hexdigest()}, binary_data='some binary data')
+        for protocol_id in (FRI_PROTOCOL_IDENTIFIER, FRI_BIN_HEADER_IDENTIFIER):
+            data = packet.dump(protocol_id=protocol_id)
+            self.assertEqual(data[:4], protocol_id)
+            p_len, h_len = FriBinaryProcessor.get_expected_len(data)
+            header, bin_data = FriBinaryProcessor.from_binary(data, p_len, h_len)
+            self.assertEqual(header, packet.to_dict())
+            self.assertEqual(bin_data, 'some binary data')
+
+        resp = FabnetPacketResponse(ret_code=1, ret_message='error', ret_parameters={'status': 'ok'})
+        data = resp.dump(protocol_id=FRI_BIN_HEADER_IDENTIFIER)
+        header, _ = FriBinaryProcessor.from_binary(data, *FriBinaryProcessor.get_expected_len(data))
+        self.assertEqual(header, resp.to_dict())
+
+        with self.assertRaises(FriException):
+            FriBinaryProcessor.get_expected_len('FRIX' + data[4:])
+        data = data[:20] + 'Z' + data[21:]
+        with self.assertRaises(FriException):
+            FriBinaryProcessor.from_binary(data, *FriBinaryProcessor.get_expected_len(data))
+
+    def test03_chunk_packets(self):
+        packet = FabnetPacketResponse(ret_parameters={'key': hashlib.sha1('key').hexdigest()}, \
+                                        binary_chunk_cnt=300)
+        for protocol_id in (FRI_PROTOCOL_IDENTIFIER, FRI_BIN_HEADER_IDENTIFIER):
+            codec = get_header_codec(protocol_id)
+            self.assertEqual(codec.decode(codec.append_item(codec.encode({}), 'a', 1)), {'a': 1})
+
+            packet.dump(with_bin=False, protocol_id=protocol_id)
+            for idx in (1, 2, 300):
+                packet.binary_chunk_idx = idx
+                data = ''.join(map(str, packet.dump_chunk(buffer('chunk data %s'%idx), protocol_id)))
+                header, bin_data = FriBinaryProcessor.from_binary(data, *FriBinaryProcessor.get_expected_len(data))
+                self.assertEqual(header, packet.to_dict())
+                self.assertEqual(bin_data, 'chunk data %s'%idx)
+
+        header = dict(('key%s'%i, i) for i in xrange(255))
+        data = BinaryHeaderCodec.append_item(BinaryHeaderCodec.encode(header), 'binary_chunk_idx', 10)
+        header['binary_chunk_idx'] = 10
+        self.assertEqual(BinaryHeaderCodec.decode(data), header)
+
+    def test04_lazy_parameters(self):
+        params = {'key': hashlib.sha1('key').hexdigest(), 'keys': range(300), 'long_str': 'x'*1000,
+                'nested': {'a': [None, True, 1.5, -2**40, long('f'*40, 16)], 'u': u'\u0442'}}
+        packet = FabnetPacketRequest(method='NotifyOperation', is_multicast=True, parameters=params)
+        data = packet.dump(protocol_id=FRI_BIN_HEADER_IDENTIFIER)
+        header, _ = FriBinaryProcessor.from_binary(data, *FriBinaryProcessor.get_expected_len(data))
+        self.assertEqual(type(header['parameters']), LazyHeaderValue)
+        self.assertEqual(header, packet.to_dict())
+
+        #transit packet is forwarded without parameters decoding
+        recv_packet = FabnetPacketRequest(**header)
+        lazy_params = pickle.loads(pickle.dumps(recv_packet.encoded_parameters()))
+        fwd_packet = FabnetPacketRequest(message_id=recv_packet.message_id, method=recv_packet.method, \
+                                            parameters=lazy_params)
+        for protocol_id in (FRI_PROTOCOL_IDENTIFIER, FRI_BIN_HEADER_IDENTIFIER):
+            data = fwd_packet.dump(protocol_id=protocol_id)
+            header, _ = FriBinaryProcessor.from_binary(data, *FriBinaryProcessor.get_expected_len(data))
+            self.assertEqual(FabnetPacketRequest(**header).parameters, packet.parameters)
+
+        self.assertEqual(recv_packet.parameters, packet.parameters)
+        self.assertEqual(type(recv_packet.encoded_parameters()), dict)
+
+        resp = FabnetPacketResponse(ret_parameters={'status': 'ok'})
+        resp = pickle.loads(pickle.dumps(resp))
+        self.assertEqual(resp.ret_parameters, {'status': 'ok'})
+        with self.assertRaises(AttributeError):
+            resp.unknown_attr = 1
+
+        with self.assertRaises(HeaderCodecException):
+            LazyHeaderValue(BinaryHeaderCodec.encode({'keys': range(300)})[:-1]).value()
+
+
+if __name__ == '__main__':
+    unittest.main()
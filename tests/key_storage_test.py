@@ -36,6 +36,8 @@ class TestKeyStorage(unittest.TestCase):
 
         context = ks.get_node_context()
         self.assertNotEqual(context, None)
+        #context is built once (session tickets are valid for all workers)
+        self.assertTrue(ks.get_node_context() is context)
 
 
 if __name__ == '__main__':
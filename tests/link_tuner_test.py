@@ -0,0 +1,89 @@
+import unittest
+import os
+import socket
+import tempfile
+import threading
+
+from fabnet.core.constants import BUF_SIZE, DEFAULT_CHUNK_SIZE, FRI_LINK_MAX_SOCK_BUF, \
+                    FRI_LINK_MAX_READ_SIZE, FRI_LINK_MAX_CHUNK_SIZE
+from fabnet.core.fri_base import FabnetPacketResponse, FileBasedChunks
+from fabnet.core.socket_processor import SocketProcessor
+from fabnet.core.link_tuner import LinkTuner, LinkParams
+
+MB = 1024*1024
+
+
+class TestLinkTuner(unittest.TestCase):
+    def test01_link_params(self):
+        tuner = LinkTuner(max_peers=2)
+        #LAN link: 100MB/s, 0.2ms RTT
+        tuner.add_sample('10.0.0.1', 100, 0.0002)
+        tuner.add_sample('10.0.0.1', 10*MB, 0.1)
+        self.assertEqual(tuner.get_params('10.0.0.1'), None)
+
+        #WAN link: 40MB/s, 40ms RTT (BDP is 1.6MB)
+        tuner.add_sample('10.1.0.1', 100, 0.05)
+        tuner.add_sample('10.1.0.1', 100, 0.04)
+        self.assertEqual(tuner.get_params('10.1.0.1'), None)
+        tuner.add_sample('10.1.0.1', 40*MB, 1.0)
+        params = tuner.get_params('10.1.0.1')
+        self.assertEqual(params, LinkParams(4*MB, FRI_LINK_MAX_READ_SIZE, 2*MB))
+
+        #params object is not changed by samples with the same result
+        tuner.add_sample('10.1.0.1', 100, 0.041)
+        self.assertTrue(tuner.get_params('10.1.0.1') is params)
+
+        #long fat link: sizes are limited
+        tuner.add_sample('10.2.0.1', 100, 0.2)
+        tuner.add_sample('10.2.0.1', 100*MB, 1.0)
+        self.assertEqual(tuner.get_params('10.2.0.1'), \
+                LinkParams(FRI_LINK_MAX_SOCK_BUF, FRI_LINK_MAX_READ_SIZE, FRI_LINK_MAX_CHUNK_SIZE))
+
+        #least recently measured peer is forgotten
+        self.assertEqual(tuner.get_params('10.0.0.1'), None)
+        self.assertNotEqual(tuner.get_params('10.1.0.1'), None)
+
+    def test02_apply_params(self):
+        sock, peer = socket.socketpair()
+        sender = SocketProcessor(sock)
+        receiver = SocketProcessor(peer)
+        params = LinkParams(4*MB, 4*BUF_SIZE, 2*DEFAULT_CHUNK_SIZE)
+        sender.set_link_params(params)
+        receiver.set_link_params(params)
+        self.assertTrue(sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 4*MB)
+        self.assertTrue(peer.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 4*MB)
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        data = ''.join(chr(i%256) for i in xrange(5*DEFAULT_CHUNK_SIZE+7))
+        open(path, 'wb').write(data)
+        bin_data = FileBasedChunks(path)
+        self.assertEqual(bin_data.size(), len(data))
+        bin_data.set_chunk_size(params.chunk_size)
+        self.assertEqual(bin_data.chunks_count(), 3)
+
+        received = []
+        def recv_routine():
+            packet = receiver.recv_packet()
+            received.append(packet.binary_data.data())
+            packet.close()
+            receiver.send_packet(FabnetPacketResponse(ret_message='received'))
+
+        thread = threading.Thread(target=recv_routine)
+        thread.start()
+        try:
+            packet = FabnetPacketResponse(binary_data=bin_data)
+            resp = sender.send_packet(packet, wait_response=True)
+            self.assertEqual(resp.ret_message, 'received')
+            #chunks sending time is measured for throughput sample
+            self.assertTrue(packet.transfer_time > 0)
+        finally:
+            thread.join()
+            sender.close_socket(force=True)
+            receiver.close_socket(force=True)
+            os.remove(path)
+        self.assertEqual(received, [data])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import time
+import socket
+import threading
+
+from fabnet.core.constants import RC_OK, FRI_KEEP_ALIVE_CHECK_PERIOD
+from fabnet.core.fri_base import FabnetPacketRequest, FabnetPacketResponse, RamBasedBinaryData
+from fabnet.core.socket_processor import SocketProcessor
+from fabnet.core.inflight_budget import InFlightBudget
+from fabnet.core.multiplexed_socket import MultiplexedSocket, MultiplexedConnection, \
+                                            MultiplexedConnectionHandler
+
+
+class TestMultiplexedSocket(unittest.TestCase):
+    def setUp(self):
+        sock, peer = socket.socketpair()
+        self.sender = MultiplexedSocket(SocketProcessor(sock))
+        receiver_proc = SocketProcessor(peer)
+        receiver_proc.chunks_window = 4
+        self.budget = receiver_proc.inflight_budget = InFlightBudget()
+        self.receiver = MultiplexedSocket(receiver_proc)
+        self.received = []
+        self.threads = [self.__start(self.__read_routine, self.sender, []),
+                        self.__start(self.__read_routine, self.receiver, self.received)]
+
+    def tearDown(self):
+        self.sender.close_socket(force=True)
+        self.receiver.close_socket(force=True)
+        for thread in self.threads:
+            thread.join()
+
+    def __start(self, routine, *args):
+        thread = threading.Thread(target=routine, args=args)
+        thread.start()
+        return thread
+
+    def __read_routine(self, mux_socket, packets):
+        while True:
+            try:
+                packet, is_new = mux_socket.read_frame()
+            except Exception, err:
+                break
+            if is_new:
+                packets.append(packet)
+
+    def __send(self, message_id, data):
+        packet = FabnetPacketRequest(method='PutData', message_id=message_id, \
+                                        binary_data=RamBasedBinaryData(data, 1000))
+        return self.__start(self.sender.send_packet, packet)
+
+    def __wait_packet(self):
+        for i in xrange(100):
+            if self.received:
+                return self.received.pop(0)
+            time.sleep(.01)
+        raise Exception('packet is not received')
+
+    def test01_stream_credits(self):
+        data = ''.join(chr(i%256) for i in xrange(20*1000+7))
+        send_thread = self.__send('message-1', data)
+        packet = self.__wait_packet()
+
+        #chunks are not sent before consumer grants credits
+        time.sleep(.2)
+        self.assertTrue(send_thread.is_alive())
+        self.assertEqual(self.budget.get_stat()['held_bytes'], 0)
+
+        chunks = [packet.binary_data.get_next_chunk()]
+        time.sleep(.2)
+        self.assertTrue(send_thread.is_alive())
+        self.assertTrue(self.budget.get_stat()['held_bytes'] <= 4*1000)
+
+        while True:
+            chunk = packet.binary_data.get_next_chunk()
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        send_thread.join()
+        self.assertEqual(''.join(chunks), data)
+        packet.binary_data.close()
+        self.assertEqual(self.budget.get_stat()['held_bytes'], 0)
+
+    def test02_dropped_stream(self):
+        send_thread = self.__send('message-1', 'x'*20500)
+        packet = self.__wait_packet()
+        #sender is not blocked by stream closed without consuming
+        packet.binary_data.close()
+        send_thread.join()
+        self.assertEqual(self.budget.get_stat()['inflight_bytes'], 0)
+
+        send_thread = self.__send('message-2', 'y'*5500)
+        packet = self.__wait_packet()
+        self.assertEqual(packet.message_id, 'message-2')
+        self.assertEqual(packet.binary_data.data(), 'y'*5500)
+        send_thread.join()
+
+
+class StubWorker:
+    """Worker with non-empty accept queue"""
+    def __init__(self):
+        self.free_workers = True
+
+    def getName(self):
+        return 'stub-worker'
+
+    def set_busy(self, is_busy):
+        pass
+
+    def has_pending_work(self):
+        return True
+
+    def has_free_workers(self):
+        return self.free_workers
+
+    def process(self, packet_processor):
+        packet_processor.recv_packet()
+        packet_processor.send_packet(FabnetPacketResponse(ret_code=RC_OK))
+
+
+class TestMultiplexedConnectionHandler(unittest.TestCase):
+    def test01_idle_connection_release(self):
+        sock, peer = socket.socketpair()
+        worker = StubWorker()
+        handler = MultiplexedConnectionHandler(SocketProcessor(peer), worker)
+        serve_thread = threading.Thread(target=handler.serve)
+        serve_thread.start()
+        client = MultiplexedConnection(SocketProcessor(sock))
+        try:
+            #connection is not released while pending work can be got by free worker
+            time.sleep(FRI_KEEP_ALIVE_CHECK_PERIOD*2.5)
+            self.assertTrue(serve_thread.is_alive())
+            resp = client.call(FabnetPacketRequest(method='HelloFabregas'), 5)
+            self.assertEqual(resp.ret_code, RC_OK, resp.ret_message)
+
+            #no free worker for pending work
+            worker.free_workers = False
+            serve_thread.join(FRI_KEEP_ALIVE_CHECK_PERIOD*3)
+            self.assertFalse(serve_thread.is_alive())
+        finally:
+            client.close_socket(force=True)
+            handler.close_socket(force=True)
+            serve_thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+"""
+Accept rate benchmark of FRI server modes:
+    handoff   - connections are accepted by FriConnectionHandler thread and
+                passed to process based workers through the queue
+    reuseport - each process based worker accepts connections
+                on own SO_REUSEPORT listening socket
+    eventloop - first packet is received by FriEventLoopHandler front end
+                and connection is passed to workers through the queue
+Each client process opens a new connection for every request
+(no keep-alive), so the accept path dominates the measured time.
+
+usage: python tests/perf/accept_rate_perf.py [workers count] [clients count] [requests per client]
+"""
+import sys
+import time
+import socket
+import logging
+from multiprocessing import Process, Queue
+
+from fabnet.core.constants import RC_OK
+from fabnet.core.fri_base import FabnetPacketRequest, FabnetPacketResponse
+from fabnet.core.fri_server import FriServer, REUSEPORT_SUPPORTED
+from fabnet.core.fri_event_loop import EPOLL_SUPPORTED
+from fabnet.core.socket_processor import SocketProcessor
+from fabnet.core.workers_manager import WorkersManager
+from fabnet.core.workers import ProcessBasedFriWorker
+from fabnet.utils.logger import core_logger
+
+HOST = '127.0.0.1'
+PORT = 6699
+
+
+class EchoFriWorker(ProcessBasedFriWorker):
+    def process(self, socket_processor):
+        packet = socket_processor.recv_packet()
+        socket_processor.send_packet(FabnetPacketResponse(message_id=packet.message_id))
+        return False
+
+
+def client_routine(requests_cnt, results):
+    errors = 0
+    packet = FabnetPacketRequest(method='Echo', sync=True)
+    t0 = time.time()
+    for i in xrange(requests_cnt):
+        sock_proc = None
+        try:
+            sock_proc = SocketProcessor(socket.create_connection((HOST, PORT)))
+            resp = sock_proc.send_packet(packet, wait_response=True)
+            if resp.ret_code != RC_OK:
+                errors += 1
+        except Exception, err:
+            errors += 1
+        finally:
+            if sock_proc:
+                sock_proc.close_socket(force=True)
+    results.put((time.time() - t0, errors))
+
+
+def run_mode(mode, workers_cnt, clients_cnt, requests_cnt):
+    workers_mgr = WorkersManager(EchoFriWorker, min_count=workers_cnt, max_count=workers_cnt, \
+                                    server_name='perf', init_params=(None,))
+    fri_server = FriServer(HOST, PORT, workers_mgr, 'perf', event_loop=(mode == 'eventloop'), \
+                                    reuse_port=(mode == 'reuseport'))
+    if not fri_server.start():
+        print '%-10s server does not started'%mode
+        return
+
+    try:
+        time.sleep(1)
+        results = Queue()
+        clients = [Process(target=client_routine, args=(requests_cnt, results)) \
+                    for i in xrange(clients_cnt)]
+        t0 = time.time()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        dt = time.time() - t0
+
+        errors = sum([results.get()[1] for client in clients])
+    finally:
+        fri_server.stop()
+
+    total = clients_cnt * requests_cnt
+    print '%-10s %10s %8s %10.2f %12.1f'%(mode, total, errors, dt, (total - errors) / dt)
+
+
+if __name__ == '__main__':
+    core_logger.setLevel(logging.CRITICAL)
+    workers_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    clients_cnt = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    requests_cnt = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+
+    modes = ['handoff']
+    if REUSEPORT_SUPPORTED:
+        modes.append('reuseport')
+    if EPOLL_SUPPORTED:
+        modes.append('eventloop')
+
+    print 'workers=%s clients=%s'%(workers_cnt, clients_cnt)
+    print '%-10s %10s %8s %10s %12s'%('mode', 'requests', 'errors', 'time(s)', 'conn/s')
+    for mode in modes:
+        run_mode(mode, workers_cnt, clients_cnt, requests_cnt)
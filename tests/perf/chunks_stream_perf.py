@@ -0,0 +1,105 @@
+#!/usr/bin/python
+"""
+Throughput benchmark of chunked binary transfer over loopback
+with artificial latency (lock-step vs windowed chunks streaming)
+
+usage: python tests/perf/chunks_stream_perf.py [RTT in ms] [data size in MB]
+"""
+import sys
+import time
+import socket
+import threading
+import Queue
+
+from fabnet.core.constants import DEFAULT_CHUNK_SIZE
+from fabnet.core.fri_base import FabnetPacketResponse, RamBasedBinaryData
+from fabnet.core.socket_processor import SocketProcessor
+
+
+class DelayedPipe(threading.Thread):
+    """Forward data from one socket to another with delay"""
+    def __init__(self, src, dst, delay):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.src = src
+        self.dst = dst
+        self.delay = delay
+        self.queue = Queue.Queue()
+
+        sender = threading.Thread(target=self.send_routine)
+        sender.setDaemon(True)
+        sender.start()
+
+    def run(self):
+        while True:
+            data = self.src.recv(256*1024)
+            self.queue.put((time.time() + self.delay, data))
+            if not data:
+                break
+
+    def send_routine(self):
+        while True:
+            send_time, data = self.queue.get()
+            wait_time = send_time - time.time()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            if not data:
+                self.dst.shutdown(socket.SHUT_WR)
+                break
+            self.dst.sendall(data)
+
+
+def delayed_socketpair(rtt):
+    sock1, proxy1 = socket.socketpair()
+    proxy2, sock2 = socket.socketpair()
+    DelayedPipe(proxy1, proxy2, rtt/2.).start()
+    DelayedPipe(proxy2, proxy1, rtt/2.).start()
+    return sock1, sock2
+
+def transfer(data, rtt, window):
+    sock, peer = delayed_socketpair(rtt)
+    sender = SocketProcessor(sock)
+    sender.chunks_window = window
+    receiver = SocketProcessor(peer)
+    receiver.chunks_window = window
+
+    def recv_routine():
+        packet = receiver.recv_packet()
+        size = 0
+        while True:
+            chunk = packet.binary_data.get_next_chunk()
+            if chunk is None:
+                break
+            size += len(chunk)
+        receiver.send_packet(FabnetPacketResponse(ret_parameters={'size': size}))
+
+    thread = threading.Thread(target=recv_routine)
+    thread.start()
+
+    t0 = time.time()
+    packet = FabnetPacketResponse(binary_data=RamBasedBinaryData(data, DEFAULT_CHUNK_SIZE))
+    resp = sender.send_packet(packet, wait_response=True)
+    dt = time.time() - t0
+
+    thread.join()
+    sender.close_socket(force=True)
+    receiver.close_socket(force=True)
+    if resp.ret_parameters['size'] != len(data):
+        raise Exception('Invalid received data size: %s'%resp.ret_parameters['size'])
+    return dt
+
+
+if __name__ == '__main__':
+    rtt = 20
+    size = 32
+    if len(sys.argv) > 1:
+        rtt = float(sys.argv[1])
+    if len(sys.argv) > 2:
+        size = int(sys.argv[2])
+
+    data = '0'*size*1024*1024
+    print 'RTT=%sms, data size=%sMB, chunk size=%s'%(rtt, size, DEFAULT_CHUNK_SIZE)
+    for window in (1, 2, 4, 8, 16):
+        dt = transfer(data, rtt/1000., window)
+        mode = 'lock-step' if window == 1 else 'window=%s'%window
+        print '%-12s %8.3f sec %10.2f MB/s'%(mode, dt, size/dt)
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+"""
+Benchmark of FRI packet header codecs (JSON vs compact binary)
+Encode/decode time and bytes on the wire are measured for typical DHT packets
+
+usage: python tests/perf/header_codec_perf.py [iterations count]
+"""
+import sys
+import time
+import uuid
+import pickle
+import hashlib
+import random
+
+from fabnet.core.constants import FRI_PROTOCOL_IDENTIFIER, FRI_BIN_HEADER_IDENTIFIER
+from fabnet.core.fri_base import FriBinaryProcessor, FabnetPacketRequest, FabnetPacketResponse
+
+def rand_key():
+    return hashlib.sha1(str(random.random())).hexdigest()
+
+def typical_packets():
+    packets = []
+    packets.append(('PutDataBlock request', FabnetPacketRequest(method='PutDataBlock', \
+            sender='192.168.0.12:1987', sync=True, parameters={'key': rand_key(), \
+            'checksum': rand_key(), 'is_replica': False, 'carefully_save': True, \
+            'primary_key': rand_key(), 'replica_count': 2, 'user_id': rand_key()})))
+
+    packets.append(('PutDataBlock response', FabnetPacketResponse(message_id=str(uuid.uuid1()), \
+            ret_code=0, ret_message='ok', from_node='192.168.0.12:1987')))
+
+    ranges = [(long(rand_key(), 16), long(rand_key(), 16), '192.168.0.%s:1987'%i) for i in xrange(16)]
+    packets.append(('GetRangesTable response', FabnetPacketResponse(message_id=str(uuid.uuid1()), \
+            ret_parameters={'ranges_table': pickle.dumps(ranges), 'mod_index': 42})))
+
+    packets.append(('TopologyCognition response', FabnetPacketResponse(message_id=str(uuid.uuid1()), \
+            ret_parameters={'node_address': '192.168.0.12:1987', 'node_name': 'node12', 'node_type': 'DHT', \
+            'upper_neighbours': ['192.168.0.%s:1987'%i for i in xrange(4)], \
+            'superior_neighbours': ['192.168.0.%s:1987'%i for i in xrange(4, 8)]})))
+
+    packets.append(('NodeStatistic response', FabnetPacketResponse(message_id=str(uuid.uuid1()), \
+            ret_parameters={'BaseInfo': {'node_name': 'node12', 'home_dir': '/home/fabnet', \
+                'node_type': 'DHT', 'version': '0.9.1'}, \
+            'SystemInfo': {'loadavg_5': 0.12, 'loadavg_10': 0.1, 'loadavg_15': 0.08, \
+                'uptime': 123456, 'memory': 12003400}, \
+            'FriServerProcStat': {'workers': 10, 'busy': 2, 'threads': 24}, \
+            'OperationsProcTime': dict([(m, {'avg': random.random(), 'max': random.random(), 'count': 1000}) \
+                for m in ('PutDataBlock', 'GetDataBlock', 'ClientPutData', 'ClientGetData', 'GetRangesTable')])})))
+    return packets
+
+def measure(packet, protocol_id, iters):
+    header = packet.to_dict()
+    t0 = time.time()
+    for i in xrange(iters):
+        data = FriBinaryProcessor.to_binary(header, '', protocol_id)
+    enc_t = time.time() - t0
+
+    p_len, h_len = FriBinaryProcessor.get_expected_len(data)
+    t0 = time.time()
+    for i in xrange(iters):
+        FriBinaryProcessor.from_binary(data, p_len, h_len)
+    dec_t = time.time() - t0
+    return len(data), enc_t*1000000/iters, dec_t*1000000/iters
+
+def run(iters):
+    print '%-28s %-6s %8s %10s %10s'%('packet', 'codec', 'bytes', 'enc(us)', 'dec(us)')
+    for name, packet in typical_packets():
+        for codec, protocol_id in (('json', FRI_PROTOCOL_IDENTIFIER), ('binary', FRI_BIN_HEADER_IDENTIFIER)):
+            size, enc_t, dec_t = measure(packet, protocol_id, iters)
+            print '%-28s %-6s %8s %10.2f %10.2f'%(name, codec, size, enc_t, dec_t)
+
+
+if __name__ == '__main__':
+    iters = 10000
+    if len(sys.argv) > 1:
+        iters = int(sys.argv[1])
+    run(iters)
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+"""
+Benchmark of RPC calls to operator process:
+    connect  - new connection for each call (previous OperatorClient behaviour)
+    channel  - persistent pipelined channel of process (OperatorClient)
+Calls are made from one thread and from many threads at once
+(calls of all threads are pipelined over one channel).
+
+usage: python tests/perf/operator_rpc_perf.py [calls count] [threads count]
+"""
+import sys
+import time
+import logging
+import threading
+from multiprocessing.connection import Client
+
+from fabnet.core.constants import OPERATOR_SOCKET_ADDRESS
+from fabnet.core.operator.operator_process import OperatorProcess, OperatorClient, REQUEST_ID_STRUCT
+from fabnet.core.operator.rpc_codec import encode_request, decode_response
+from fabnet.utils.logger import oper_logger, core_logger
+
+SERVER_NAME = 'rpc_perf'
+
+
+class EchoOperator:
+    def __init__(self, self_address, home_dir, keystore, is_init_node, server_name, config={}):
+        pass
+
+    def register_request(self, message_id, method, sender):
+        return None
+
+    def set_operator_api_workers_manager(self, wm):
+        pass
+
+    def stop(self):
+        pass
+
+
+def connect_call(method, args):
+    conn = Client(OPERATOR_SOCKET_ADDRESS%SERVER_NAME)
+    try:
+        conn.send_bytes(REQUEST_ID_STRUCT.pack(0) + encode_request(method, args))
+        return decode_response(conn.recv_bytes(), REQUEST_ID_STRUCT.size)
+    finally:
+        conn.close()
+
+
+def channel_call(method, args):
+    return getattr(OperatorClient(SERVER_NAME), method)(*args)
+
+
+def run_mode(call_routine, calls_cnt, threads_cnt):
+    def thread_routine():
+        for i in xrange(calls_cnt / threads_cnt):
+            call_routine('register_request', ('d8e8fca2-dc0f-896f-d8e8-fca2dc0f896f', 'NotifyOperation', None))
+
+    threads = [threading.Thread(target=thread_routine) for _ in xrange(threads_cnt)]
+    t0 = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    dt = time.time() - t0
+    calls = calls_cnt / threads_cnt * threads_cnt
+    return calls / dt, dt * 1000000 / calls
+
+
+if __name__ == '__main__':
+    oper_logger.setLevel(logging.CRITICAL)
+    core_logger.setLevel(logging.CRITICAL)
+    calls_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads_cnt = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    proc = OperatorProcess(EchoOperator, None, None, None, None, server_name=SERVER_NAME)
+    proc.start_carefully()
+    try:
+        print 'calls=%s'%calls_cnt
+        print '%-8s %8s %10s %12s'%('mode', 'threads', 'calls/s', 'latency(us)')
+        for threads in (1, threads_cnt):
+            for mode, routine in (('connect', connect_call), ('channel', channel_call)):
+                rate, latency = run_mode(routine, calls_cnt, threads)
+                print '%-8s %8s %10.1f %12.1f'%(mode, threads, rate, latency)
+    finally:
+        proc.stop()
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+"""
+Benchmark of FRI packet objects:
+    receive - binary header decoding and packet object creation
+              for transit multicast packet (message_id/method are used only),
+              eager header decoding vs lazy parameters decoding
+    forward - receive and dump of transit packet (parameters are not touched)
+    ids     - message id generation (uuid1 string vs MessageIdGenerator)
+    memory  - objects count and bytes allocated for received packet object
+              (packet, its attributes and parameters)
+
+usage: python tests/perf/packet_objects_perf.py [packets count] [parameters items count]
+"""
+import sys
+import time
+import uuid
+import hashlib
+
+from fabnet.core.constants import FRI_BIN_HEADER_IDENTIFIER
+from fabnet.core.fri_base import FabnetPacket, FabnetPacketRequest, FriBinaryProcessor, new_message_id
+from fabnet.core.header_codec import BinaryHeaderCodec
+
+
+def make_raw_packet(items_cnt):
+    params = {'event_type': 1, 'event_topic': 'NodeUp', 'event_provider': '127.0.0.1:1987'}
+    for i in xrange(items_cnt):
+        params['key%s'%i] = hashlib.sha1(str(i)).hexdigest()
+    packet = FabnetPacketRequest(method='NotifyOperation', sender='127.0.0.1:1986', \
+                                    is_multicast=True, parameters=params)
+    return packet.dump(protocol_id=FRI_BIN_HEADER_IDENTIFIER)
+
+
+def recv_packet(raw, lazy):
+    p_len, h_len = FriBinaryProcessor.get_expected_len(raw)
+    header = raw[20:20+h_len]
+    return FabnetPacket.create(BinaryHeaderCodec.decode(header, lazy=lazy))
+
+
+def run_receive(raw, packets_cnt, lazy):
+    t0 = time.time()
+    for i in xrange(packets_cnt):
+        packet = recv_packet(raw, lazy)
+        packet.message_id, packet.method
+    return (time.time() - t0) * 1000000 / packets_cnt
+
+
+def run_forward(raw, packets_cnt, lazy):
+    t0 = time.time()
+    for i in xrange(packets_cnt):
+        packet = recv_packet(raw, lazy)
+        fwd = FabnetPacketRequest(message_id=packet.message_id, method=packet.method, \
+                    is_multicast=True, parameters=packet.encoded_parameters())
+        fwd.dump(protocol_id=FRI_BIN_HEADER_IDENTIFIER)
+    return (time.time() - t0) * 1000000 / packets_cnt
+
+
+def run_ids(packets_cnt, gen):
+    t0 = time.time()
+    for i in xrange(packets_cnt):
+        gen()
+    return (time.time() - t0) * 1000000 / packets_cnt
+
+
+def deep_size(obj, seen):
+    """Return (objects count, bytes) of object and objects referred by it
+    (shared objects - interned strings, small ints, None - are not counted)"""
+    if id(obj) in seen or obj is None or type(obj) in (bool, int) \
+            or (type(obj) is str and len(obj) < 2):
+        return 0, 0
+    seen.add(id(obj))
+    cnt, size = 1, sys.getsizeof(obj)
+    if type(obj) is dict:
+        items = obj.keys() + obj.values()
+    elif type(obj) in (list, tuple):
+        items = obj
+    elif hasattr(obj, '__slots__') or hasattr(obj, '__dict__'):
+        items = []
+        for cls in type(obj).__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if slot.startswith('__'):
+                    slot = '_%s%s'%(cls.__name__, slot)
+                items.append(getattr(obj, slot, None))
+        if hasattr(obj, '__dict__'):
+            items.append(obj.__dict__)
+    else:
+        items = []
+    for item in items:
+        i_cnt, i_size = deep_size(item, seen)
+        cnt += i_cnt
+        size += i_size
+    return cnt, size
+
+
+def run_memory(raw, lazy):
+    #some header strings are shared by all packets (interned),
+    #so objects of first packet are "seen" while second packet counting
+    seen = set()
+    packets = [recv_packet(raw, lazy), recv_packet(raw, lazy)]
+    deep_size(packets[0], seen)
+    return deep_size(packets[1], seen)
+
+
+if __name__ == '__main__':
+    packets_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    items_cnt = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    raw = make_raw_packet(items_cnt)
+
+    print 'packets=%s parameters=%s items packet size=%s bytes'%(packets_cnt, items_cnt + 3, len(raw))
+    print '%-8s %14s %14s %14s %14s'%('decode', 'receive(us)', 'forward(us)', 'objects/pkt', 'bytes/pkt')
+    for lazy in (False, True):
+        objects_cnt, size = run_memory(raw, lazy)
+        print '%-8s %14.2f %14.2f %14s %14s'%('lazy' if lazy else 'eager', run_receive(raw, packets_cnt, lazy), \
+                        run_forward(raw, packets_cnt, lazy), objects_cnt, size)
+
+    print
+    print '%-12s %10s'%('message id', 'time(us)')
+    print '%-12s %10.2f'%('uuid1', run_ids(packets_cnt, lambda: str(uuid.uuid1())))
+    print '%-12s %10.2f'%('generator', run_ids(packets_cnt, new_message_id))
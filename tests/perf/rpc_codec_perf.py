@@ -0,0 +1,100 @@
+#!/usr/bin/python
+"""
+Microbenchmark of operator RPC marshalling for the most frequent operator methods:
+    pickle  - previous marshalling (pickle protocol 0 of request/response dicts)
+    cpickle - cPickle (highest protocol) of the same request/response dicts
+    codec   - RPC codec (see fabnet.core.operator.rpc_codec)
+Time is the total time of request and response encoding and decoding.
+
+usage: python tests/perf/rpc_codec_perf.py [iterations count]
+"""
+import sys
+import time
+import pickle
+import cPickle
+from datetime import datetime
+
+from fabnet.core.fri_base import BinaryDataPointer
+from fabnet.core.operator.rpc_codec import encode_request, decode_request, \
+                        encode_response, decode_response
+from fabnet.dht_mgmt.hash_ranges_table import HashRangesTable
+
+MESSAGE_ID = 'd8e8fca2-dc0f-896f-d8e8-fca2dc0f896f'
+NODE = '192.168.0.12:1987'
+KEY = 'a2c4e6f8a2c4e6f8a2c4e6f8a2c4e6f8a2c4e6f8'
+
+ranges_table = HashRangesTable()
+for i in xrange(16):
+    ranges_table.append(i * 2**156, (i+1) * 2**156 - 1, '192.168.0.%s:1987'%i)
+
+#(method, args, return value)
+CALLS = [
+    ('register_request', (MESSAGE_ID, 'NotifyOperation', NODE), 0),
+    ('register_callback', (MESSAGE_ID,), ('ClientPutData', NODE)),
+    ('call_to_neighbours', (MESSAGE_ID, 'NotifyOperation', {'event_type': 'info', \
+            'event_topic': 'NodeUp', 'event_message': 'Hello', 'event_provider': NODE}, True), None),
+    ('response_to_sender', (NODE, MESSAGE_ID, 0, 'ok', {'key': KEY, 'checksum': KEY}, \
+            BinaryDataPointer('/dev/shm/4c1a6f-serialized_binary', True)), None),
+    ('async_remote_call', (NODE, 'PutDataBlock', {'key': KEY, 'is_replica': True, \
+            'replica_count': 2, 'carefully_save': True}, False), MESSAGE_ID),
+    ('get_session', ('4c1a6f40-5e3b-11e2-bcfd-0800200c9a66',), 'client'),
+    ('put_session', ('4c1a6f40-5e3b-11e2-bcfd-0800200c9a66', 'client'), None),
+    ('update_message', (MESSAGE_ID, NODE, {'key': KEY}), None),
+    ('get_message_item', (MESSAGE_ID, NODE), {'key': KEY}),
+    ('get_neighbours', (1,), ['192.168.0.%s:1987'%i for i in xrange(4)]),
+    ('get_self_address', (), NODE),
+    ('get_home_dir', (), '/opt/fabnet/node_home'),
+    ('get_node_name', (), 'node-01'),
+    ('get_status', (), 'normwork'),
+    ('get_type', (), 'DHT'),
+    ('update_statistic', ('OperationsProcTime', 'OperationsProcessor', \
+            {'PutDataBlock': {'avg': 0.0123, 'max': 0.5, 'min': 0.001, 'call_cnt': 1000}}), None),
+    ('find_range', (KEY,), (0x2c4e6f8a2c4e6f8a2c4e6f8a2c4e6f8a2c4e6f8aL, 0xa2c4e6f8a2c4e6f8a2c4e6f8a2c4e6f8a2c4e6f8L, NODE)),
+    ('get_ranges_table_status', (), (123, 16)),
+    ('dump_ranges_table', (), ranges_table.dump()),
+    ('get_tempfile', (), '/opt/fabnet/node_home/dht_range/tmp/tmpAf3x1Q'),
+    ('get_statistic', (), {'SystemInfo': {'uptime': '1 day, 2:03:04', 'loadavg_5': '0.10'}, \
+            'BaseInfo': {'node_name': 'node-01', 'home_dir': '/opt/fabnet', 'node_types': ['DHT']}, \
+            'DHTInfo': {'status': 'normwork', 'free_size': 10**10, 'free_size_percents': 83.2}, \
+            'started': datetime.now()}),
+]
+
+
+def pickle_call(method, args, ret):
+    request = pickle.loads(pickle.dumps({'method': method, 'args': args}))
+    return pickle.loads(pickle.dumps({'rcode': 0, 'resp': ret}))['resp']
+
+def cpickle_call(method, args, ret):
+    request = cPickle.loads(cPickle.dumps({'method': method, 'args': args}, cPickle.HIGHEST_PROTOCOL))
+    return cPickle.loads(cPickle.dumps({'rcode': 0, 'resp': ret}, cPickle.HIGHEST_PROTOCOL))['resp']
+
+def codec_call(method, args, ret):
+    method, args = decode_request(encode_request(method, args))
+    return decode_response(encode_response(ret))
+
+def measure(routine, method, args, ret, iterations):
+    t0 = time.time()
+    for i in xrange(iterations):
+        routine(method, args, ret)
+    return (time.time() - t0) * 1000000 / iterations
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print '%-24s %10s %11s %10s %8s %10s %9s'%('method', 'pickle(us)', 'cpickle(us)', 'codec(us)', \
+                                            'speedup', 'pickle(B)', 'codec(B)')
+    total_pickle = total_cpickle = total_codec = 0
+    for method, args, ret in CALLS:
+        p_time = measure(pickle_call, method, args, ret, iterations)
+        cp_time = measure(cpickle_call, method, args, ret, iterations)
+        c_time = measure(codec_call, method, args, ret, iterations)
+        total_pickle += p_time
+        total_cpickle += cp_time
+        total_codec += c_time
+        p_size = len(pickle.dumps({'method': method, 'args': args})) + \
+                    len(pickle.dumps({'rcode': 0, 'resp': ret}))
+        c_size = len(encode_request(method, args)) + len(encode_response(ret))
+        print '%-24s %10.1f %11.1f %10.1f %8.1f %10s %9s'%(method, p_time, cp_time, c_time, \
+                                            p_time / c_time, p_size, c_size)
+    print '%-24s %10.1f %11.1f %10.1f %8.1f'%('TOTAL', total_pickle, total_cpickle, total_codec, \
+                                            total_pickle / total_codec)
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+"""
+Benchmark of FRI calls to the node on the same host:
+    tcp  - calls over TCP loopback connection
+    unix - calls over unix socket of FRI server (FriClient detects local node)
+Each mode is measured with a new connection per call (connect/accept
+path) and with pooled keep-alive connection (packets exchange path).
+Client CPU time and context switches per call show syscalls savings.
+
+usage: python tests/perf/unix_socket_perf.py [calls count] [binary data size]
+"""
+import sys
+import time
+import os
+import resource
+import logging
+import tempfile
+import shutil
+
+from fabnet.core.constants import RC_OK
+from fabnet.core.fri_base import FabnetPacketRequest, FabnetPacketResponse
+from fabnet.core.fri_server import FriServer, UNIX_SOCKET_SUPPORTED, set_unix_socket_dir
+from fabnet.core.fri_client import FriClient
+from fabnet.core.connections_pool import ConnectionsPool
+from fabnet.core.workers_manager import WorkersManager
+from fabnet.core.workers import ProcessBasedFriWorker
+from fabnet.utils.logger import core_logger
+
+HOST = '127.0.0.1'
+PORT = 6698
+
+
+class EchoFriWorker(ProcessBasedFriWorker):
+    def process(self, socket_processor):
+        packet = socket_processor.recv_packet()
+        if packet.binary_data:
+            packet.binary_data.data()
+        resp = FabnetPacketResponse(message_id=packet.message_id, keep_alive=packet.keep_alive)
+        socket_processor.accept_protocol_rev(packet, resp)
+        socket_processor.send_packet(resp)
+        return resp.keep_alive
+
+
+def run_mode(mode, keep_alive, calls_cnt, data_size):
+    pool = ConnectionsPool(max_idle_per_node=(1 if keep_alive else 0))
+    fri_client = FriClient(conn_pool=pool, use_unix_socket=(mode == 'unix'))
+    data = 'x' * data_size
+
+    usage0 = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.time()
+    errors = 0
+    for i in xrange(calls_cnt):
+        packet = FabnetPacketRequest(method='Echo', binary_data=data)
+        resp = fri_client.call_sync('%s:%s'%(HOST, PORT), packet)
+        if resp.ret_code != RC_OK:
+            errors += 1
+    dt = time.time() - t0
+    usage1 = resource.getrusage(resource.RUSAGE_SELF)
+    pool.clear()
+
+    cpu = (usage1.ru_utime - usage0.ru_utime) + (usage1.ru_stime - usage0.ru_stime)
+    ctx_sw = (usage1.ru_nvcsw - usage0.ru_nvcsw) + (usage1.ru_nivcsw - usage0.ru_nivcsw)
+    print '%-6s %-10s %8s %10.1f %12.1f %14.1f %12.1f'%(mode, 'keep-alive' if keep_alive else 'new-conn', \
+                errors, calls_cnt / dt, dt * 1000000 / calls_cnt, cpu * 1000000 / calls_cnt, \
+                float(ctx_sw) / calls_cnt)
+
+
+if __name__ == '__main__':
+    core_logger.setLevel(logging.CRITICAL)
+    calls_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    data_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+
+    if not UNIX_SOCKET_SUPPORTED:
+        print 'unix sockets are not supported on this platform'
+        sys.exit(1)
+
+    socket_dir = tempfile.mkdtemp()
+    set_unix_socket_dir(socket_dir)
+    workers_mgr = WorkersManager(EchoFriWorker, min_count=2, max_count=2, \
+                                    server_name='perf', init_params=(None,))
+    fri_server = FriServer(HOST, PORT, workers_mgr, 'perf', unix_socket=True)
+    if not fri_server.start():
+        print 'server does not started'
+        sys.exit(1)
+
+    try:
+        time.sleep(1)
+        print 'calls=%s binary data=%s bytes'%(calls_cnt, data_size)
+        print '%-6s %-10s %8s %10s %12s %14s %12s'%('mode', 'conn', 'errors', 'calls/s', \
+                                'latency(us)', 'client cpu(us)', 'ctx sw/call')
+        for keep_alive in (False, True):
+            for mode in ('tcp', 'unix'):
+                run_mode(mode, keep_alive, calls_cnt, data_size)
+    finally:
+        fri_server.stop()
+        shutil.rmtree(socket_dir)
@@ -0,0 +1,66 @@
+import unittest
+from datetime import datetime
+
+from fabnet.core.fri_base import BinaryDataPointer
+from fabnet.core.operator.rpc_codec import encode_request, decode_request, encode_response, \
+                    encode_error, decode_response, RPC_METHODS, RPC_METHOD_IDS, RPC_RESERVED
+from fabnet.dht_mgmt.dht_operator import DHTOperator
+
+KEY = 2**160 - 1
+
+
+class UnpicklableError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+class TestRPCCodec(unittest.TestCase):
+    def test01_request(self):
+        args = ('d8e8fca2-dc0f-896f-d8e8-fca2dc0f896f', 'NotifyOperation', None)
+        data = encode_request('register_request', args)
+        #registered method is encoded by one byte
+        self.assertEqual(data[0], chr(RPC_METHODS.index('register_request')))
+        self.assertEqual(decode_request(data), ('register_request', args))
+
+        args = ([1, 2L], {'key': 'a'*40, u'name': u'\u0436'}, 1.5, True, -2**70)
+        data = 'prefix' + encode_request('unknown_method', args)
+        method, d_args = decode_request(data, 6)
+        self.assertEqual(method, 'unknown_method')
+        self.assertEqual(d_args, args)
+        self.assertEqual([type(arg) for arg in d_args], [type(arg) for arg in args])
+        self.assertEqual(type(d_args[1][u'name']), unicode)
+
+    def test02_response(self):
+        values = [None, 0, (0L, KEY, '127.0.0.1:1987'), (3, 2), 'x'*1000, 'ABCDEF0123456789',
+                    {'DHTInfo': {'status': 'normwork', 'range_start': '%040x'%KEY}},
+                    datetime.now(), BinaryDataPointer('/tmp/file', remove_on_close=True),
+                    range(300)]
+        for value in values:
+            d_value = decode_response('\x00'*8 + encode_response(value), 8)
+            self.assertEqual(type(d_value), type(value))
+            if isinstance(value, BinaryDataPointer):
+                self.assertEqual(d_value.file_path, value.file_path)
+            else:
+                self.assertEqual(d_value, value)
+
+        self.assertRaises(KeyError, decode_response, encode_error(KeyError('key')))
+        try:
+            decode_response(encode_error(UnpicklableError(1, 'some error')))
+        except Exception, err:
+            self.assertEqual(str(err), 'UnpicklableError: some error')
+        else:
+            raise Exception('exception expected')
+
+    def test03_methods_table(self):
+        for name in RPC_METHODS:
+            if name.startswith(RPC_RESERVED):
+                #reserved id of removed method is not encoded
+                self.assertFalse(name in RPC_METHOD_IDS)
+                continue
+            self.assertTrue(callable(getattr(DHTOperator, name, None)), \
+                        'RPC method "%s" is not found in operator'%name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import time
+
+from fabnet.core.operator import OperatorProcess, OperatorClient
+from fabnet.core.operator.rpc_profiler import RPCProfiler
+
+
+class ProfiledOperator:
+    def __init__(self, self_address, home_dir, keystore, is_init_node, server_name, config={}):
+        self.__rpc_profiler = None
+
+    def set_rpc_profiler(self, rpc_profiler):
+        self.__rpc_profiler = rpc_profiler
+
+    def set_operator_api_workers_manager(self, wm):
+        pass
+
+    def enable_profiling(self, enabled):
+        self.__rpc_profiler.set_enabled(enabled)
+
+    def get_rpc_stat(self):
+        return self.__rpc_profiler.get_stat()
+
+    def echo(self, message):
+        return message
+
+    def fail(self):
+        raise Exception('test error')
+
+    def stop(self):
+        pass
+
+
+class TestRPCProfiler(unittest.TestCase):
+    def test01_stat(self):
+        profiler = RPCProfiler()
+        profiler.update('find_range', 0.0002, 0.00005, 50, 80)
+        profiler.update('find_range', 0.0004, 0.002, 50, 120, is_error=True)
+        profiler.update('get_statistic', 0, 2, 10, 1000)
+        stat = profiler.get_stat()
+        self.assertEqual(stat['calls'], 3)
+        f_stat = stat['methods']['find_range']
+        self.assertEqual((f_stat['calls'], f_stat['errors']), (2, 1))
+        self.assertEqual(f_stat['max_wait_ms'], 0.4)
+        self.assertEqual(f_stat['avg_resp_size'], 100)
+        self.assertEqual(f_stat['latency'], {'<0.1ms': 1, '<5ms': 1})
+        self.assertEqual(stat['methods']['get_statistic']['latency'], {'>=1000ms': 1})
+
+        profiler.reset()
+        self.assertEqual(profiler.get_stat()['methods'], {})
+
+    def test02_operator_calls(self):
+        proc = OperatorProcess(ProfiledOperator, None, None, None, None, server_name='test_profiler')
+        proc.start_carefully()
+        try:
+            cl = OperatorClient('test_profiler')
+            cl.echo('not profiled')
+            cl.enable_profiling(True)
+            for i in xrange(10):
+                cl.echo('x'*100)
+            self.assertRaises(Exception, cl.fail)
+
+            stat = cl.get_rpc_stat()
+            self.assertTrue(stat['enabled'])
+            self.assertEqual(stat['methods']['echo']['calls'], 10)
+            self.assertTrue(stat['methods']['echo']['avg_req_size'] > 100)
+            self.assertTrue(stat['methods']['echo']['avg_wait_ms'] >= 0)
+            self.assertEqual(stat['methods']['fail']['errors'], 1)
+
+            cl.enable_profiling(False)
+            cl.echo('not profiled')
+            self.assertEqual(cl.get_rpc_stat()['methods']['echo']['calls'], 10)
+        finally:
+            proc.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
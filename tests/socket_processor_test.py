@@ -0,0 +1,213 @@
+import unittest
+import os
+import socket
+import tempfile
+import threading
+
+from fabnet.core.constants import FRI_PROTOCOL_IDENTIFIER, FRI_BIN_HEADER_IDENTIFIER, BUF_SIZE, \
+                    FRI_PROTOCOL_REV_BIN_HEADER, FRI_PROTOCOL_REV_COMPRESSION, FRI_SPOOL_MAX_RAM_SIZE
+from fabnet.core.fri_base import FabnetPacketRequest, FabnetPacketResponse, FriConnectionClosed, \
+                    FriException, RamBasedBinaryData, FileBasedChunks, SpooledBinaryData
+from fabnet.core.socket_processor import SocketProcessor
+from fabnet.core.inflight_budget import InFlightBudget
+
+
+class TestSocketProcessor(unittest.TestCase):
+    def test01_read_packets(self):
+        sock, peer = socket.socketpair()
+        proc = SocketProcessor(peer)
+        data = ''.join(chr(i%256) for i in xrange(3*BUF_SIZE+17))
+        sizes = [0, 10, BUF_SIZE-200, BUF_SIZE, 2*BUF_SIZE, len(data), 5]
+        packets = [FabnetPacketRequest(method='Method%s'%i, binary_data=data[:size]) \
+                    for i, size in enumerate(sizes)]
+
+        def send_routine():
+            for i, packet in enumerate(packets):
+                protocol_id = FRI_BIN_HEADER_IDENTIFIER if i%2 else FRI_PROTOCOL_IDENTIFIER
+                sock.sendall(packet.dump(protocol_id=protocol_id))
+            sock.close()
+
+        thread = threading.Thread(target=send_routine)
+        thread.start()
+        try:
+            for packet, size in zip(packets, sizes):
+                recv_packet = proc.recv_packet()
+                self.assertEqual(recv_packet.method, packet.method)
+                if size:
+                    self.assertEqual(recv_packet.binary_data.data(), data[:size])
+                else:
+                    self.assertEqual(recv_packet.binary_data, None)
+
+            with self.assertRaises(FriConnectionClosed):
+                proc.recv_packet()
+        finally:
+            thread.join()
+            proc.close_socket(force=True)
+
+    def test02_truncated_packet(self):
+        sock, peer = socket.socketpair()
+        proc = SocketProcessor(peer)
+        data = FabnetPacketRequest(method='Test', binary_data='x'*(2*BUF_SIZE)).dump()
+        sock.sendall(data[:BUF_SIZE+10])
+        sock.close()
+        with self.assertRaises(FriException):
+            proc.recv_packet()
+        self.assertFalse(proc.is_alive())
+        proc.close_socket(force=True)
+
+    def __transfer_chunks(self, sender_window, receiver_window, data_path=None, protocol_rev=0, \
+                            budget=None, keep_packets=None):
+        sock, peer = socket.socketpair()
+        sender = SocketProcessor(sock)
+        sender.chunks_window = sender_window
+        sender.protocol_rev = protocol_rev
+        receiver = SocketProcessor(peer)
+        receiver.chunks_window = receiver_window
+        receiver.inflight_budget = budget
+        data = ''.join(chr(i%256) for i in xrange(20*1000+7))
+        if data_path:
+            open(data_path, 'wb').write(data)
+        received = []
+
+        def recv_routine():
+            packet = receiver.recv_packet()
+            received.append(packet.binary_data.data())
+            if keep_packets is None:
+                packet.close()
+            else:
+                keep_packets.append(packet)
+            receiver.send_packet(FabnetPacketResponse(ret_message='received'))
+
+        thread = threading.Thread(target=recv_routine)
+        thread.start()
+        try:
+            if data_path:
+                binary_data = FileBasedChunks(data_path, chunk_size=1000)
+            else:
+                binary_data = RamBasedBinaryData(data, 1000)
+            packet = FabnetPacketResponse(binary_data=binary_data)
+            resp = sender.send_packet(packet, wait_response=True)
+            self.assertEqual(resp.ret_message, 'received')
+        finally:
+            thread.join()
+            sender.close_socket(force=True)
+            receiver.close_socket(force=True)
+        self.assertEqual(received, [data])
+
+    def test03_chunks_window(self):
+        self.__transfer_chunks(8, 8)
+        self.__transfer_chunks(4, 50)
+        self.__transfer_chunks(1, 8)
+        self.__transfer_chunks(8, 1)
+        self.__transfer_chunks(8, 8, protocol_rev=FRI_PROTOCOL_REV_BIN_HEADER)
+        self.__transfer_chunks(1, 1, protocol_rev=FRI_PROTOCOL_REV_COMPRESSION)
+
+    def test04_file_based_chunks(self):
+        fd, data_path = tempfile.mkstemp('-fabnet-test')
+        os.close(fd)
+        try:
+            self.__transfer_chunks(8, 8, data_path)
+            self.__transfer_chunks(1, 1, data_path)
+
+            sock, peer = socket.socketpair()
+            proc = SocketProcessor(peer)
+            SocketProcessor(sock).send_packet(FabnetPacketRequest(method='Test', \
+                    binary_data=FileBasedChunks(data_path, chunk_size=100000)))
+            packet = proc.recv_packet()
+            self.assertEqual(packet.binary_data.data(), open(data_path, 'rb').read())
+        finally:
+            os.remove(data_path)
+
+    def test05_spooled_packet(self):
+        spool_dir = tempfile.mkdtemp('-fabnet-spool')
+        SpooledBinaryData.set_spool_dir(spool_dir)
+        sock, peer = socket.socketpair()
+        proc = SocketProcessor(peer)
+        data = ''.join(chr(i%256) for i in xrange(FRI_SPOOL_MAX_RAM_SIZE+BUF_SIZE+3))
+
+        def send_routine():
+            sock.sendall(FabnetPacketRequest(method='Test', binary_data=data).dump())
+            sock.sendall(FabnetPacketRequest(method='Test', binary_data='small').dump())
+
+        thread = threading.Thread(target=send_routine)
+        thread.start()
+        try:
+            packet = proc.recv_packet()
+            self.assertTrue(isinstance(packet.binary_data, SpooledBinaryData))
+            self.assertTrue(packet.binary_data.is_spilled())
+            self.assertEqual(len(os.listdir(spool_dir)), 1)
+            self.assertEqual(packet.binary_data.data(), data)
+            packet.binary_data.close()
+            self.assertEqual(os.listdir(spool_dir), [])
+
+            packet = proc.recv_packet()
+            self.assertEqual(packet.binary_data.data(), 'small')
+        finally:
+            thread.join()
+            proc.close_socket(force=True)
+            SpooledBinaryData.set_spool_dir(None)
+            os.rmdir(spool_dir)
+
+    def test06_spool_ram_limit(self):
+        bin_data = SpooledBinaryData(chunk_size=1000, max_ram_size=10000)
+        bin_data.write('x'*6000)
+        self.assertFalse(bin_data.is_spilled())
+        self.assertEqual(SpooledBinaryData.ram_usage(), 6000)
+        bin_data.write(buffer('y'*6000))
+        self.assertTrue(bin_data.is_spilled())
+        self.assertEqual(SpooledBinaryData.ram_usage(), 0)
+        self.assertEqual(bin_data.chunks_count(), 12)
+        chunks = []
+        while True:
+            chunk = bin_data.get_next_chunk()
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        self.assertEqual(''.join(chunks), 'x'*6000 + 'y'*6000)
+        bin_data.close()
+
+        #process limit of in-memory data
+        import fabnet.core.fri_base as fri_base
+        limit = fri_base.FRI_SPOOL_PROCESS_RAM_LIMIT
+        fri_base.FRI_SPOOL_PROCESS_RAM_LIMIT = 5000
+        try:
+            data1 = SpooledBinaryData()
+            data1.write('a'*4000)
+            data2 = SpooledBinaryData()
+            data2.write('b'*4000)
+            self.assertFalse(data1.is_spilled())
+            self.assertTrue(data2.is_spilled())
+            self.assertEqual(str(data1.get_next_chunk_view()), 'a'*4000)
+            self.assertEqual(data2.data(), 'b'*4000)
+            data1.close()
+            data2.close()
+            self.assertEqual(SpooledBinaryData.ram_usage(), 0)
+        finally:
+            fri_base.FRI_SPOOL_PROCESS_RAM_LIMIT = limit
+
+    def test07_inflight_budget(self):
+        budget = InFlightBudget(inflight_limit=3000, held_limit=30000, wait_timeout=0.5)
+        self.__transfer_chunks(8, 8, budget=budget)
+        self.__transfer_chunks(1, 1, budget=budget)
+        stat = budget.get_stat()
+        self.assertEqual(stat['inflight_bytes'], 0)
+        self.assertEqual(stat['held_bytes'], 0)
+        self.assertEqual(stat['timed_out_grants'], 0)
+
+        #received data is held until packet is closed,
+        #so next stream is started after budget wait timeout
+        packets = []
+        self.__transfer_chunks(8, 8, budget=budget, keep_packets=packets)
+        self.assertEqual(budget.get_stat()['held_bytes'], 20*1000+7)
+        self.__transfer_chunks(8, 8, budget=budget, keep_packets=packets)
+        stat = budget.get_stat()
+        self.assertEqual(stat['delayed_grants'], 1)
+        self.assertEqual(stat['timed_out_grants'], 1)
+        self.assertEqual(stat['held_bytes'], 2*(20*1000+7))
+        for packet in packets:
+            packet.close()
+        self.assertEqual(budget.get_stat()['held_bytes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
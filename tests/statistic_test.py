@@ -0,0 +1,24 @@
+import unittest
+
+from fabnet.core.statistic import Statistic, StatMap
+
+
+class TestStatistic(unittest.TestCase):
+    def test01_counters(self):
+        stat = Statistic()
+        for owner in ('worker01', 'worker02'):
+            stat_map = StatMap()
+            for i in xrange(3):
+                stat_map.increment('handshakes')
+                stat_map.update('handshake_ms', 10 + i)
+            stat_map.increment('resumed_handshakes', 2)
+            stat.update('SSLHandshakeStat', owner, stat_map.dump())
+
+        stat = stat.dump()['SSLHandshakeStat']
+        self.assertEqual(stat['handshakes'], 6)
+        self.assertEqual(stat['resumed_handshakes'], 4)
+        self.assertEqual(stat['handshake_ms'], 11)
+
+
+if __name__ == '__main__':
+    unittest.main()